@@ -1,158 +1,178 @@
-import requests
-from bs4 import BeautifulSoup
-from time import sleep
-import json
-
-
-def load_json(json_file_path):
-    """
-    Import data from a JSON file.
-    """
-    with open(json_file_path, "r", encoding='utf-8') as json_file:
-        return json.load(json_file)
-
-
-def write_json(json_file_path, data):
-    """
-    Write data to a JSON file.
-    """
-    with open(json_file_path, "w", encoding="utf-8") as json_file:
-        json.dump(data, json_file, ensure_ascii=False, indent=2)
-
-
-def construct_url(params):
-    """
-    Construct the URL for a given set of query parameters.
-    """
-    query_string = "&".join([f"{key}={params[key]}" for key in params if key != 'base'])
-    return f"{params['base']}?{query_string}"
-
-
-def crawl_acm_digital_library():
-    """
-    Scrape data from ACM Digital Library.
-    """
-    # Setting the request headers to mimic a browser request.
-    headers = {
-        "User-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/105.0.0.0 Safari/537.36 "
-    }
-
-    # Initializing variables to store statistics.
-    total_queries = 0
-    total_results = 0
-    total_pdf_links = 0
-    queries_data = []
-
-    # Load queries from the specified JSON file.
-    try:
-        queries = load_json("acm_queries.json")
-    except Exception as e:
-        print(f"Error loading queries: {e}")
-        return
-
-    # Loop through each query to fetch and process data.
-    for query in queries:
-        total_results_query = 0
-        total_pdf_links_query = 0
-        max_items = query["max_items"]
-        current_page = query["params"]["startPage"]
-
-        # Create data structure to store results for each query.
-        query_data = {
-            "query_metadata": query,
-            "query_link_statistics": {},
-            "query_results": [],
-        }
-
-        # Set up parameters for the ACM query URL.
-        params = query["params"].copy()
-
-        # Fetch and parse data until the maximum items limit is reached.
-        while total_results_query < max_items:
-            url = construct_url(params)
-
-            # Make an HTTP request to Google Scholar using the python library requests.
-            response = requests.get(url, headers=headers)
-            soup = BeautifulSoup(response.text, "lxml")
-
-            # Check if the end of search results is reached.
-            no_result_element = soup.select_one(".search-result__no-result")
-            if no_result_element and "Your search did not return any results." in no_result_element.text:
-                print("No more results for this query.")
-                break
-
-            # Extract relevant data from each search result.
-            for result in soup.select(".issue-item__content-right"):
-                if total_results_query >= max_items:
-                    break
-
-                title_element = result.select_one(".issue-item__title a")
-                title = title_element.text if title_element else "No Title"
-                title_link = f"https://dl.acm.org{title_element['href']}" if title_element else None
-
-                publication_info_element = result.select_one(".issue-item__detail")
-                publication_info = publication_info_element.text if publication_info_element else "No Publication Info"
-
-                pdf_link_element = result.select_one("a[aria-label='PDF']")
-                full_pdf_link = f"https://dl.acm.org{pdf_link_element['href']}" if pdf_link_element and 'href' in pdf_link_element.attrs else None
-
-                authors = []
-                for author in result.select("ul.rlist--inline li a[title]"):
-                    if "/profile/" in author.get('href', ''):
-                        authors.append(author.get('title'))
-
-                if full_pdf_link:
-                    total_pdf_links += 1
-                    total_pdf_links_query += 1
-
-                total_results += 1
-                total_results_query += 1
-
-                # Store extracted data.
-                result_data = {
-                    "title": title,
-                    "title_link": title_link,
-                    "publication_info": publication_info,
-                    "authors": authors,
-                    "doc_link": full_pdf_link
-                }
-
-                query_data["query_results"].append(result_data)
-                print(f"Document recorded: {result_data['title']}")
-
-            # Break out of the loop if maximum item limit is hit.
-            if total_results_query >= max_items:
-                break
-
-            current_page += 1
-            params["startPage"] = current_page
-            # Wait inbetween requests to reduce the load on the server.
-            sleep(1)
-
-        # Store statistics for the current query.
-        query_data["query_link_statistics"] = {
-            'total_results_query': total_results_query,
-            'total_pdf_links_query': total_pdf_links_query,
-        }
-        queries_data.append(query_data)
-        total_queries += 1
-
-    # Save  collected data to a JSON file.
-    try:
-        json_file_path = "acm_search_results.json"
-        queries_results = {
-            "total_queries": total_queries,
-            "total_results": total_results,
-            "total_pdf_links": total_pdf_links,
-            "queries_data": queries_data
-        }
-
-        write_json(json_file_path, queries_results)
-        print(f"The query results have been saved to {json_file_path}.")
-    except Exception as e:
-        print(f"Error saving query results: {e}")
-
-
-if __name__ == "__main__":
-    crawl_acm_digital_library()
+import argparse
+import os
+import sys
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from acm_scraper import scrape_acm_stream
+from corpus_index import configure as configure_index
+from crawler_engine import crawl, rebuild
+from http_archive import ARCHIVE_FILE, RECORD, REPLAY
+from http_client import SOURCE_HEADERS, configure
+from metrics import enable, start_metrics_server, write_metrics
+
+# Requests per second sent to ACM Digital Library at first and at most.
+REQUEST_RATE = 1
+MAX_REQUEST_RATE = 4
+
+# Number of queries that may be crawled from ACM Digital Library at the same time.
+MAX_PARALLEL_QUERIES = 4
+
+
+def construct_url(params):
+    """
+    Construct the URL for a given set of query parameters.
+    """
+    query_string = "&".join([f"{key}={params[key]}" for key in params if key != 'base'])
+    return f"{params['base']}?{query_string}"
+
+
+def parse_html(html, current_page):
+    """
+    Parse the HTML content of an ACM Digital Library results page and extract the relevant data of each result.
+    A page that reports that the search did not return any results has no results.
+    """
+    soup = BeautifulSoup(html, "lxml")
+
+    # Check if the end of search results is reached.
+    no_result_element = soup.select_one(".search-result__no-result")
+    if no_result_element and "Your search did not return any results." in no_result_element.text:
+        return []
+
+    # Extract relevant data from each search result.
+    results = []
+    for result in soup.select(".issue-item__content-right"):
+        title_element = result.select_one(".issue-item__title a")
+        title = title_element.text if title_element else "No Title"
+        title_link = f"https://dl.acm.org{title_element['href']}" if title_element else None
+
+        publication_info_element = result.select_one(".issue-item__detail")
+        publication_info = publication_info_element.text if publication_info_element else "No Publication Info"
+
+        pdf_link_element = result.select_one("a[aria-label='PDF']")
+        full_pdf_link = f"https://dl.acm.org{pdf_link_element['href']}" if pdf_link_element and 'href' in pdf_link_element.attrs else None
+
+        authors = []
+        for author in result.select("ul.rlist--inline li a[title]"):
+            if "/profile/" in author.get('href', ''):
+                authors.append(author.get('title'))
+
+        # Store extracted data.
+        results.append({
+            "title": title,
+            "title_link": title_link,
+            "publication_info": publication_info,
+            "authors": authors,
+            "doc_link": full_pdf_link
+        })
+
+    return results
+
+
+def page_request(query, current_page):
+    """
+    Return the URL of a results page of a query. The query itself is left unchanged.
+    """
+    params = query["params"].copy()
+    params["startPage"] = current_page
+    return construct_url(params), None
+
+
+# Adapter of ACM Digital Library for the crawler engine.
+ACM_ADAPTER = {
+    "name": "acm",
+    "journal_file": "acm_search_results.ndjson",
+    "results_file": "acm_search_results.json",
+    "encoding": "utf-8",
+    "indent": 2,
+    "ensure_ascii": False,
+    "headers": SOURCE_HEADERS["acm"],
+    "request_rate": REQUEST_RATE,
+    "max_request_rate": MAX_REQUEST_RATE,
+    "max_parallel_queries": MAX_PARALLEL_QUERIES,
+    "first_page": lambda query: query["params"]["startPage"],
+    "page_step": 1,
+    "page_request": page_request,
+    "parse_page": parse_html,
+    "has_pdf_link": lambda result: bool(result["doc_link"]),
+    "scrape_stream": scrape_acm_stream,
+}
+
+
+def crawl_acm_digital_library(resume=False, download=False, max_concurrency=1, max_per_host=4,
+                              parallel_queries=1):
+    """
+    Scrape data from ACM Digital Library.
+    Every completed page is appended to a journal. With resume, the queries continue from the last
+    completed page recorded in the journal instead of starting over.
+    With download, the PDFs of the results are downloaded from the journal while the crawling continues,
+    with the same outcome as running acm_scraper.py afterwards.
+    With parallel_queries, that many queries are crawled at the same time, up to MAX_PARALLEL_QUERIES.
+    """
+    crawl(ACM_ADAPTER, "acm_queries.json", resume=resume, download=download, max_concurrency=max_concurrency,
+          max_per_host=max_per_host, parallel_queries=parallel_queries)
+
+
+def rebuild_acm_results():
+    """
+    Rebuild the results JSON file from the crawl journal without sending any requests.
+    """
+    rebuild(ACM_ADAPTER, "acm_queries.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record search results from ACM Digital Library.")
+    parser.add_argument("--resume", action="store_true", help="continue from the last completed page of each query")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the results file from the crawl journal without crawling")
+    parser.add_argument("--download", action="store_true",
+                        help="download the PDFs while crawling instead of running acm_scraper.py afterwards")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of simultaneous downloads")
+    parser.add_argument("--per-host", type=int, default=4, help="maximum number of simultaneous downloads per host")
+    parser.add_argument("--parallel-queries", type=int, default=1,
+                        help=f"number of queries crawled at the same time (at most {MAX_PARALLEL_QUERIES})")
+    parser.add_argument("--no-index", action="store_true", help="do not record the results in the corpus index")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="fetch everything in full instead of revalidating the HTTP cache")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument("--record", nargs="?", const=ARCHIVE_FILE, metavar="FILE",
+                               help="record every response to an HTTP archive (default: http_archive.db)")
+    archive_group.add_argument("--replay", nargs="?", const=ARCHIVE_FILE, metavar="FILE",
+                               help="serve the responses from an HTTP archive without sending requests or "
+                                    "waiting between them (default: http_archive.db)")
+    args = parser.parse_args()
+    if args.replay and args.download:
+        parser.error("--download cannot be combined with --replay, since PDFs are not recorded")
+
+    # Bypass the HTTP cache and the corpus index if requested.
+    if args.no_cache:
+        configure(use_cache=False)
+    if args.no_index:
+        configure_index(use_index=False)
+
+    # Record the responses to an HTTP archive or replay them from it if requested.
+    if args.record:
+        configure(archive_mode=RECORD, archive_file=args.record)
+    if args.replay:
+        if not os.path.exists(args.replay):
+            parser.error(f"no HTTP archive at {args.replay}")
+        configure(archive_mode=REPLAY, archive_file=args.replay)
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    if args.rebuild:
+        rebuild_acm_results()
+    else:
+        crawl_acm_digital_library(resume=args.resume, download=args.download, max_concurrency=args.concurrency,
+                                  max_per_host=args.per_host, parallel_queries=args.parallel_queries)
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
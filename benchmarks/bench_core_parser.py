@@ -0,0 +1,101 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import random
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+from core_crawler import parse_html
+
+
+def parse_html_soup(html, current_page):
+    """
+    Parse a CORE search results page with BeautifulSoup and html.parser, the way core_crawler.py used to.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    results = []
+    for article in soup.find_all('div', {'class': 'styles_search-results__2AZDM'}):
+        title = article.find('h3', {'class': 'styles-title-1k6Ib'}).get_text(strip=True)
+        authors = [author.get_text(strip=True) for author in article.find_all('span', {'itemprop': 'name'})]
+        publication_date = article.find('dd', {'itemprop': 'datePublished'}).get_text(strip=True)
+        pdf_link_tag = article.find('figure', {'class': 'styles-thumbnail-1xurx'}).find('a', href=True)
+        pdf_link = pdf_link_tag['href'] if pdf_link_tag else "No PDF link found"
+        results.append({
+            'title': title,
+            'authors': authors,
+            'publication_date': publication_date,
+            'pdf_link': pdf_link,
+            'page': current_page
+        })
+    return results
+
+
+def synthetic_page(seed, results_count=10):
+    """
+    Build a search results page with the markup of CORE, surrounded by navigation, scripts and styles.
+    """
+    generator = random.Random(seed)
+    navigation = "".join(f'<li class="nav-item"><a href="/page/{i}">Link {i}</a></li>' for i in range(200))
+    script = "<script>window.__DATA__ = {" + ",".join(f'"k{i}": {i}' for i in range(3000)) + "};</script>"
+    style = "<style>" + "".join(f".c{i} {{ margin: {i}px; }}" for i in range(1000)) + "</style>"
+
+    articles = []
+    for i in range(results_count):
+        authors = "".join(f'<li><span itemprop="name">Author {generator.randrange(10000)}</span></li>'
+                          for _ in range(generator.randint(1, 8)))
+        figure = (f'<a href="https://core.ac.uk/download/{generator.randrange(10 ** 8)}.pdf"><img src="/t.png"></a>'
+                  if generator.random() < 0.7 else '<img src="/placeholder.png">')
+        articles.append(
+            f'<div class="styles_search-results__2AZDM styles-card-3xKb0"><div class="styles-body-2Vr4P">'
+            f'<h3 class="styles-title-1k6Ib"><a href="/works/{seed}{i}">Paper {seed} {i} on '
+            f'<em>topic</em> &amp; method</a></h3><ul class="styles-authors">{authors}</ul>'
+            f'<dl><dt>Published</dt><dd itemprop="datePublished">{generator.randint(1990, 2023)}</dd></dl>'
+            f'<p class="styles-abstract">{"Abstract text. " * 60}</p></div>'
+            f'<figure class="styles-thumbnail-1xurx">{figure}</figure></div>'
+        )
+    return (f"<!DOCTYPE html><html><head><title>CORE</title>{style}{script}</head><body>"
+            f"<nav><ul>{navigation}</ul></nav><main>{''.join(articles)}</main><footer>{navigation}</footer>"
+            f"</body></html>")
+
+
+def time_parser(parse, pages, repeat):
+    """
+    Parse every page repeat times and return the average time per page in milliseconds and the last results.
+    """
+    results = None
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            results = [parse(html, page) for page, html in enumerate(pages)]
+    return (time.perf_counter() - start) * 1000 / (repeat * len(pages)), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parse_html of the CORE crawler against the previous "
+                                                 "BeautifulSoup implementation.")
+    parser.add_argument("--pages-directory", help="directory of saved CORE result pages (*.html) to parse "
+                                                  "instead of synthetic pages")
+    parser.add_argument("--pages", type=int, default=20, help="number of synthetic pages")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times each page is parsed")
+    args = parser.parse_args()
+
+    if args.pages_directory:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages_directory, "*.html"))):
+            with open(path, "r", encoding="utf-8") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page(seed) for seed in range(args.pages)]
+    print(f"{len(pages)} pages, {sum(len(html) for html in pages) / len(pages) / 1024:.0f} KB on average")
+
+    soup_time, soup_results = time_parser(parse_html_soup, pages, args.repeat)
+    lxml_time, lxml_results = time_parser(parse_html, pages, args.repeat)
+    print(f"BeautifulSoup (html.parser): {soup_time:.2f} ms per page")
+    print(f"lxml with XPath:             {lxml_time:.2f} ms per page (speedup {soup_time / lxml_time:.1f}x)")
+    print(f"Identical results: {soup_results == lxml_results}")
@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_index import (SAVED, export_results, find_results, open_index, record_downloads, record_page,
+                          record_query, record_query_end)
+
+SOURCES = ("google_scholar", "acm", "core")
+
+
+def make_result(query_index, result_index):
+    """
+    Build a result with the fields of a Google Scholar result.
+    """
+    return {
+        "title": f"Robotic process automation in banking, study {query_index}-{result_index}",
+        "title_link": f"https://example.org/article/{query_index}/{result_index}",
+        "doc_type": "PDF",
+        "doc_link": f"https://example.org/pdf/{query_index}/{result_index}.pdf",
+        "publication_info": "A Author, B Author - Journal of Examples, 2021 - example.org",
+    }
+
+
+def fill_index(index, queries_count, results_per_query, page_size):
+    """
+    Record the queries of all sources page by page, the way the crawlers do, and mark every other result as
+    saved. Returns the time spent recording the pages and the downloads.
+    """
+    start = time.perf_counter()
+    for source in SOURCES:
+        for query_index in range(queries_count):
+            record_query(index, source, query_index, {"q": f"query {query_index}", "max_items": results_per_query})
+            for first_result_index in range(0, results_per_query, page_size):
+                results = [make_result(query_index, result_index)
+                           for result_index in range(first_result_index, first_result_index + page_size)]
+                statistics = {"total_results_query": first_result_index + page_size,
+                              "total_pdf_links_query": first_result_index + page_size}
+                record_page(index, source, query_index, first_result_index, results, statistics)
+            record_query_end(index, source, query_index, {"q": f"query {query_index}"}, statistics)
+    pages_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for source in SOURCES:
+        for query_index in range(queries_count):
+            record_downloads(index, source, [
+                {"query_index": query_index, "result_index": result_index, "status": SAVED,
+                 "file_path": f"/pdfs/{source}/query_{query_index + 1}/{result_index}.pdf",
+                 "file_hash": hashlib.sha256(f"{source}/{query_index}/{result_index}".encode()).hexdigest()}
+                for result_index in range(0, results_per_query, 2)
+            ])
+    downloads_time = time.perf_counter() - start
+    return pages_time, downloads_time
+
+
+def time_lookups(function, lookups):
+    """
+    Call a function the given number of times and return the average time per call in milliseconds.
+    """
+    start = time.perf_counter()
+    for i in range(lookups):
+        function(i)
+    return (time.perf_counter() - start) * 1000 / lookups
+
+
+def run_benchmark(queries_count, results_per_query, page_size, lookups):
+    """
+    Fill a corpus index and compare its lookups with walking the results JSON files of the sources.
+    """
+    directory = tempfile.mkdtemp()
+    generator = random.Random(0)
+    try:
+        index = open_index(os.path.join(directory, "corpus.db"))
+        pages_time, downloads_time = fill_index(index, queries_count, results_per_query, page_size)
+        results_count = len(SOURCES) * queries_count * results_per_query
+        print(f"{results_count} results in {len(SOURCES) * queries_count} queries")
+        print(f"recording pages of {page_size} results: {pages_time:7.2f} s "
+              f"({pages_time * 1e6 / results_count:.1f} us per result)")
+        print(f"recording downloads: {downloads_time:7.2f} s")
+
+        # Write the results files the crawlers would have written.
+        json_paths = []
+        for source in SOURCES:
+            json_path = os.path.join(directory, f"{source}.json")
+            with open(json_path, "w", encoding="utf-8") as json_file:
+                json.dump(export_results(index, source, updated=True), json_file, ensure_ascii=False, indent=2)
+            json_paths.append(json_path)
+
+        def lookup_saved_json(i):
+            query_index = generator.randrange(queries_count)
+            saved = []
+            for json_path in json_paths:
+                with open(json_path, "r", encoding="utf-8") as json_file:
+                    query_data = json.load(json_file)["queries_data"][query_index]
+                saved += [result for result in query_data["query_results"]
+                          if result.get("file_saved") or result.get("pdf_downloaded")]
+            return saved
+
+        def lookup_saved_index(i):
+            return find_results(index, query_index=generator.randrange(queries_count), status=SAVED)
+
+        def lookup_hash(i):
+            source = generator.choice(SOURCES)
+            query_index = generator.randrange(queries_count)
+            result_index = generator.randrange(0, results_per_query, 2)
+            file_hash = hashlib.sha256(f"{source}/{query_index}/{result_index}".encode()).hexdigest()
+            return find_results(index, file_hash=file_hash)
+
+        def update_status(i):
+            record_downloads(index, generator.choice(SOURCES), [
+                {"query_index": generator.randrange(queries_count),
+                 "result_index": generator.randrange(results_per_query), "status": SAVED}
+            ])
+
+        json_lookups = max(1, lookups // 200)
+        print(f"saved PDFs of a query, from the JSON files: {time_lookups(lookup_saved_json, json_lookups):9.3f} ms")
+        print(f"saved PDFs of a query, from the index:      {time_lookups(lookup_saved_index, lookups):9.3f} ms")
+        print(f"result of a file hash, from the index:      {time_lookups(lookup_hash, lookups):9.3f} ms")
+        print(f"download status update of a result:         {time_lookups(update_status, lookups):9.3f} ms")
+        index["connection"].close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recording and looking up results in the corpus index "
+                                                 "against walking the results JSON files.")
+    parser.add_argument("--queries", type=int, default=100, help="number of queries per source")
+    parser.add_argument("--results", type=int, default=3400, help="number of results per query")
+    parser.add_argument("--page-size", type=int, default=20, help="number of results per recorded page")
+    parser.add_argument("--lookups", type=int, default=1000, help="number of timed lookups and updates")
+    args = parser.parse_args()
+    run_benchmark(args.queries, args.results, args.page_size, args.lookups)
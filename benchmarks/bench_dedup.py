@@ -0,0 +1,115 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from duplicate_checker import remove_duplicates
+
+
+def write_sparse_pdf(filepath, size, head, tail, middle=None):
+    """
+    Write a PDF of the given size that only stores its first and last bytes (and an optional middle marker)
+    on disk, so that large synthetic trees take up little space.
+    """
+    with open(filepath, "wb") as f:
+        f.write(head)
+        if middle is not None:
+            f.seek(size // 2)
+            f.write(middle)
+        f.seek(size - len(tail))
+        f.write(tail)
+
+
+def generate_tree(directory, files_count, duplicate_ratio, seed=0):
+    """
+    Generate a pdfs tree with three sources and three queries each.
+    A share of the files are copies of other files under a different name, some files share their size
+    with another file and some also share their first and last block, so that every stage of the
+    duplicate detection is exercised. Returns the number of duplicates created.
+    """
+    generator = random.Random(seed)
+    query_directories = [os.path.join(directory, source, f"query_{i}")
+                         for source in ("acm_pdfs", "core_pdfs", "gs_pdfs") for i in range(1, 4)]
+    for query_directory in query_directories:
+        os.makedirs(query_directory)
+
+    originals = []
+    duplicates_count = 0
+    for i in range(files_count):
+        filepath = os.path.join(generator.choice(query_directories), f"paper_{i}.pdf")
+
+        if originals and generator.random() < duplicate_ratio:
+            # An exact copy of an earlier file under a different name.
+            size, head, tail, middle = generator.choice(originals)
+            duplicates_count += 1
+        elif originals and generator.random() < 0.05:
+            # Same size, first and last block as an earlier file but a different middle.
+            size, head, tail, _ = generator.choice(originals)
+            middle = generator.randbytes(16)
+        else:
+            # Sizes between 16 KB and 8 MB, spread like those of real PDFs.
+            size = int(2 ** generator.uniform(14, 23))
+            if generator.random() < 0.1 and originals:
+                size = generator.choice(originals)[0]
+            head = b"%PDF-1.4\n" + generator.randbytes(4087)
+            tail = generator.randbytes(4090) + b"%%EOF\n"
+            middle = None
+
+        write_sparse_pdf(filepath, size, head, tail, middle)
+        originals.append((size, head, tail, middle))
+
+    return duplicates_count
+
+
+def hash_every_file(directory):
+    """
+    Hash every PDF in full with 4 KB reads, the way duplicate_checker.py used to.
+    """
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            sha256_hash = hashlib.sha256()
+            with open(os.path.join(root, file), "rb") as f:
+                for byte_block in iter(lambda: f.read(4096), b""):
+                    sha256_hash.update(byte_block)
+
+
+def run_benchmark(files_count, duplicate_ratio, jobs):
+    """
+    Compare hashing every file against the staged duplicate detection on a synthetic tree.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        expected_duplicates = generate_tree(directory, files_count, duplicate_ratio)
+        print(f"Generated {files_count} files with {expected_duplicates} duplicates "
+              f"in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        hash_every_file(directory)
+        elapsed = time.perf_counter() - start
+        print(f"full hash of every file: {elapsed:.2f} s ({files_count / elapsed:.0f} files/s)")
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            directory_info, total_original, total_deleted, total_remaining = remove_duplicates(directory, jobs)
+        elapsed = time.perf_counter() - start
+        print(f"staged duplicate check with {jobs} jobs: {elapsed:.2f} s ({files_count / elapsed:.0f} files/s), "
+              f"{total_deleted} duplicates removed")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark duplicate_checker.py on a synthetic PDF tree.")
+    parser.add_argument("--files", type=int, default=100000, help="number of files in the tree")
+    parser.add_argument("--duplicates", type=float, default=0.3, help="share of files that are duplicates")
+    parser.add_argument("--jobs", type=int, default=1, help="number of files hashed in parallel")
+    args = parser.parse_args()
+    run_benchmark(args.files, args.duplicates, args.jobs)
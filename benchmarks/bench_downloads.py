@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_downloader import download_pdfs
+from local_server import start_server, synthetic_pdf
+
+
+def run_benchmark(files_count, file_size, latency, concurrency_levels):
+    """
+    Download the same set of synthetic PDFs from a local server at several concurrency levels.
+    """
+    files = {f"/paper_{i}.pdf": synthetic_pdf(file_size, seed=i) for i in range(files_count)}
+    server, base_url = start_server(files, latency=latency)
+
+    try:
+        baseline = None
+        for concurrency in concurrency_levels:
+            with tempfile.TemporaryDirectory() as directory:
+                jobs = [{"url": f"{base_url}{path}", "filepath": os.path.join(directory, path.lstrip("/"))}
+                        for path in files]
+
+                start = time.perf_counter()
+                file_hashes = download_pdfs(jobs, {}, 20, 20 * 1024 * 1024, max_concurrency=concurrency,
+                                             max_per_host=concurrency)
+                elapsed = time.perf_counter() - start
+
+            baseline = baseline or elapsed
+            print(f"concurrency={concurrency:>3}: {sum(1 for file_hash in file_hashes if file_hash)}/{files_count} files in {elapsed:.2f} s "
+                  f"({files_count / elapsed:.1f} files/s, speedup {baseline / elapsed:.1f}x)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the PDF download engine against a local HTTP server.")
+    parser.add_argument("--files", type=int, default=100, help="number of PDFs to download")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="size of each PDF in bytes")
+    parser.add_argument("--latency", type=float, default=0.2, help="server latency per request in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrency levels")
+    args = parser.parse_args()
+    run_benchmark(args.files, args.size, args.latency, args.concurrency)
@@ -0,0 +1,101 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fulltext_index import close_segment, match_segment, open_segment, parse_query, write_segment
+
+
+def synthetic_texts(documents_count, words_count, vocabulary_size, generator):
+    """
+    Build texts whose word frequencies follow Zipf's law, like natural language, with a known phrase planted
+    in a small share of them.
+    """
+    vocabulary = [f"word{i}" for i in range(vocabulary_size)]
+    cumulative_weights = list(itertools.accumulate(1 / rank for rank in range(1, vocabulary_size + 1)))
+    texts = []
+    for _ in range(documents_count):
+        words = generator.choices(vocabulary, cum_weights=cumulative_weights, k=words_count)
+        if generator.random() < 0.02:
+            position = generator.randrange(words_count - 3)
+            words[position:position + 3] = ["robotic", "process", "automation"]
+        texts.append(words)
+    return texts
+
+
+def scan(texts, clauses):
+    """
+    Find the texts that contain every clause by reading all of them, like a grep over the extracted texts.
+    """
+    joined_clauses = [f" {' '.join(clause)} " for clause in clauses]
+    return {document for document, words in enumerate(texts)
+            if all(clause in f" {' '.join(words)} " for clause in joined_clauses)}
+
+
+def time_queries(segments, clauses, repeat):
+    """
+    Return the matching documents of a query in the given segments and the mean time of a search.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        matches = {}
+        for segment in segments:
+            matches.update(match_segment(segment, clauses))
+    return set(matches), (time.perf_counter() - start) / repeat
+
+
+def run_benchmark(documents_count, words_count, vocabulary_size, new_documents, repeat, seed):
+    """
+    Index synthetic texts, search them with the memory-mapped index and by scanning the texts, and add a batch
+    of new texts as a second segment instead of rebuilding the index.
+    """
+    generator = random.Random(seed)
+    texts = synthetic_texts(documents_count + new_documents, words_count, vocabulary_size, generator)
+    queries = ['"robotic process automation"', "word5 word17", "word3000 word4000", '"word1 word2"']
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_segment(directory, "segment_1", enumerate(texts[:documents_count]))
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        write_segment(directory, "segment_2", ((document, texts[document])
+                                               for document in range(documents_count, len(texts))))
+        update_time = time.perf_counter() - start
+
+        index_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        text_size = sum(len(" ".join(words)) + 1 for words in texts)
+        print(f"{len(texts)} texts of {words_count} words, {vocabulary_size} distinct words")
+        print(f"index of {documents_count} texts built in {build_time:.2f} s, "
+              f"{new_documents} new texts added as a segment in {update_time:.2f} s")
+        print(f"index size: {index_size / 1e6:.2f} MB for {text_size / 1e6:.2f} MB of text")
+
+        segments = [open_segment(directory, name) for name in ("segment_1", "segment_2")]
+        try:
+            for query in queries:
+                clauses = parse_query(query)
+                matches, index_time = time_queries(segments, clauses, repeat)
+                start = time.perf_counter()
+                scanned = scan(texts, clauses)
+                scan_time = time.perf_counter() - start
+                print(f"{query:<32} {len(matches):>6} texts: index {index_time * 1000:8.2f} ms, "
+                      f"scan {scan_time * 1000:8.1f} ms, same matches {matches == scanned}")
+        finally:
+            for segment in segments:
+                close_segment(segment)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark searching the full-text index against scanning the "
+                                                 "texts, on synthetic texts.")
+    parser.add_argument("--documents", type=int, default=2000, help="number of indexed texts")
+    parser.add_argument("--words", type=int, default=2000, help="number of words of each text")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="number of distinct words")
+    parser.add_argument("--new", type=int, default=100, help="number of texts added to the index afterwards")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times each search is timed")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic texts")
+    args = parser.parse_args()
+    run_benchmark(args.documents, args.words, args.vocabulary, args.new, args.repeat, args.seed)
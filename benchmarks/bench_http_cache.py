@@ -0,0 +1,80 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+from pdf_downloader import download_pdfs
+from pdf_store import STORE_DIRECTORY_NAME
+from local_server import start_server, synthetic_pdf
+
+
+def crawl(base_url, pages_count, pdfs_count, pdfs_directory):
+    """
+    Fetch the search pages and download the PDFs the way a crawl followed by a scrape does.
+    """
+    for i in range(pages_count):
+        http_client.get(f"{base_url}/search", params={"q": "query", "page": i}).text
+
+    query_directory = os.path.join(pdfs_directory, "query_1")
+    os.makedirs(query_directory, exist_ok=True)
+    jobs = [{"url": f"{base_url}/paper_{i}.pdf", "filepath": os.path.join(query_directory, f"paper_{i}.pdf")}
+            for i in range(pdfs_count)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        file_hashes = download_pdfs(jobs, {}, 20, 20 * 1024 * 1024, max_concurrency=4, max_per_host=4,
+                                    store_directory=os.path.join(pdfs_directory, STORE_DIRECTORY_NAME))
+    return sum(1 for file_hash in file_hashes if file_hash)
+
+
+def run_benchmark(pages_count, pdfs_count, pdf_size, latency, max_cache_size):
+    """
+    Crawl the same pages and PDFs twice and compare the transferred bytes and the time of the two runs.
+    """
+    files = {f"/search?q=query&page={i}": b"<html>" + b"x" * 50000 + b"</html>" for i in range(pages_count)}
+    files.update({f"/paper_{i}.pdf": synthetic_pdf(pdf_size, seed=i) for i in range(pdfs_count)})
+    server, base_url = start_server(files, latency=latency, etags=True)
+    directory = tempfile.mkdtemp()
+    http_client.configure(cache_directory=os.path.join(directory, "http_cache"), max_cache_size=max_cache_size)
+
+    try:
+        pdfs_directory = os.path.join(directory, "pdfs")
+        for run in ("first run", "re-run"):
+            logged_before = len(server.request_log)
+            sent_before = server.bytes_sent[0]
+            start = time.perf_counter()
+            saved_count = crawl(base_url, pages_count, pdfs_count, pdfs_directory)
+            elapsed = time.perf_counter() - start
+
+            statuses = [status for request_time, status in server.request_log[logged_before:]]
+            print(f"{run:<10}: {elapsed:.2f} s, {(server.bytes_sent[0] - sent_before) / 1e6:.1f} MB transferred, "
+                  f"{statuses.count(200)} full responses, {statuses.count(304)} not modified, "
+                  f"{saved_count}/{pdfs_count} PDFs saved")
+
+            # Delete the query directory, as if the results were scraped anew; the store is kept.
+            shutil.rmtree(os.path.join(pdfs_directory, "query_1"))
+
+        cache_directory = os.path.join(directory, "http_cache")
+        cached_bytes = sum(os.path.getsize(os.path.join(cache_directory, name))
+                           for name in os.listdir(cache_directory) if name != "index.db")
+        print(f"cached bodies: {cached_bytes} bytes (limit {max_cache_size} bytes)")
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark re-running a crawl with the HTTP cache against a local "
+                                                 "server that sends ETags.")
+    parser.add_argument("--pages", type=int, default=50, help="number of search pages")
+    parser.add_argument("--pdfs", type=int, default=50, help="number of PDFs")
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="size of each PDF in bytes")
+    parser.add_argument("--latency", type=float, default=0.01, help="response delay of the server in seconds")
+    parser.add_argument("--max-cache-size", type=int, default=512 * 1024 * 1024,
+                        help="maximum size in bytes of the cached bodies and the PDFs the cache has entries for")
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.pdfs, args.size, args.latency, args.max_cache_size)
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+from local_server import start_server
+
+
+def measure(name, get, url, requests_count, threads):
+    """
+    Send the requests with the given function from a number of threads and print the requests per second.
+    """
+    def send(i):
+        response = get(url, timeout=10)
+        response.content
+        return response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        statuses = list(executor.map(send, range(requests_count)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} threads={threads:>2}: {statuses.count(200)}/{requests_count} requests in {elapsed:.2f} s "
+          f"({requests_count / elapsed:.0f} requests/s)")
+    return elapsed
+
+
+def run_benchmark(requests_count, page_size, latency, thread_counts):
+    """
+    Compare a new connection per request against the shared session of http_client.py.
+    """
+    server, base_url = start_server({"/page": b"x" * page_size}, latency=latency)
+    url = f"{base_url}/page"
+
+    try:
+        for threads in thread_counts:
+            http_client.ensure_pool_size(threads)
+            before = measure("requests.get (no keep-alive)", requests.get, url, requests_count, threads)
+            after = measure("http_client.get (pooled)", http_client.get, url, requests_count, threads)
+            print(f"speedup {before / after:.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pooled HTTP session against a local HTTP server.")
+    parser.add_argument("--requests", type=int, default=1000, help="number of requests in each run")
+    parser.add_argument("--size", type=int, default=20000, help="size of each response in bytes")
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay of the server in seconds")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8], help="numbers of threads to measure")
+    args = parser.parse_args()
+    run_benchmark(args.requests, args.size, args.latency, args.threads)
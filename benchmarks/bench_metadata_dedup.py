@@ -0,0 +1,97 @@
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metadata_dedup import cluster_records, make_record
+
+SOURCES = ("google_scholar", "acm", "core")
+
+
+def perturb_title(title, generator):
+    """
+    Write a title the way another source might: in other letter cases, with other punctuation, with a word
+    missing or cut off at the start like Google Scholar does.
+    """
+    words = title.split()
+    change = generator.randrange(4)
+    if change == 0:
+        return title.upper()
+    if change == 1:
+        return title.replace(" ", " : ", 1) + "."
+    if change == 2 and len(words) > 6:
+        del words[generator.randrange(len(words))]
+        return " ".join(words)
+    if len(words) > 6:
+        return "… " + " ".join(words[1:])
+    return title.lower()
+
+
+def synthetic_records(works_count, generator):
+    """
+    Build results of the three sources for a number of works, each found one to three times. Returns the
+    records and the number of the work of each record.
+    """
+    vocabulary = [f"word{i}" for i in range(5000)]
+    surnames = [f"Surname{i}" for i in range(20000)]
+    records = []
+    work_numbers = []
+    for work_number in range(works_count):
+        title = " ".join(generator.choice(vocabulary) for _ in range(generator.randint(4, 14))).capitalize()
+        authors = [f"{generator.choice('ABCDEFGH')}. {generator.choice(surnames)}"
+                   for _ in range(generator.randint(1, 4))]
+        doi = f"10.{generator.randint(1000, 9999)}/{work_number}" if generator.random() < 0.3 else None
+        for copy in range(generator.choice((1, 1, 2, 3))):
+            source = generator.choice(SOURCES)
+            result = {
+                "title": title if copy == 0 else perturb_title(title, generator),
+                "authors": authors,
+                "title_link": f"https://doi.org/{doi}" if doi and generator.random() < 0.5 else None,
+                "publication_info": ", ".join(authors) + " - Journal",
+                "doc_link": None,
+                "doc_type": None,
+                "pdf_link": None,
+            }
+            records.append(make_record(source, work_number, copy, result))
+            work_numbers.append(work_number)
+    return records, work_numbers
+
+
+def count_pairs(sizes):
+    """
+    Count the pairs of records within groups of the given sizes.
+    """
+    return sum(size * (size - 1) // 2 for size in sizes)
+
+
+def run_benchmark(works_count, seed):
+    """
+    Cluster synthetic records and report the time it took and the precision and recall of the pairs of records
+    that were put into one cluster.
+    """
+    generator = random.Random(seed)
+    records, work_numbers = synthetic_records(works_count, generator)
+
+    start = time.perf_counter()
+    cluster_numbers = cluster_records(records)
+    elapsed = time.perf_counter() - start
+
+    found_pairs = count_pairs(Counter(cluster_numbers).values())
+    true_pairs = count_pairs(Counter(work_numbers).values())
+    correct_pairs = count_pairs(Counter(zip(cluster_numbers, work_numbers)).values())
+    print(f"{len(records)} records of {works_count} works clustered in {elapsed:.2f} s "
+          f"({elapsed * 1e6 / len(records):.1f} us per record)")
+    print(f"duplicate pairs: {true_pairs} true, {found_pairs} found, {correct_pairs} correct")
+    print(f"precision {correct_pairs / max(found_pairs, 1):.4f}, recall {correct_pairs / max(true_pairs, 1):.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the clustering of search results into works on "
+                                                 "synthetic records with perturbed titles.")
+    parser.add_argument("--works", type=int, default=60000, help="number of distinct works")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic records")
+    args = parser.parse_args()
+    run_benchmark(args.works, args.seed)
@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import http_client
+import metrics
+from local_server import start_server
+
+
+def time_calls(calls):
+    """
+    Time a timer block and a counter increment and return the average cost of both in microseconds.
+    """
+    start = time.perf_counter()
+    for i in range(calls):
+        with metrics.timer("bench_seconds", host="127.0.0.1"):
+            pass
+        metrics.increment("bench_total", host="127.0.0.1")
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def time_requests(url, requests_count):
+    """
+    Send the requests through the shared session and return the average time per request in microseconds.
+    """
+    start = time.perf_counter()
+    for i in range(requests_count):
+        http_client.get(url).content
+    return (time.perf_counter() - start) * 1e6 / requests_count
+
+
+def run_benchmark(calls, requests_count):
+    """
+    Compare the cost of the instrumentation while metrics are disabled and enabled.
+    """
+    http_client.configure(use_cache=False)
+    server, base_url = start_server({"/page": b"x" * 20000})
+    try:
+        url = f"{base_url}/page"
+        time_requests(url, 50)
+        disabled_call, disabled_request = time_calls(calls), time_requests(url, requests_count)
+        metrics.enable()
+        enabled_call, enabled_request = time_calls(calls), time_requests(url, requests_count)
+    finally:
+        server.shutdown()
+
+    print(f"timer and counter: {disabled_call:6.2f} us disabled, {enabled_call:6.2f} us enabled")
+    print(f"request to a local server: {disabled_request:6.0f} us disabled, {enabled_request:6.0f} us enabled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the cost of the metrics while they are disabled and "
+                                                 "enabled.")
+    parser.add_argument("--calls", type=int, default=200000, help="number of timed blocks and counter increments")
+    parser.add_argument("--requests", type=int, default=1000, help="number of requests to a local server")
+    args = parser.parse_args()
+    run_benchmark(args.calls, args.requests)
@@ -0,0 +1,101 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from near_duplicates import NEAR_DUPLICATE_SIMILARITY, fingerprint_files, group_near_duplicates, signature_similarity
+from local_server import text_pdf
+
+
+def synthetic_papers(papers_count, versions_share, lines_count, generator):
+    """
+    Build the lines of text of a number of papers, a share of which is also found in a second version with a
+    different front matter and a few revised lines. Returns the texts and the number of the paper of each.
+    """
+    vocabulary = [f"word{i}" for i in range(20000)]
+    texts = []
+    paper_numbers = []
+    for paper_number in range(papers_count):
+        lines = [" ".join(generator.choice(vocabulary) for _ in range(12)) for _ in range(lines_count)]
+        texts.append(lines)
+        paper_numbers.append(paper_number)
+        if generator.random() < versions_share:
+            revised_lines = [line + " " + generator.choice(vocabulary) if generator.random() < 0.05 else line
+                             for line in lines]
+            texts.append([f"Journal of Examples, volume {paper_number}", "Copyright the publisher"] + revised_lines)
+            paper_numbers.append(paper_number)
+    return texts, paper_numbers
+
+
+def count_pairs(groups):
+    """
+    Return the set of pairs of positions within the given groups.
+    """
+    return {pair for group in groups for pair in itertools.combinations(sorted(group), 2)}
+
+
+def run_benchmark(papers_count, versions_share, lines_count, jobs, sample_pairs, seed):
+    """
+    Write synthetic papers as PDFs, fingerprint their text and group the near-duplicates with the LSH index,
+    and compare the grouping with comparing all pairs of signatures.
+    """
+    generator = random.Random(seed)
+    texts, paper_numbers = synthetic_papers(papers_count, versions_share, lines_count, generator)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepaths = []
+        for i, lines in enumerate(texts):
+            filepath = os.path.join(directory, f"paper_{i}.pdf")
+            with open(filepath, "wb") as pdf_file:
+                pdf_file.write(text_pdf(lines))
+            filepaths.append(filepath)
+
+        start = time.perf_counter()
+        fingerprints = fingerprint_files(filepaths, [str(i) for i in range(len(filepaths))], jobs)
+        fingerprint_time = time.perf_counter() - start
+    signatures = [signature for word_count, signature in fingerprints]
+
+    start = time.perf_counter()
+    groups = group_near_duplicates(signatures)
+    lsh_time = time.perf_counter() - start
+
+    # Comparing every pair of signatures is timed on a sample of pairs and extrapolated.
+    pairs_count = len(signatures) * (len(signatures) - 1) // 2
+    sample = [tuple(generator.sample(range(len(signatures)), 2)) for _ in range(min(sample_pairs, pairs_count))]
+    start = time.perf_counter()
+    for index, other_index in sample:
+        signature_similarity(signatures[index], signatures[other_index]) >= NEAR_DUPLICATE_SIMILARITY
+    all_pairs_time = (time.perf_counter() - start) * pairs_count / max(len(sample), 1)
+
+    true_groups = {}
+    for index, paper_number in enumerate(paper_numbers):
+        true_groups.setdefault(paper_number, []).append(index)
+    true_pairs = count_pairs(true_groups.values())
+    found_pairs = count_pairs(groups)
+    correct_pairs = true_pairs & found_pairs
+
+    print(f"{len(texts)} PDFs of {papers_count} papers, {lines_count * 12} words each")
+    print(f"text extraction and fingerprints: {fingerprint_time:7.2f} s "
+          f"({fingerprint_time * 1000 / len(texts):.1f} ms per PDF, {jobs} jobs)")
+    print(f"grouping with the LSH index:      {lsh_time:7.2f} s")
+    print(f"comparing all {pairs_count} pairs: {all_pairs_time:7.2f} s (extrapolated)")
+    print(f"near-duplicate pairs: {len(true_pairs)} true, {len(found_pairs)} found, {len(correct_pairs)} correct")
+    print(f"precision {len(correct_pairs) / max(len(found_pairs), 1):.4f}, "
+          f"recall {len(correct_pairs) / max(len(true_pairs), 1):.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the detection of near-duplicate PDFs on synthetic "
+                                                 "papers found in two versions.")
+    parser.add_argument("--papers", type=int, default=1000, help="number of distinct papers")
+    parser.add_argument("--versions", type=float, default=0.3, help="share of papers found in a second version")
+    parser.add_argument("--lines", type=int, default=200, help="number of lines of 12 words of each paper")
+    parser.add_argument("--jobs", type=int, default=1, help="number of PDFs fingerprinted in parallel")
+    parser.add_argument("--sample-pairs", type=int, default=100000, help="number of pairs timed for all pairs")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic papers")
+    args = parser.parse_args()
+    run_benchmark(args.papers, args.versions, args.lines, args.jobs, args.sample_pairs, args.seed)
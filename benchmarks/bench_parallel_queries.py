@@ -0,0 +1,96 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+import http_client
+from core_crawler import CORE_ADAPTER
+from crawler_engine import crawl
+from local_server import start_server
+
+
+def result_page(query, page, results_count=10):
+    """
+    Build a CORE search results page with the given number of results.
+    """
+    articles = "".join(
+        f'<div class="styles_search-results__2AZDM"><h3 class="styles-title-1k6Ib">Paper {query} {page} {i}</h3>'
+        f'<span itemprop="name">Author {i}</span><dd itemprop="datePublished">2020</dd>'
+        f'<figure class="styles-thumbnail-1xurx"><a href="/download/{query}_{page}_{i}.pdf">PDF</a></figure></div>'
+        for i in range(results_count)
+    )
+    return f"<html><body>{articles}</body></html>".encode()
+
+
+def run_crawl(adapter, queries, parallel_queries):
+    """
+    Crawl the queries in the current directory and return the time it took and the results.
+    """
+    with open("core_queries.json", "w") as f:
+        json.dump(queries, f)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        crawl(adapter, "core_queries.json", parallel_queries=parallel_queries)
+    elapsed = time.perf_counter() - start
+    with open(adapter["results_file"], "r") as f:
+        return elapsed, json.load(f)
+
+
+def run_benchmark(pages_counts, latency, rate, parallel_queries):
+    """
+    Crawl queries with the given numbers of pages one after another and interleaved, and compare both with the
+    time of the query with the most pages on its own.
+    """
+    files = {}
+    for query_index, pages_count in enumerate(pages_counts):
+        for page in range(1, pages_count + 2):
+            # The page after the last one has no results and ends the query.
+            files[f"/search?q=query{query_index}&page={page}"] = result_page(
+                query_index, page, results_count=10 if page <= pages_count else 0)
+    server, base_url = start_server(files, latency=latency)
+    queries = [{"params": {"base": f"{base_url}/search", "q": f"query{query_index}", "page": 1}, "max_items": 10 ** 6}
+               for query_index in range(len(pages_counts))]
+    slowest = max(range(len(pages_counts)), key=lambda query_index: pages_counts[query_index])
+
+    # Lift the rate of the source so that the budget of queries and the latency of the server are measured.
+    adapter = dict(CORE_ADAPTER, request_rate=rate, max_request_rate=rate, max_parallel_queries=parallel_queries)
+    http_client.configure(use_cache=False)
+    directory = tempfile.mkdtemp()
+    working_directory = os.getcwd()
+    os.chdir(directory)
+
+    try:
+        single_time, single_results = run_crawl(adapter, [queries[slowest]], 1)
+        serial_time, serial_results = run_crawl(adapter, queries, 1)
+        parallel_time, parallel_results = run_crawl(adapter, queries, parallel_queries)
+        print(f"{len(queries)} queries with {sum(pages_counts)} pages, {latency * 1000:.0f} ms latency, "
+              f"{rate:g} requests/s")
+        print(f"{f'slowest query alone ({pages_counts[slowest]} pages)':<34}: {single_time:6.2f} s")
+        print(f"{'queries one after another':<34}: {serial_time:6.2f} s")
+        print(f"{f'{parallel_queries} queries at the same time':<34}: {parallel_time:6.2f} s "
+              f"(speedup {serial_time / parallel_time:.1f}x)")
+        print(f"Identical results: {serial_results == parallel_results}")
+    finally:
+        os.chdir(working_directory)
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark crawling the queries of a queries file one after "
+                                                 "another against crawling them at the same time, with the CORE "
+                                                 "adapter and a local server.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[8, 5, 6, 3, 7, 4, 8, 2],
+                        help="number of result pages of each query")
+    parser.add_argument("--latency", type=float, default=0.2, help="response delay of the server in seconds")
+    parser.add_argument("--rate", type=float, default=50, help="requests per second allowed to the server")
+    parser.add_argument("--parallel-queries", type=int, default=8, help="number of queries crawled at the same time")
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.latency, args.rate, args.parallel_queries)
@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics
+import pdf_downloader
+from pdf_downloader import download_pdfs
+from local_server import start_server, synthetic_pdf
+
+
+def landing_page(size, seed=0):
+    """
+    Build the bytes of an HTML landing page of the given size, like the pages many PDF links lead to.
+    """
+    header = f"<!DOCTYPE html>\n<html><head><title>Article {seed}</title></head><body>\n".encode()
+    return (header + b"<p>Sign in to read the full text.</p>\n" * (size // 38 + 1))[:size]
+
+
+def skip_probe(response, max_file_size, chunk_size=64 * 1024):
+    """
+    Stand in for probe_response() and accept every response within its announced size, as the downloader did
+    before the links were probed.
+    """
+    content_length = response.headers.get("Content-Length")
+    too_large = content_length and content_length.isdigit() and int(content_length) > max_file_size
+    probe = {"content_type": response.headers.get("Content-Type"), "outcome": "too_large" if too_large else None}
+    return probe, response.iter_content(chunk_size=chunk_size)
+
+
+def download(jobs, concurrency):
+    """
+    Download a list of jobs and return the number of saved files, the number of body bytes read and the time
+    it took.
+    """
+    metrics.reset()
+    start = time.perf_counter()
+    file_hashes = download_pdfs(jobs, {}, 20, 20 * 1024 * 1024, max_concurrency=concurrency,
+                                max_per_host=concurrency)
+    elapsed = time.perf_counter() - start
+    bytes_read = sum(counter["value"] for counter in metrics.snapshot()["counters"]
+                     if counter["name"] == "http_response_bytes_total")
+    return sum(1 for file_hash in file_hashes if file_hash), bytes_read, elapsed
+
+
+def run_benchmark(pdfs_count, pages_count, file_size, page_size, latency, concurrency):
+    """
+    Download a link list in which some links lead to web pages instead of PDFs, half of them sent as text/html
+    and half as application/octet-stream, with and without probing the responses.
+    """
+    files = {f"/paper_{i}.pdf": synthetic_pdf(file_size, seed=i) for i in range(pdfs_count)}
+    content_types = {}
+    for i in range(pages_count):
+        files[f"/landing_{i}"] = landing_page(page_size, seed=i)
+        content_types[f"/landing_{i}"] = "text/html; charset=utf-8" if i % 2 == 0 else "application/octet-stream"
+    server, base_url = start_server(files, latency=latency, content_types=content_types)
+    metrics.enable()
+
+    probe_response = pdf_downloader.probe_response
+    try:
+        for label, probe in (("without probing", skip_probe), ("with probing", probe_response)):
+            pdf_downloader.probe_response = probe
+            with tempfile.TemporaryDirectory() as directory:
+                jobs = [{"url": f"{base_url}{path}", "filepath": os.path.join(directory, f"link_{i}.pdf")}
+                        for i, path in enumerate(files)]
+                saved, bytes_read, elapsed = download(jobs, concurrency)
+            print(f"{label:>15}: {saved}/{len(files)} files saved, {bytes_read / 1e6:8.2f} MB read "
+                  f"in {elapsed:.2f} s")
+    finally:
+        pdf_downloader.probe_response = probe_response
+        server.shutdown()
+    print(f"body bytes of the PDFs: {pdfs_count * file_size / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark probing PDF links before downloading them against a "
+                                                 "local HTTP server that serves both PDFs and web pages.")
+    parser.add_argument("--pdfs", type=int, default=100, help="number of links that lead to PDFs")
+    parser.add_argument("--pages", type=int, default=100, help="number of links that lead to web pages")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="size of each PDF in bytes")
+    parser.add_argument("--page-size", type=int, default=2 * 1024 * 1024, help="size of each web page in bytes")
+    parser.add_argument("--latency", type=float, default=0.02, help="server latency per request in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous downloads")
+    args = parser.parse_args()
+    run_benchmark(args.pdfs, args.pages, args.size, args.page_size, args.latency, args.concurrency)
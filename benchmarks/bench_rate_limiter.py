@@ -0,0 +1,98 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pdf_downloader import download_pdfs
+from rate_limiter import configure_host, throttled_get
+from local_server import start_server, synthetic_pdf
+
+
+def summarize(name, server, elapsed, retry_after):
+    """
+    Print the throughput of a run and how often the server throttled it.
+    The shortest gap between a 429 and the next request shows whether Retry-After was honoured.
+    """
+    statuses = [status for request_time, status in server.request_log]
+    gaps = [next_time - request_time
+            for (request_time, status), (next_time, next_status) in zip(server.request_log, server.request_log[1:])
+            if status == 429]
+    shortest_gap = f"{min(gaps):.2f} s" if gaps else "-"
+    print(f"{name:<24} {statuses.count(200):>4} ok {statuses.count(429):>4} throttled in {elapsed:6.2f} s "
+          f"({statuses.count(200) / elapsed:5.2f} ok/s), shortest gap after a 429: {shortest_gap} "
+          f"(Retry-After {retry_after} s)")
+
+
+def run_fixed_sleep(requests_count, server_rate, retry_after, interval):
+    """
+    Send the requests one after another with a fixed pause, the way the crawlers used to.
+    """
+    server, base_url = start_server({"/page": b"<html></html>"}, max_rate=server_rate, retry_after=retry_after)
+    try:
+        start = time.perf_counter()
+        for i in range(requests_count):
+            requests.get(f"{base_url}/page")
+            time.sleep(interval)
+        summarize(f"fixed sleep({interval:g})", server, time.perf_counter() - start, retry_after)
+    finally:
+        server.shutdown()
+
+
+def run_adaptive(requests_count, server_rate, retry_after, start_rate, max_rate):
+    """
+    Send the requests one after another through the rate limiter.
+    """
+    server, base_url = start_server({"/page": b"<html></html>"}, max_rate=server_rate, retry_after=retry_after)
+    try:
+        configure_host(base_url, start_rate, max_rate)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(requests_count):
+                throttled_get(f"{base_url}/page")
+        summarize(f"adaptive ({start_rate:g}-{max_rate:g}/s)", server, time.perf_counter() - start, retry_after)
+    finally:
+        server.shutdown()
+
+
+def run_downloads(files_count, server_rate, retry_after, concurrency):
+    """
+    Download PDFs concurrently from a throttling server, with up to 3 attempts per file like the scrapers.
+    """
+    files = {f"/paper_{i}.pdf": synthetic_pdf(20000, seed=i) for i in range(files_count)}
+    server, base_url = start_server(files, max_rate=server_rate, retry_after=retry_after)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = [{"url": f"{base_url}{path}", "filepath": os.path.join(directory, path.lstrip("/"))}
+                    for path in files]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                file_hashes = download_pdfs(jobs, {}, 20, 20 * 1024 * 1024, attempts=3,
+                                            max_concurrency=concurrency, max_per_host=concurrency)
+            elapsed = time.perf_counter() - start
+        summarize(f"downloads (x{concurrency})", server, elapsed, retry_after)
+        print(f"{'':<24} {sum(1 for file_hash in file_hashes if file_hash)}/{files_count} files saved")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the adaptive rate limiter against a local server that "
+                                                 "throttles clients with 429 responses.")
+    parser.add_argument("--requests", type=int, default=60, help="number of pages requested in each run")
+    parser.add_argument("--server-rate", type=float, default=5, help="requests per second the server allows")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of the server's 429 responses")
+    parser.add_argument("--start-rate", type=float, default=1, help="rate the limiter starts with")
+    parser.add_argument("--max-rate", type=float, default=20, help="rate the limiter may speed up to")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous downloads")
+    args = parser.parse_args()
+
+    run_fixed_sleep(args.requests, args.server_rate, args.retry_after, 1 / args.start_rate)
+    run_fixed_sleep(args.requests, args.server_rate, args.retry_after, 0)
+    run_adaptive(args.requests, args.server_rate, args.retry_after, args.start_rate, args.max_rate)
+    run_downloads(args.requests, args.server_rate, args.retry_after, args.concurrency)
@@ -0,0 +1,66 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+import http_client
+from core_crawler import CORE_ADAPTER
+from corpus_index import configure as configure_index
+from http_archive import RECORD, REPLAY, count_responses
+from bench_parallel_queries import result_page, run_crawl
+from local_server import start_server
+
+
+def run_benchmark(pages_counts, latency):
+    """
+    Crawl queries with the given numbers of pages from a local server at the rate of CORE while recording the
+    responses, then crawl them again from the recording, and compare the times and results of both crawls.
+    """
+    files = {}
+    for query_index, pages_count in enumerate(pages_counts):
+        for page in range(1, pages_count + 2):
+            # The page after the last one has no results and ends the query.
+            files[f"/search?q=query{query_index}&page={page}"] = result_page(
+                query_index, page, results_count=10 if page <= pages_count else 0)
+    server, base_url = start_server(files, latency=latency, content_types=dict.fromkeys(files, "text/html"))
+    queries = [{"params": {"base": f"{base_url}/search", "q": f"query{query_index}", "page": 1}, "max_items": 10 ** 6}
+               for query_index in range(len(pages_counts))]
+
+    configure_index(use_index=False)
+    directory = tempfile.mkdtemp()
+    working_directory = os.getcwd()
+    os.chdir(directory)
+    archive_file = os.path.join(directory, "http_archive.db")
+
+    try:
+        http_client.configure(use_cache=False, archive_mode=RECORD, archive_file=archive_file)
+        record_time, recorded_results = run_crawl(CORE_ADAPTER, queries, 1)
+        responses_count, archive_size = count_responses(http_client.get_archive())
+        requests_count = len(server.request_log)
+
+        http_client.configure(archive_mode=REPLAY)
+        replay_time, replayed_results = run_crawl(CORE_ADAPTER, queries, 1)
+        print(f"{len(queries)} queries with {sum(pages_counts)} pages, {latency * 1000:.0f} ms latency, "
+              f"{CORE_ADAPTER['request_rate']:g} to {CORE_ADAPTER['max_request_rate']:g} requests/s")
+        print(f"{'recorded crawl':<16}: {record_time:7.2f} s, {requests_count} requests")
+        print(f"{'replayed crawl':<16}: {replay_time:7.2f} s, {len(server.request_log) - requests_count} requests "
+              f"(speedup {record_time / replay_time:.0f}x)")
+        print(f"Archive: {responses_count} responses in {archive_size / 1e3:.1f} kB")
+        print(f"Identical results: {recorded_results == replayed_results}")
+    finally:
+        os.chdir(working_directory)
+        server.shutdown()
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark replaying a crawl from an HTTP archive against "
+                                                 "recording it, with the CORE adapter and a local server.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 3, 4],
+                        help="number of result pages of each query")
+    parser.add_argument("--latency", type=float, default=0.3, help="response delay of the server in seconds")
+    args = parser.parse_args()
+    run_benchmark(args.pages, args.latency)
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdf_downloader
+from pdf_downloader import download_pdfs
+from local_server import start_server, synthetic_pdf
+
+
+def download(jobs, concurrency, attempts, dead_letter_file=None):
+    """
+    Download a list of jobs and return the number of saved files and the time it took.
+    """
+    start = time.perf_counter()
+    file_hashes = download_pdfs(jobs, {}, 20, 20 * 1024 * 1024, attempts=attempts, max_concurrency=concurrency,
+                                max_per_host=concurrency, dead_letter_file=dead_letter_file)
+    return sum(1 for file_hash in file_hashes if file_hash), time.perf_counter() - start
+
+
+def run_benchmark(files_count, flaky_count, broken_count, file_size, latency, concurrency, attempts, base_delay):
+    """
+    Download PDFs from a host that answers with 500 a few times before serving some of them, or every time for
+    the broken ones, and compare the time with downloading only the healthy PDFs.
+    """
+    pdf_downloader.RETRY_BASE_DELAY_IN_S = base_delay
+    healthy_files = {f"/paper_{i}.pdf": synthetic_pdf(file_size, seed=i) for i in range(files_count)}
+    flaky_files = {f"/flaky_{i}.pdf": synthetic_pdf(file_size, seed=i) for i in range(flaky_count + broken_count)}
+
+    # The flaky files fail on all attempts but the last, the broken ones on all of them.
+    failures = {path: attempts - 1 if i < flaky_count else attempts for i, path in enumerate(flaky_files)}
+    server, base_url = start_server({**healthy_files, **flaky_files}, latency=latency, failures=failures)
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            healthy_jobs = [{"url": f"{base_url}{path}", "filepath": os.path.join(directory, "alone", path[1:])}
+                            for path in healthy_files]
+            os.makedirs(os.path.join(directory, "alone"))
+            saved, healthy_time = download(healthy_jobs, concurrency, attempts)
+            print(f"healthy files alone:  {saved}/{files_count} files in {healthy_time:.2f} s")
+
+            # Put the flaky jobs first, so that their retries would hold up the healthy ones if they kept a slot.
+            os.makedirs(os.path.join(directory, "mixed"))
+            jobs = [{"url": f"{base_url}{path}", "filepath": os.path.join(directory, "mixed", path[1:])}
+                    for path in {**flaky_files, **healthy_files}]
+            dead_letter_file = os.path.join(directory, "dead_letters.json")
+            saved, mixed_time = download(jobs, concurrency, attempts, dead_letter_file)
+            with open(dead_letter_file, "r", encoding="utf-8") as json_file:
+                dead_letters = json.load(json_file)["dead_letters"]
+
+        failed_requests = sum(1 for _, status in server.request_log if status == 500)
+        longest_backoff = sum(min(pdf_downloader.RETRY_MAX_DELAY_IN_S, base_delay * 2 ** retry)
+                              for retry in range(attempts - 1))
+        print(f"with the flaky files: {saved}/{len(jobs)} files in {mixed_time:.2f} s "
+              f"({failed_requests} requests answered with 500)")
+        print(f"dead letters: {len(dead_letters)} (expected {broken_count})")
+        print(f"a flaky file waits up to {longest_backoff:.1f} s between its attempts; if the waits held a download "
+              f"slot, the {flaky_count + broken_count} flaky files would add up to "
+              f"{(flaky_count + broken_count) * longest_backoff / concurrency:.1f} s")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the retries of failed downloads against a local HTTP "
+                                                 "server that fails some of its requests.")
+    parser.add_argument("--files", type=int, default=200, help="number of PDFs that are served at once")
+    parser.add_argument("--flaky", type=int, default=20, help="number of PDFs that fail before they are served")
+    parser.add_argument("--broken", type=int, default=5, help="number of PDFs that always fail")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="size of each PDF in bytes")
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency per request in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous downloads")
+    parser.add_argument("--attempts", type=int, default=3, help="number of attempts per download")
+    parser.add_argument("--base-delay", type=float, default=1.0, help="bound of the delay before the first retry")
+    args = parser.parse_args()
+    run_benchmark(args.files, args.flaky, args.broken, args.size, args.latency, args.concurrency, args.attempts,
+                  args.base_delay)
@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIRECTORY)
+for source_directory in ("google_scholar", "acm", "core"):
+    sys.path.append(os.path.join(ROOT_DIRECTORY, source_directory))
+import acm_crawler
+import core_crawler
+import gs_crawler
+from duplicate_checker import remove_duplicates
+from pdf_downloader import download_pdfs
+from bench_dedup import generate_tree
+from local_server import start_server, synthetic_pdf
+from make_fixtures import FIXTURES_DIRECTORY
+
+# Parser of each source and the page argument it is called with for the first page.
+PARSERS = {
+    "google_scholar": (gs_crawler.parse_html, 0),
+    "acm": (acm_crawler.parse_html, 0),
+    "core": (core_crawler.parse_html, 1),
+}
+
+# File the results of each run are appended to, one JSON object per line.
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# Rates that are compared with the previous run. Higher is better for all of them.
+RATES = ("records_per_second", "downloads_per_second", "megabytes_per_second", "files_per_second")
+
+
+def bench_parse(min_time):
+    """
+    Parse the saved results pages of each source for at least min_time seconds per source and return the
+    records parsed per second.
+    """
+    results = {}
+    for source, (parse, page) in PARSERS.items():
+        pages = []
+        for path in sorted(glob.glob(os.path.join(FIXTURES_DIRECTORY, source, "*.html"))):
+            with open(path, "r", encoding="utf-8") as html_file:
+                pages.append(html_file.read())
+        if not pages:
+            print(f"No fixtures of {source} in {FIXTURES_DIRECTORY}; run make_fixtures.py first.")
+            continue
+
+        records_count = 0
+        rounds = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            while rounds == 0 or time.perf_counter() - start < min_time:
+                for html in pages:
+                    records_count += len(parse(html, page))
+                rounds += 1
+        elapsed = time.perf_counter() - start
+        results[source] = {"pages": len(pages) * rounds, "records": records_count, "seconds": round(elapsed, 3),
+                           "records_per_second": round(records_count / elapsed, 1)}
+    return results
+
+
+def bench_download(files_count, sizes, latency, concurrency):
+    """
+    Download synthetic PDFs of the given sizes, in turn, from a local server into a content-addressed store,
+    like the scrapers do, and return the downloads and megabytes per second.
+    """
+    files = {f"/paper_{i}.pdf": synthetic_pdf(sizes[i % len(sizes)], seed=i) for i in range(files_count)}
+    server, base_url = start_server(files, latency=latency)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = [{"url": f"{base_url}{path}", "filepath": os.path.join(directory, path.lstrip("/"))}
+                    for path in files]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                file_hashes = download_pdfs(jobs, {}, 20, 20 * 1024 * 1024, max_concurrency=concurrency,
+                                            max_per_host=concurrency,
+                                            store_directory=os.path.join(directory, "blobs"))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    megabytes = sum(len(body) for body in files.values()) / 1e6
+    return {"files": files_count, "saved": sum(1 for file_hash in file_hashes if file_hash),
+            "megabytes": round(megabytes, 2), "seconds": round(elapsed, 3),
+            "downloads_per_second": round(files_count / elapsed, 1),
+            "megabytes_per_second": round(megabytes / elapsed, 1)}
+
+
+def bench_dedup(files_count, duplicate_ratio, jobs):
+    """
+    Generate a pdfs tree with duplicates and remove them without the hash cache, and return the files and
+    megabytes checked per second.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        duplicates_count = generate_tree(directory, files_count, duplicate_ratio)
+        megabytes = sum(os.path.getsize(os.path.join(root, file))
+                        for root, _, files in os.walk(directory) for file in files) / 1e6
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, _, deleted_count, _ = remove_duplicates(directory, jobs)
+        elapsed = time.perf_counter() - start
+    return {"files": files_count, "duplicates": duplicates_count, "deleted": deleted_count,
+            "megabytes": round(megabytes, 2), "seconds": round(elapsed, 3),
+            "files_per_second": round(files_count / elapsed, 1),
+            "megabytes_per_second": round(megabytes / elapsed, 1)}
+
+
+def git_commit():
+    """
+    Return the commit the repository is at, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIRECTORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous_run(results_file, settings):
+    """
+    Return the last run in the results file with the same settings, or None.
+    """
+    if not os.path.exists(results_file):
+        return None
+    previous_run = None
+    with open(results_file, "r", encoding="utf-8") as json_file:
+        for line in json_file:
+            if line.strip():
+                run = json.loads(line)
+                if run["settings"] == settings:
+                    previous_run = run
+    return previous_run
+
+
+def iter_rates(results, prefix=""):
+    """
+    Yield the name and value of each rate of a run's results, such as parse.acm.records_per_second.
+    """
+    for name, value in results.items():
+        if isinstance(value, dict):
+            yield from iter_rates(value, f"{prefix}{name}.")
+        elif name in RATES:
+            yield f"{prefix}{name}", value
+
+
+def run_suite(stages, settings, results_file):
+    """
+    Run the given stages of the suite, print their rates next to those of the previous run with the same
+    settings, and append the run to the results file.
+    """
+    results = {}
+    if "parse" in stages:
+        results["parse"] = bench_parse(settings["parse_time"])
+    if "download" in stages:
+        results["download"] = bench_download(settings["download_files"], settings["download_sizes"],
+                                             settings["latency"], settings["concurrency"])
+    if "dedup" in stages:
+        results["dedup"] = bench_dedup(settings["dedup_files"], settings["duplicate_ratio"], settings["jobs"])
+
+    run = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "results": results,
+    }
+
+    previous_run = load_previous_run(results_file, settings)
+    previous_rates = dict(iter_rates(previous_run["results"])) if previous_run else {}
+    if previous_run:
+        print(f"Compared with the run of {previous_run['timestamp']} at commit {previous_run['commit']}:")
+    for name, value in iter_rates(results):
+        line = f"{name:<45} {value:>12.1f}"
+        if previous_rates.get(name):
+            line += f"  {(value / previous_rates[name] - 1) * 100:+7.1f}%"
+        print(line)
+
+    with open(results_file, "a", encoding="utf-8") as json_file:
+        json_file.write(json.dumps(run) + "\n")
+    print(f"The results have been appended to {results_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite: parse saved results pages, "
+                                                 "download synthetic PDFs from a local server and remove "
+                                                 "duplicates from a generated pdfs tree.")
+    parser.add_argument("--stages", nargs="+", choices=("parse", "download", "dedup"),
+                        default=["parse", "download", "dedup"], help="stages to run")
+    parser.add_argument("--parse-time", type=float, default=2, help="seconds each source's pages are parsed for")
+    parser.add_argument("--download-files", type=int, default=60, help="number of PDFs to download")
+    parser.add_argument("--download-sizes", type=int, nargs="+", default=[64 * 1024, 512 * 1024, 4 * 1024 * 1024],
+                        help="sizes of the PDFs in bytes, used in turn")
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency per request in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous downloads")
+    parser.add_argument("--dedup-files", type=int, default=2000, help="number of PDFs in the generated tree")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2, help="share of the PDFs that are copies")
+    parser.add_argument("--jobs", type=int, default=4, help="number of files hashed in parallel")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON Lines file the results are appended to")
+    args = parser.parse_args()
+    run_suite(args.stages, {
+        "parse_time": args.parse_time,
+        "download_files": args.download_files,
+        "download_sizes": args.download_sizes,
+        "latency": args.latency,
+        "concurrency": args.concurrency,
+        "dedup_files": args.dedup_files,
+        "duplicate_ratio": args.duplicate_ratio,
+        "jobs": args.jobs,
+    }, args.output)
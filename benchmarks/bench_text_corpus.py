@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdf_text
+import text_corpus
+from text_corpus import build_corpus
+from local_server import text_pdf
+
+# Name of the PDFs the extractor hangs on in the benchmark.
+STUCK_NAME = "stuck"
+
+
+def stuck_extractor(filepath, raise_errors=False):
+    """
+    Stand in for extract_text() and hang on the PDFs named stuck, like a PDF whose parsing never ends.
+    The worker processes are forked, so they use this extractor as well.
+    """
+    if STUCK_NAME in os.path.basename(filepath):
+        time.sleep(3600)
+    return pdf_text.extract_text(filepath, raise_errors)
+
+
+def run_benchmark(files_count, stuck_count, lines_count, jobs, timeout):
+    """
+    Extract the text of synthetic PDFs one after the other in a single process, as before the extraction
+    stage, and with the stage, once from scratch and once from its cache, with a few PDFs the extractor hangs on.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_directory = os.path.join(directory, "pdfs", "gs_pdfs", "query_1")
+        os.makedirs(pdf_directory)
+        filepaths = []
+        for i in range(files_count):
+            filepath = os.path.join(pdf_directory, f"paper_{i}.pdf")
+            with open(filepath, "wb") as pdf_file:
+                pdf_file.write(text_pdf([f"paper {i} line {j} of the synthetic corpus" for j in range(lines_count)]))
+            filepaths.append(filepath)
+        for i in range(stuck_count):
+            with open(os.path.join(pdf_directory, f"{STUCK_NAME}_{i}.pdf"), "wb") as pdf_file:
+                pdf_file.write(text_pdf([f"{STUCK_NAME} paper {i}"]))
+
+        start = time.perf_counter()
+        for filepath in filepaths:
+            pdf_text.extract_text(filepath)
+        sequential_time = time.perf_counter() - start
+        print(f"one process, healthy PDFs only: {sequential_time:7.2f} s for {files_count} PDFs")
+        if stuck_count:
+            print("one process, with the stuck PDFs: never finishes")
+
+        text_corpus.extract_text = stuck_extractor
+        try:
+            output_file = os.path.join(directory, "text_corpus.jsonl.gz")
+            cache_directory = os.path.join(directory, "text_cache")
+            for label in ("extraction stage", "from the cache"):
+                start = time.perf_counter()
+                counts = build_corpus(os.path.join(directory, "pdfs"), output_file, cache_directory, jobs, timeout)
+                elapsed = time.perf_counter() - start
+                print(f"{label:>16}: {elapsed:7.2f} s for {counts['texts']} PDFs ({counts['new']} new, "
+                      f"{counts[text_corpus.TIMED_OUT]} timed out after {timeout} s, {jobs} jobs)")
+            print(f"compressed corpus: {os.path.getsize(output_file) / 1e6:.2f} MB")
+        finally:
+            text_corpus.extract_text = pdf_text.extract_text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the text extraction stage on synthetic PDFs, a few of "
+                                                 "which the extractor hangs on.")
+    parser.add_argument("--files", type=int, default=500, help="number of PDFs")
+    parser.add_argument("--stuck", type=int, default=2, help="number of PDFs the extractor hangs on")
+    parser.add_argument("--lines", type=int, default=500, help="number of lines of each PDF")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="number of PDFs extracted in parallel")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds a worker may spend on one PDF")
+    args = parser.parse_args()
+    run_benchmark(args.files, args.stuck, args.lines, args.jobs, args.timeout)
@@ -0,0 +1,155 @@
+import hashlib
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def synthetic_pdf(size, seed=0):
+    """
+    Build the bytes of a synthetic PDF file of the given size.
+    """
+    header = f"%PDF-1.4\n% synthetic document {seed}\n".encode()
+    body = bytes((seed + i) % 251 for i in range(251)) * (size // 251 + 1)
+    return (header + body)[:max(size, len(header))]
+
+
+def text_pdf(lines, lines_per_page=50):
+    """
+    Build the bytes of a PDF file that shows the given lines of text in Helvetica, with deflated content streams.
+    """
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(len(pages))) +
+               b"] /Count %d >>" % len(pages),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, page_lines in enumerate(pages):
+        content = b"BT /F1 10 Tf 12 TL 50 780 Td\n"
+        for line in page_lines:
+            escaped = line.encode("latin-1", "replace").replace(b"\\", b"\\\\")
+            content += b"(" + escaped.replace(b"(", b"\\(").replace(b")", b"\\)") + b") Tj T*\n"
+        content = zlib.compress(content + b"ET")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(body)
+    body += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    body += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    body += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return body
+
+
+def start_server(files, latency=0.0, send_length=True, max_rate=None, retry_after=None, etags=False, failures=None,
+                 content_types=None):
+    """
+    Serve a dictionary of path -> bytes from a local HTTP server in a background thread.
+    Every response is delayed by the given latency in seconds to stand in for a remote host.
+    Connections are kept alive between requests. With send_length set to False the Content-Length header
+    is left out and the connection is closed after the body.
+    With max_rate, requests beyond that many per second are answered with 429 and, if given, a Retry-After
+    header; requests sent before a Retry-After has passed are refused as well. Each request is logged as a
+    (time, status code) tuple in server.request_log, and the number of body bytes sent is counted in
+    server.bytes_sent[0].
+    With etags, every file is sent with an ETag and requests whose If-None-Match matches it are answered
+    with 304.
+    With failures, a dictionary of path -> count, the first count requests for a path are answered with 500.
+    Files are sent as application/pdf unless content_types, a dictionary of path -> Content-Type, says otherwise.
+    Returns the server and its base URL.
+    """
+    throttle = {"tokens": float(max_rate or 0), "updated": time.monotonic(), "blocked_until": 0.0}
+    throttle_lock = threading.Lock()
+    request_log = []
+    bytes_sent = [0]
+    failures = dict(failures or {})
+    failures_lock = threading.Lock()
+
+    def is_failing(path):
+        with failures_lock:
+            if failures.get(path, 0) <= 0:
+                return False
+            failures[path] -= 1
+            return True
+
+    def is_throttled():
+        if max_rate is None:
+            return False
+        with throttle_lock:
+            now = time.monotonic()
+            throttle["tokens"] = min(max_rate, throttle["tokens"] + (now - throttle["updated"]) * max_rate)
+            throttle["updated"] = now
+            if now < throttle["blocked_until"] or throttle["tokens"] < 1:
+                if retry_after and now >= throttle["blocked_until"]:
+                    throttle["blocked_until"] = now + retry_after
+                return True
+            throttle["tokens"] -= 1
+            return False
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep connections alive between requests, like a real web server.
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            if is_throttled():
+                request_log.append((time.monotonic(), 429))
+                self.send_response(429)
+                if retry_after:
+                    self.send_header("Retry-After", str(retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if is_failing(self.path):
+                request_log.append((time.monotonic(), 500))
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = files.get(self.path)
+            etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"' if etags and body is not None else None
+            if etag and self.headers.get("If-None-Match") == etag:
+                request_log.append((time.monotonic(), 304))
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            request_log.append((time.monotonic(), 200 if body is not None else 404))
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", (content_types or {}).get(self.path, "application/pdf"))
+            if etag:
+                self.send_header("ETag", etag)
+            if send_length:
+                self.send_header("Content-Length", str(len(body)))
+            else:
+                self.close_connection = True
+            self.end_headers()
+
+            # The client may hang up early, e.g. when a file exceeds its size limit.
+            try:
+                self.wfile.write(body)
+                bytes_sent[0] += len(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    # Clients hang up on the bodies they do not want, which is not an error of the server.
+    server.handle_error = lambda request, client_address: None
+    server.request_log = request_log
+    server.bytes_sent = bytes_sent
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
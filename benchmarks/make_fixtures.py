@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+
+from bench_core_parser import synthetic_page as core_page
+
+# Directory of the saved search results pages, with a subdirectory for each source.
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def page_chrome(title, body):
+    """
+    Surround the results of a page with the navigation, scripts and styles search pages carry.
+    """
+    navigation = "".join(f'<li class="nav-item"><a href="/page/{i}">Link {i}</a></li>' for i in range(200))
+    script = "<script>window.__DATA__ = {" + ",".join(f'"k{i}": {i}' for i in range(3000)) + "};</script>"
+    style = "<style>" + "".join(f".c{i} {{ margin: {i}px; }}" for i in range(1000)) + "</style>"
+    return (f"<!DOCTYPE html><html><head><title>{title}</title>{style}{script}</head><body>"
+            f"<nav><ul>{navigation}</ul></nav><main>{body}</main><footer>{navigation}</footer></body></html>\n")
+
+
+def gs_page(seed, results_count=10):
+    """
+    Build a Google Scholar results page. Most results have a PDF link and some are citations without a link.
+    """
+    generator = random.Random(seed)
+    results = []
+    for i in range(results_count):
+        pdf = generator.random() < 0.6
+        title_prefix = '<span class="gs_ctc"><span class="gs_ct1">[PDF]</span><span class="gs_ct2">[PDF]</span></span> '
+        pdf_link = (f'<div class="gs_ggs gs_fl"><div class="gs_ggsd"><div class="gs_or_ggsm">'
+                    f'<a href="https://example.org/papers/{seed}_{i}.pdf"><span class="gs_ctg2">[PDF]</span> '
+                    f'example.org</a></div></div></div>' if pdf else "")
+        authors = ", ".join(f"A Author{generator.randrange(1000)}" for _ in range(generator.randint(1, 4)))
+        results.append(
+            f'<div class="gs_r gs_or gs_scl" data-cid="c{seed}{i}">{pdf_link}<div class="gs_ri">'
+            f'<h3 class="gs_rt">{title_prefix if pdf else ""}<a href="https://example.org/works/{seed}/{i}">'
+            f'Paper {seed} {i} on robotic process automation in banking</a></h3>'
+            f'<div class="gs_a">{authors} - Journal of Examples, {generator.randint(1990, 2023)} - example.org</div>'
+            f'<div class="gs_rs">{"Snippet text of the result. " * 8}</div>'
+            f'<div class="gs_fl gs_flb"><a href="javascript:void(0)" class="gs_or_sav">Save</a>'
+            f'<a href="/scholar?cites={generator.randrange(10 ** 9)}">Cited by {generator.randrange(500)}</a>'
+            f'<a href="/scholar?q=related:{seed}{i}">Related articles</a></div></div></div>'
+        )
+    return page_chrome("Google Scholar", f'<div id="gs_res_ccl_mid">{"".join(results)}</div>')
+
+
+def acm_page(seed, results_count=20):
+    """
+    Build an ACM Digital Library results page. Some results have no PDF link.
+    """
+    generator = random.Random(seed)
+    results = []
+    for i in range(results_count):
+        authors = "".join(f'<li><a href="/profile/{generator.randrange(10 ** 10)}" title="Author {i} {j}">'
+                          f'<span>Author {i} {j}</span></a></li>' for j in range(generator.randint(1, 6)))
+        pdf_link = (f'<li><a aria-label="PDF" href="/doi/pdf/10.1145/{seed}.{i}" class="btn--icon">PDF</a></li>'
+                    if generator.random() < 0.7 else "")
+        results.append(
+            f'<li class="search__item issue-item-container"><div class="issue-item issue-item--search clearfix">'
+            f'<div class="issue-item__content"><div class="issue-item__content-right">'
+            f'<h5 class="issue-item__title"><span class="hlFld-Title"><a href="/doi/10.1145/{seed}.{i}">'
+            f'ACM Paper {seed} {i} on robotic process automation</a></span></h5>'
+            f'<ul class="rlist--inline loa truncate-list">{authors}</ul>'
+            f'<div class="issue-item__detail"><a href="/doi/proceedings/10.1145/{seed}">Proceedings of the '
+            f'Conference on Examples</a><span class="dot-separator">pp {generator.randrange(1, 300)}</span></div>'
+            f'<div class="issue-item__abstract">{"Abstract text. " * 40}</div>'
+            f'<div class="issue-item__footer"><ul class="rlist--inline">{pdf_link}</ul></div>'
+            f'</div></div></div></li>'
+        )
+    return page_chrome("ACM Digital Library", f'<ul class="search-result__xsl-body items-results">'
+                                              f'{"".join(results)}</ul>')
+
+
+# Page builders of each source.
+PAGE_BUILDERS = {"google_scholar": gs_page, "acm": acm_page, "core": core_page}
+
+
+def write_fixtures(pages_count, directory=FIXTURES_DIRECTORY):
+    """
+    Write a number of results pages of each source to the fixtures directory.
+    """
+    for source, build_page in PAGE_BUILDERS.items():
+        source_directory = os.path.join(directory, source)
+        os.makedirs(source_directory, exist_ok=True)
+        for page in range(1, pages_count + 1):
+            with open(os.path.join(source_directory, f"page_{page}.html"), "w", encoding="utf-8",
+                      newline="\n") as html_file:
+                html_file.write(build_page(page))
+        print(f"{pages_count} pages of {source} written to {source_directory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic search results pages of each source as fixtures "
+                                                 "of the benchmark suite. Saved pages of the sites can be added to "
+                                                 "the same directories.")
+    parser.add_argument("--pages", type=int, default=2, help="number of pages of each source")
+    args = parser.parse_args()
+    write_fixtures(args.pages)
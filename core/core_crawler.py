@@ -1,139 +1,208 @@
-import json
-import requests
-from bs4 import BeautifulSoup
-from time import sleep
-
-
-def get_query_url(query):
-    """
-    Construct the query URL for CORE based on the given query parameters.
-    """
-    base_url = query["params"]["base"]
-    search_query = query["params"]["q"]
-    page_number = query["params"]["page"]
-    return f"{base_url}?q={search_query}&page={page_number}"
-
-
-def parse_html(html, current_page):
-    """
-    Parse the HTML content of a CORE search results page and extract relevant information.
-    """
-    # Parse the HTML data and look for specific classes within the HTML.
-    soup = BeautifulSoup(html, 'html.parser')
-    articles = soup.find_all('div', {'class': 'styles_search-results__2AZDM'})
-
-    results = []
-
-    # Iterate over the contents of the parsed HTML data.
-    for article in articles:
-        title = article.find('h3', {'class': 'styles-title-1k6Ib'}).get_text(strip=True)
-        author_elements = article.find_all('span', {'itemprop': 'name'})
-        authors = [author.get_text(strip=True) for author in author_elements]
-        publication_date = article.find('dd', {'itemprop': 'datePublished'}).get_text(strip=True)
-        pdf_link_tag = article.find('figure', {'class': 'styles-thumbnail-1xurx'}).find('a', href=True)
-        pdf_link = pdf_link_tag['href'] if pdf_link_tag else "No PDF link found"
-
-        result_data = {
-            'title': title,
-            'authors': authors,
-            'publication_date': publication_date,
-            'pdf_link': pdf_link,
-            'page': current_page
-        }
-        results.append(result_data)
-
-        # Print the title of each recorded document.
-        print(f"Document recorded: {result_data['title']}")
-
-    return results
-
-
-def crawl_queries(file_path):
-    """
-    Crawl the CORE website based on queries loaded from a JSON file and save the results.
-    """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                      'Chrome/58.0.3029.110 Safari/537.3'
-    }
-
-    # Load queries from a JSON file.
-    try:
-        with open(file_path, 'r') as file:
-            queries = json.load(file)
-    except Exception as e:
-        print(f"Error loading queries: {e}")
-        return
-
-    all_queries_data = []
-    total_queries = len(queries)
-    total_results = 0
-    total_pdf_links = 0
-
-    # Iterate over the queries and perform actions for each query.
-    for query in queries:
-        max_items = query["max_items"]
-        total_items_query = 0
-        page = 0
-
-        # Construct the data structure to store the results of each query.
-        query_data = {
-            "query_metadata": query,
-            "query_link_statistics": {},
-            "query_results": []
-        }
-
-        # Fetch data until the maximum number of results is obtained.
-        while total_items_query < max_items:
-            query["params"]["page"] = page + 1
-            url = get_query_url(query)
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                page_results = parse_html(response.text, page)
-                results_to_add = page_results[:max_items - total_items_query]
-                query_data["query_results"].extend(results_to_add)
-                total_items_query += len(results_to_add)
-                total_pdf_links += sum(
-                    1 for result in results_to_add if 'pdf_link' in result and result['pdf_link'] != "No PDF link found"
-                )
-                if total_items_query >= max_items:
-                    break
-            else:
-                print(f"Failed to retrieve data from {url}")
-                print("Status code:", response.status_code)
-                print("Response text:", response.text)
-            page += 1
-
-            # Wait between requests in order to lessen the load on the server.
-            sleep(1)
-
-        # Calculate the link statistics.
-        query_data["query_link_statistics"] = {
-            'total_results_query': len(query_data["query_results"]),
-            'total_pdf_links_query': sum(
-                1 for result in query_data["query_results"] if 'pdf_link' in result
-                and result['pdf_link'] != "No PDF link found"
-            )
-        }
-        total_results += len(query_data["query_results"])
-        all_queries_data.append(query_data)
-
-    # Construct the data structure for the final result.
-    result_data = {
-        "total_queries": total_queries,
-        "total_results": total_results,
-        "total_pdf_links": total_pdf_links,
-        "queries_data": all_queries_data
-    }
-
-    # Save the results to a JSON file.
-    try:
-        with open('core_search_results.json', 'w') as outfile:
-            json.dump(result_data, outfile, indent=4)
-        print("The query results have been saved to core_search_results.json.")
-    except Exception as e:
-        print(f"Error saving query results: {e}")
-
-
-if __name__ == "__main__":
-    crawl_queries('core_queries.json')
+import argparse
+import os
+import sys
+from lxml import etree
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core_scraper import scrape_core_stream
+from corpus_index import configure as configure_index
+from crawler_engine import crawl, rebuild
+from http_archive import ARCHIVE_FILE, RECORD, REPLAY
+from http_client import SOURCE_HEADERS, configure
+from metrics import enable, start_metrics_server, write_metrics
+
+# Requests per second sent to CORE at first and at most.
+REQUEST_RATE = 1
+MAX_REQUEST_RATE = 4
+
+# Number of queries that may be crawled from CORE at the same time.
+MAX_PARALLEL_QUERIES = 4
+
+# Precompiled XPath expressions for the search results pages.
+# An element matches a class if the class is one of the names in its class attribute.
+HAS_CLASS = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+ARTICLES_XPATH = etree.XPath(f"//div[{HAS_CLASS.format('styles_search-results__2AZDM')}]")
+TITLE_XPATH = etree.XPath(f".//h3[{HAS_CLASS.format('styles-title-1k6Ib')}]")
+AUTHORS_XPATH = etree.XPath(".//span[@itemprop='name']")
+PUBLICATION_DATE_XPATH = etree.XPath(".//dd[@itemprop='datePublished']")
+THUMBNAIL_XPATH = etree.XPath(f".//figure[{HAS_CLASS.format('styles-thumbnail-1xurx')}]")
+PDF_LINK_XPATH = etree.XPath(".//a[@href]/@href")
+TEXT_XPATH = etree.XPath(".//text()[not(ancestor::script or ancestor::style)]")
+
+
+def get_query_url(query):
+    """
+    Construct the query URL for CORE based on the given query parameters.
+    """
+    base_url = query["params"]["base"]
+    search_query = query["params"]["q"]
+    page_number = query["params"]["page"]
+    return f"{base_url}?q={search_query}&page={page_number}"
+
+
+def get_text(element):
+    """
+    Return the stripped text of an element the way BeautifulSoup's get_text(strip=True) does, or None if
+    there is no element.
+    """
+    if element is None:
+        return None
+    return "".join(text.strip() for text in TEXT_XPATH(element))
+
+
+def first(elements):
+    """
+    Return the first of a list of elements, or None if the list is empty.
+    """
+    return elements[0] if elements else None
+
+
+def has_pdf_link(result):
+    """
+    Check if a parsed result has a link to a PDF.
+    """
+    return result.get('pdf_link') not in (None, "No PDF link found")
+
+
+def parse_html(html, current_page):
+    """
+    Parse the HTML content of a CORE search results page and extract relevant information.
+    A field whose element is missing from a result is None.
+    """
+    # Parse the HTML data and look for specific classes within the HTML.
+    tree = etree.HTML(html.encode("utf-8"), etree.HTMLParser(encoding="utf-8")) if html.strip() else None
+    articles = ARTICLES_XPATH(tree) if tree is not None else []
+
+    results = []
+
+    # Iterate over the contents of the parsed HTML data.
+    for article in articles:
+        title = get_text(first(TITLE_XPATH(article)))
+        authors = [get_text(author) for author in AUTHORS_XPATH(article)]
+        publication_date = get_text(first(PUBLICATION_DATE_XPATH(article)))
+        thumbnail = first(THUMBNAIL_XPATH(article))
+        if thumbnail is None:
+            pdf_link = None
+        else:
+            pdf_link = first(PDF_LINK_XPATH(thumbnail)) or "No PDF link found"
+
+        result_data = {
+            'title': title,
+            'authors': authors,
+            'publication_date': publication_date,
+            'pdf_link': pdf_link,
+            'page': current_page
+        }
+        results.append(result_data)
+
+    return results
+
+
+def page_request(query, page):
+    """
+    Return the URL of a results page of a query, counting the pages from 0.
+    The page parameter of the query is set to it, so the query metadata shows the last page fetched.
+    """
+    query["params"]["page"] = page + 1
+    return get_query_url(query), None
+
+
+# Adapter of CORE for the crawler engine.
+CORE_ADAPTER = {
+    "name": "core",
+    "journal_file": "core_search_results.ndjson",
+    "results_file": "core_search_results.json",
+    "encoding": None,
+    "indent": 4,
+    "ensure_ascii": True,
+    "headers": SOURCE_HEADERS["core"],
+    "request_rate": REQUEST_RATE,
+    "max_request_rate": MAX_REQUEST_RATE,
+    "max_parallel_queries": MAX_PARALLEL_QUERIES,
+    "first_page": lambda query: 0,
+    "page_step": 1,
+    "page_request": page_request,
+    "parse_page": parse_html,
+    "has_pdf_link": has_pdf_link,
+    "scrape_stream": scrape_core_stream,
+}
+
+
+def crawl_queries(file_path, resume=False, download=False, max_concurrency=1, max_per_host=4,
+                  parallel_queries=1):
+    """
+    Crawl the CORE website based on queries loaded from a JSON file and save the results.
+    Every completed page is appended to a journal. With resume, the queries continue from the last
+    completed page recorded in the journal instead of starting over.
+    With download, the PDFs of the articles are downloaded from the journal while the crawling continues,
+    with the same outcome as running core_scraper.py afterwards.
+    With parallel_queries, that many queries are crawled at the same time, up to MAX_PARALLEL_QUERIES.
+    """
+    crawl(CORE_ADAPTER, file_path, resume=resume, download=download, max_concurrency=max_concurrency,
+          max_per_host=max_per_host, parallel_queries=parallel_queries)
+
+
+def rebuild_core_results(file_path):
+    """
+    Rebuild the results JSON file from the crawl journal without sending any requests.
+    """
+    rebuild(CORE_ADAPTER, file_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record search results from CORE.")
+    parser.add_argument("--resume", action="store_true", help="continue from the last completed page of each query")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the results file from the crawl journal without crawling")
+    parser.add_argument("--download", action="store_true",
+                        help="download the PDFs while crawling instead of running core_scraper.py afterwards")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of simultaneous downloads")
+    parser.add_argument("--per-host", type=int, default=4, help="maximum number of simultaneous downloads per host")
+    parser.add_argument("--parallel-queries", type=int, default=1,
+                        help=f"number of queries crawled at the same time (at most {MAX_PARALLEL_QUERIES})")
+    parser.add_argument("--no-index", action="store_true", help="do not record the results in the corpus index")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="fetch everything in full instead of revalidating the HTTP cache")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument("--record", nargs="?", const=ARCHIVE_FILE, metavar="FILE",
+                               help="record every response to an HTTP archive (default: http_archive.db)")
+    archive_group.add_argument("--replay", nargs="?", const=ARCHIVE_FILE, metavar="FILE",
+                               help="serve the responses from an HTTP archive without sending requests or "
+                                    "waiting between them (default: http_archive.db)")
+    args = parser.parse_args()
+    if args.replay and args.download:
+        parser.error("--download cannot be combined with --replay, since PDFs are not recorded")
+
+    # Bypass the HTTP cache and the corpus index if requested.
+    if args.no_cache:
+        configure(use_cache=False)
+    if args.no_index:
+        configure_index(use_index=False)
+
+    # Record the responses to an HTTP archive or replay them from it if requested.
+    if args.record:
+        configure(archive_mode=RECORD, archive_file=args.record)
+    if args.replay:
+        if not os.path.exists(args.replay):
+            parser.error(f"no HTTP archive at {args.replay}")
+        configure(archive_mode=REPLAY, archive_file=args.replay)
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    if args.rebuild:
+        rebuild_core_results('core_queries.json')
+    else:
+        crawl_queries('core_queries.json', resume=args.resume, download=args.download,
+                      max_concurrency=args.concurrency, max_per_host=args.per_host,
+                      parallel_queries=args.parallel_queries)
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
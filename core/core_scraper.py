@@ -1,122 +1,327 @@
-import requests
-import json
-import os
-import re
-
-
-def load_json(file_path):
-    """
-    Load data from a JSON file.
-    """
-    with open(file_path, 'r') as file:
-        return json.load(file)
-
-
-def write_json(file_path, data):
-    """
-    Write data to a JSON file.
-    """
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
-
-
-def scrape_core():
-    """
-    Scrape and download PDFs from links stored in a JSON file.
-    The function handles file size limits, duplicates and retries for failed downloads.
-    """
-    # Set timeout and file size limits.
-    timeout_in_s = 20
-    max_file_size = 20 * 1024 * 1024
-
-    # Define request headers.
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                      'Chrome/58.0.3029.110 Safari/537.3'}
-
-    # Load search results from a JSON file.
-    try:
-        data = load_json("core_search_results.json")
-    except Exception as e:
-        print(f"Error loading search results: {e}")
-        return
-
-    # Set up directories for saving downloaded PDFs.
-    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    pdf_directory = os.path.join(parent_dir, "pdfs")
-    core_pdfs_directory = os.path.join(pdf_directory, "core_pdfs")
-
-    # Create PDF and core_pdfs directories, if they don't exist.
-    if not os.path.exists(pdf_directory):
-        os.makedirs(pdf_directory)
-    if not os.path.exists(core_pdfs_directory):
-        os.makedirs(core_pdfs_directory)
-
-    # Counter for all successfully downloaded PDFs.
-    total_pdfs_downloaded_count = 0
-
-    # Iterate through each query data in the JSON file.
-    for i, query_data in enumerate(data['queries_data'], start=1):
-        query_pdfs_downloaded_count = 0  # Counter for successfully downloaded PDFs per query
-        query_directory = os.path.join(core_pdfs_directory, f"query_{i}")
-
-        # Create directory for each query, if it doesn't exist.
-        if not os.path.exists(query_directory):
-            os.makedirs(query_directory)
-
-        # Iterate through each article in the query results.
-        for article in query_data['query_results']:
-            pdf_link = article.get('pdf_link')
-            # Check if the PDF link is valid.
-            if pdf_link and pdf_link.startswith('http'):
-                try:
-                    # Make the request to download the PDF.
-                    response = requests.get(pdf_link, headers=headers, timeout=timeout_in_s)
-                    # Check if the response is successful and within file size limit.
-                    if response.status_code == 200 and len(response.content) <= max_file_size:
-                        # Generate a valid filename.
-                        filename = re.sub(r'[\\/:*?"<>|]', '_', article['title']).strip() + '.pdf'
-                        filepath = os.path.join(query_directory, filename)
-
-                        # Save file if it doesn't already exist.
-                        if not os.path.exists(filepath):
-                            with open(filepath, 'wb') as file:
-                                file.write(response.content)
-                            article['pdf_downloaded'] = True
-                            query_pdfs_downloaded_count += 1
-                            total_pdfs_downloaded_count += 1
-                        else:
-                            print(f"Duplicate file skipped: {filename}")
-                            article['pdf_downloaded'] = False
-                    else:
-                        print(f"Failed to download PDF from {pdf_link}. Status Code: {response.status_code}")
-                        article['pdf_downloaded'] = False
-                except requests.exceptions.Timeout:
-                    print(f"Request timed out for {pdf_link}")
-                    article['pdf_downloaded'] = False
-                except Exception as e:
-                    print(f"Error downloading {pdf_link}: {e}")
-                    article['pdf_downloaded'] = False
-            else:
-                print(f"No valid PDF link for article: {article['title']}")
-                article['pdf_downloaded'] = False
-
-        # Add downloaded PDF count for each query.
-        if 'query_link_statistics' in query_data:
-            query_data['query_link_statistics']['downloaded_pdfs_count_query'] = query_pdfs_downloaded_count
-
-    # Reconstruct the data with pdfs_amount in the desired order.
-    updated_data = {
-        'total_queries': data['total_queries'],
-        'total_results': data['total_results'],
-        'total_pdf_links': data['total_pdf_links'],
-        'total_downloaded_pdfs': total_pdfs_downloaded_count,
-        'queries_data': data['queries_data']
-    }
-
-    # Write the results to a JSON file.
-    write_json("core_search_results_updated.json", updated_data)
-
-
-if __name__ == "__main__":
-    scrape_core()
+import argparse
+import json
+import os
+import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_index import DUPLICATE, NOT_SAVED, SAVED, get_index, record_downloads
+from corpus_index import configure as configure_index
+from http_client import SOURCE_HEADERS, configure
+from metadata_dedup import load_duplicates
+from metrics import enable, start_metrics_server, timer, write_metrics
+from pdf_downloader import download_pdfs, iter_downloads, load_dead_letters
+from pdf_store import STORE_DIRECTORY_NAME
+from result_stream import append_records, iter_records, records_to_nested
+
+
+def load_json(file_path):
+    """
+    Load data from a JSON file.
+    """
+    with timer("json_read_seconds", file=file_path):
+        with open(file_path, 'r') as file:
+            return json.load(file)
+
+
+def write_json(file_path, data):
+    """
+    Write data to a JSON file.
+    """
+    with timer("json_write_seconds", file=file_path):
+        with open(file_path, 'w') as file:
+            json.dump(data, file, indent=4)
+
+
+# Set timeout and file size limits.
+TIMEOUT_IN_S = 20
+MAX_FILE_SIZE = 20 * 1024 * 1024
+
+# Define request headers.
+HEADERS = SOURCE_HEADERS["core"]
+
+# File listing the downloads that failed for good, so that they can be tried again on their own.
+DEAD_LETTER_FILE = "core_dead_letters.json"
+
+
+def create_pdf_directories():
+    """
+    Set up the directories for saving downloaded PDFs.
+    Returns the path of the core_pdfs directory and of the content-addressed store.
+    """
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pdf_directory = os.path.join(parent_dir, "pdfs")
+    core_pdfs_directory = os.path.join(pdf_directory, "core_pdfs")
+
+    # Create PDF and core_pdfs directories, if they don't exist.
+    if not os.path.exists(pdf_directory):
+        os.makedirs(pdf_directory)
+    if not os.path.exists(core_pdfs_directory):
+        os.makedirs(core_pdfs_directory)
+
+    return core_pdfs_directory, os.path.join(pdf_directory, STORE_DIRECTORY_NAME)
+
+
+def create_download_job(article, query_directory):
+    """
+    Create the download job for an article, or return None if the article has no valid PDF link.
+    """
+    pdf_link = article.get('pdf_link')
+    # Check if the PDF link is valid.
+    if not (pdf_link and pdf_link.startswith('http')):
+        print(f"No valid PDF link for article: {article['title']}")
+        return None
+
+    # Generate a valid filename.
+    if not article['title']:
+        print(f"No title to name the PDF after: {pdf_link}")
+        return None
+    filename = re.sub(r'[\\/:*?"<>|]', '_', article['title']).strip() + '.pdf'
+    return {
+        "url": pdf_link,
+        "filepath": os.path.join(query_directory, filename)
+    }
+
+
+def scrape_core(max_concurrency=1, max_per_host=4, skip_duplicates=False):
+    """
+    Scrape and download PDFs from links stored in a JSON file.
+    The function handles file size limits, duplicates and retries for failed downloads.
+    Up to max_concurrency PDFs are downloaded at the same time, at most max_per_host of them from one host.
+    With skip_duplicates, results that metadata_dedup.py found to describe the same work as a result of
+    another source or query are not downloaded; they are marked with the result whose PDF is used instead.
+    """
+    # Load search results from a JSON file.
+    try:
+        data = load_json("core_search_results.json")
+    except Exception as e:
+        print(f"Error loading search results: {e}")
+        return
+
+    core_pdfs_directory, store_directory = create_pdf_directories()
+
+    # Leave out the results whose work is downloaded from another result.
+    duplicates = load_duplicates("core", index=get_index()) if skip_duplicates else {}
+
+    # Counter for all successfully downloaded PDFs.
+    total_pdfs_downloaded_count = 0
+
+    # Collect a download job for each article with a valid PDF link.
+    jobs = []
+    downloads = []
+    query_pdfs_downloaded_counts = []  # Counters for successfully downloaded PDFs per query
+    for i, query_data in enumerate(data['queries_data'], start=1):
+        query_pdfs_downloaded_counts.append(0)
+        query_directory = os.path.join(core_pdfs_directory, f"query_{i}")
+
+        # Create directory for each query, if it doesn't exist.
+        if not os.path.exists(query_directory):
+            os.makedirs(query_directory)
+
+        # Iterate through each article in the query results.
+        for result_index, article in enumerate(query_data['query_results']):
+            article['pdf_downloaded'] = False
+            download = {"query_index": i - 1, "result_index": result_index, "status": NOT_SAVED}
+            downloads.append(download)
+            if (i - 1, result_index) in duplicates:
+                article['duplicate_of'] = duplicates[(i - 1, result_index)]
+                download.update(status=DUPLICATE, duplicate_of=article['duplicate_of'])
+                continue
+            job = create_download_job(article, query_directory)
+            if job:
+                job.update({"query_index": i - 1, "result_index": result_index, "article": article,
+                            "download": download})
+                jobs.append(job)
+
+    # Try downloading each PDF up to 3 times, backing off between attempts.
+    file_hashes = download_pdfs(jobs, HEADERS, TIMEOUT_IN_S, MAX_FILE_SIZE, attempts=3,
+                                max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                store_directory=store_directory, dead_letter_file=DEAD_LETTER_FILE)
+    for job, file_hash in zip(jobs, file_hashes):
+        if "pdf_probe" in job:
+            job["article"]['pdf_probe'] = job["download"]["pdf_probe"] = job["pdf_probe"]
+        if file_hash:
+            job["article"]['pdf_downloaded'] = True
+            job["download"].update(status=SAVED, file_path=job["filepath"], file_hash=file_hash)
+            query_pdfs_downloaded_counts[job["query_index"]] += 1
+            total_pdfs_downloaded_count += 1
+
+    # Record the download status of each article in the corpus index.
+    record_downloads(get_index(), "core", downloads)
+
+    # Add downloaded PDF count for each query.
+    for query_data, query_pdfs_downloaded_count in zip(data['queries_data'], query_pdfs_downloaded_counts):
+        if 'query_link_statistics' in query_data:
+            query_data['query_link_statistics']['downloaded_pdfs_count_query'] = query_pdfs_downloaded_count
+
+    # Reconstruct the data with pdfs_amount in the desired order.
+    updated_data = {
+        'total_queries': data['total_queries'],
+        'total_results': data['total_results'],
+        'total_pdf_links': data['total_pdf_links'],
+        'total_downloaded_pdfs': total_pdfs_downloaded_count,
+        'queries_data': data['queries_data']
+    }
+
+    # Write the results to a JSON file.
+    write_json("core_search_results_updated.json", updated_data)
+
+
+def scrape_core_stream(follow=False, max_concurrency=1, max_per_host=4, window=100):
+    """
+    Scrape and download PDFs from the record stream of the crawler, one article at a time.
+    The updated records are written to a stream of their own, which is then converted to the updated JSON file.
+    With follow, the PDFs are downloaded while the crawler is still writing the stream.
+    """
+    core_pdfs_directory, store_directory = create_pdf_directories()
+    query_pdfs_downloaded_counts = {}
+
+    # Record the download status of the results in the corpus index after each completed page.
+    index = get_index()
+    results_counts = {}
+    downloads = []
+
+    def read_jobs():
+        for record in iter_records("core_search_results.ndjson", follow):
+            job = {"record": record}
+            if record["type"] == "result":
+                query_directory = os.path.join(core_pdfs_directory, f"query_{record['query_index'] + 1}")
+                os.makedirs(query_directory, exist_ok=True)
+                record["result"]['pdf_downloaded'] = False
+                job.update(create_download_job(record["result"], query_directory) or {})
+                result_index = results_counts.get(record["query_index"], 0)
+                results_counts[record["query_index"]] = result_index + 1
+                job.update({"query_index": record["query_index"], "result_index": result_index})
+                job["download"] = {"query_index": record["query_index"], "result_index": result_index,
+                                   "status": NOT_SAVED}
+            yield job
+
+    try:
+        with open("core_search_results_updated.ndjson", "w", encoding="utf-8") as updated_stream:
+            # Try downloading each PDF up to 3 times, backing off between attempts.
+            for job, file_hash in iter_downloads(read_jobs(), HEADERS, TIMEOUT_IN_S, MAX_FILE_SIZE, attempts=3,
+                                                 max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                                 store_directory=store_directory, window=window,
+                                                 dead_letter_file=DEAD_LETTER_FILE):
+                record = job["record"]
+                query_index = record.get("query_index")
+
+                if "pdf_probe" in job:
+                    record["result"]['pdf_probe'] = job["download"]["pdf_probe"] = job["pdf_probe"]
+                if record["type"] == "result" and file_hash:
+                    record["result"]['pdf_downloaded'] = True
+                    job["download"].update(status=SAVED, file_path=job["filepath"], file_hash=file_hash)
+                    query_pdfs_downloaded_counts[query_index] = query_pdfs_downloaded_counts.get(query_index, 0) + 1
+                elif record["type"] in ("page", "query_end"):
+                    record["query_link_statistics"]["downloaded_pdfs_count_query"] = \
+                        query_pdfs_downloaded_counts.get(query_index, 0)
+                    record_downloads(index, "core", downloads)
+                    downloads.clear()
+                if record["type"] == "result":
+                    downloads.append(job["download"])
+                append_records(updated_stream, [record], sync=False)
+            append_records(updated_stream, [{"type": "end"}])
+            record_downloads(index, "core", downloads)
+    except Exception as e:
+        print(f"Error handling search results: {e}")
+        return
+
+    # Write the results to a JSON file.
+    with timer("json_write_seconds", file="core_search_results_updated.json"):
+        records_to_nested("core_search_results_updated.ndjson", "core_search_results_updated.json", indent=4,
+                          ensure_ascii=True)
+
+
+def retry_failed_core(max_concurrency=1, max_per_host=4):
+    """
+    Try again to download the PDFs that failed for good in the last run, as listed in the dead-letter file,
+    and mark the articles whose PDF is saved now in the updated JSON file. The downloads that still fail are
+    written back to the dead-letter file.
+    """
+    dead_letters = load_dead_letters(DEAD_LETTER_FILE)
+    if not dead_letters:
+        print(f"No failed downloads listed in {DEAD_LETTER_FILE}.")
+        return
+
+    try:
+        data = load_json("core_search_results_updated.json")
+    except Exception as e:
+        print(f"Error loading updated search results: {e}")
+        return
+
+    _, store_directory = create_pdf_directories()
+
+    # Try downloading each PDF up to 3 times again, backing off between attempts.
+    file_hashes = download_pdfs(dead_letters, HEADERS, TIMEOUT_IN_S, MAX_FILE_SIZE, attempts=3,
+                                max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                store_directory=store_directory, dead_letter_file=DEAD_LETTER_FILE)
+
+    # Record the PDFs that were saved this time and the probes of the links.
+    downloads = []
+    for dead_letter, file_hash in zip(dead_letters, file_hashes):
+        if "query_index" not in dead_letter:
+            continue
+        query_data = data['queries_data'][dead_letter["query_index"]]
+        article = query_data['query_results'][dead_letter["result_index"]]
+        download = {"query_index": dead_letter["query_index"], "result_index": dead_letter["result_index"],
+                    "status": NOT_SAVED}
+        if "pdf_probe" in dead_letter:
+            article['pdf_probe'] = download["pdf_probe"] = dead_letter["pdf_probe"]
+        if file_hash:
+            article['pdf_downloaded'] = True
+            download.update(status=SAVED, file_path=dead_letter["filepath"], file_hash=file_hash)
+            if 'query_link_statistics' in query_data:
+                query_data['query_link_statistics']['downloaded_pdfs_count_query'] += 1
+            data['total_downloaded_pdfs'] = data.get('total_downloaded_pdfs', 0) + 1
+        downloads.append(download)
+    record_downloads(get_index(), "core", downloads)
+    saved_count = sum(1 for file_hash in file_hashes if file_hash)
+    print(f"{saved_count} of {len(dead_letters)} failed downloads have been saved.")
+
+    write_json("core_search_results_updated.json", data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the PDFs found by the CORE crawler.")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of simultaneous downloads")
+    parser.add_argument("--per-host", type=int, default=4, help="maximum number of simultaneous downloads per host")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the articles one at a time from core_search_results.ndjson")
+    parser.add_argument("--follow", action="store_true",
+                        help="like --stream, but keep reading while the crawler is still writing the results")
+    parser.add_argument("--skip-duplicates", action="store_true",
+                        help="do not download the results that metadata_dedup.py found in another source or query "
+                             "(not with --stream)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help=f"only try again the downloads that failed in the last run, listed in {DEAD_LETTER_FILE}")
+    parser.add_argument("--no-index", action="store_true", help="do not record the downloads in the corpus index")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="fetch everything in full instead of revalidating the HTTP cache")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    args = parser.parse_args()
+
+    # Bypass the HTTP cache and the corpus index if requested.
+    if args.no_cache:
+        configure(use_cache=False)
+    if args.no_index:
+        configure_index(use_index=False)
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    if args.retry_failed:
+        retry_failed_core(max_concurrency=args.concurrency, max_per_host=args.per_host)
+    elif args.stream or args.follow:
+        scrape_core_stream(follow=args.follow, max_concurrency=args.concurrency, max_per_host=args.per_host)
+    else:
+        scrape_core(max_concurrency=args.concurrency, max_per_host=args.per_host,
+                    skip_duplicates=args.skip_duplicates)
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+# The corpus index is kept next to the "pdfs" directory.
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+INDEX_FILE = os.path.join(ROOT_DIRECTORY, "corpus.db")
+
+# Results files of each source and how they are written, so that they can be imported and exported in the
+# layout of the crawlers and scrapers. "saved_field" is the field of a result that tells if its PDF was saved, and
+# "pdf_directory" the directory below "pdfs" its scraper saves the PDFs in.
+SOURCES = {
+    "google_scholar": {"directory": "google_scholar", "results_file": "gs_search_results.json",
+                       "updated_file": "gs_search_results_updated.json", "saved_field": "file_saved",
+                       "pdf_directory": "gs_pdfs", "indent": 2, "ensure_ascii": False},
+    "acm": {"directory": "acm", "results_file": "acm_search_results.json",
+            "updated_file": "acm_search_results_updated.json", "saved_field": "file_saved",
+            "pdf_directory": "acm_pdfs", "indent": 2, "ensure_ascii": False},
+    "core": {"directory": "core", "results_file": "core_search_results.json",
+             "updated_file": "core_search_results_updated.json", "saved_field": "pdf_downloaded",
+             "pdf_directory": "core_pdfs", "indent": 4, "ensure_ascii": True},
+}
+
+# Download status of a result: its PDF was saved, it was not saved (no link or a failed download), or it was
+# left out because its work is downloaded from another result. Results that were not scraped yet have none.
+SAVED = "saved"
+NOT_SAVED = "not_saved"
+DUPLICATE = "duplicate"
+
+# Settings of the shared index and the index itself, which is opened on first use.
+_settings = {"use_index": True, "index_file": INDEX_FILE}
+_shared = {"index": None}
+
+# Serializes the opening of the shared index.
+_shared_lock = threading.Lock()
+
+
+def open_index(index_file=INDEX_FILE):
+    """
+    Open the corpus index, creating it if it doesn't exist.
+    The index holds the queries of each source and their results with their download status, file and hash.
+    It is kept in write-ahead logging mode, so that a scraper can read it while a crawler writes to it.
+    """
+    connection = sqlite3.connect(index_file, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS queries ("
+        "source TEXT, query_index INTEGER, query_metadata TEXT, query_link_statistics TEXT, "
+        "finished INTEGER DEFAULT 0, PRIMARY KEY (source, query_index))"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "source TEXT, query_index INTEGER, result_index INTEGER, title TEXT, result TEXT, download_status TEXT, "
+        "duplicate_of TEXT, file_path TEXT, file_hash TEXT, file_deleted INTEGER DEFAULT 0, pdf_probe TEXT, "
+        "download_failed INTEGER DEFAULT 0, PRIMARY KEY (source, query_index, result_index))"
+    )
+    # Indexes created before the PDF links were probed lack the column of the probes.
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(results)")]
+    if "pdf_probe" not in columns:
+        connection.execute("ALTER TABLE results ADD COLUMN pdf_probe TEXT")
+    # Neither do indexes created before failed downloads were remembered.
+    if "download_failed" not in columns:
+        connection.execute("ALTER TABLE results ADD COLUMN download_failed INTEGER DEFAULT 0")
+    connection.execute("CREATE INDEX IF NOT EXISTS results_query ON results (query_index, download_status)")
+    connection.execute("CREATE INDEX IF NOT EXISTS results_file_hash ON results (file_hash) "
+                       "WHERE file_hash IS NOT NULL")
+    connection.execute("CREATE INDEX IF NOT EXISTS results_file_path ON results (file_path) "
+                       "WHERE file_path IS NOT NULL")
+    connection.commit()
+    return {"connection": connection, "lock": threading.Lock()}
+
+
+def configure(use_index=None, index_file=None):
+    """
+    Change the settings of the shared index. It is opened anew with them on its next use.
+    """
+    with _shared_lock:
+        if use_index is not None:
+            _settings["use_index"] = use_index
+        if index_file is not None:
+            _settings["index_file"] = index_file
+        _shared["index"] = None
+
+
+def get_index():
+    """
+    Return the shared corpus index, opening it if necessary, or None if the index is turned off.
+    """
+    with _shared_lock:
+        if not _settings["use_index"]:
+            return None
+        if _shared["index"] is None:
+            _shared["index"] = open_index(_settings["index_file"])
+        return _shared["index"]
+
+
+def record_query(index, source, query_index, query_metadata, keep_results=False):
+    """
+    Record a query that is crawled from its first page and drop the results of an earlier crawl of it.
+    With keep_results, the query continues an earlier crawl and its recorded results are kept.
+    """
+    if index is None:
+        return
+    with index["lock"], index["connection"] as connection:
+        connection.execute(
+            "INSERT INTO queries (source, query_index, query_metadata, query_link_statistics) VALUES (?, ?, ?, '{}') "
+            "ON CONFLICT (source, query_index) DO UPDATE SET query_metadata = excluded.query_metadata, "
+            "query_link_statistics = '{}', finished = 0",
+            (source, query_index, json.dumps(query_metadata, ensure_ascii=False))
+        )
+        if not keep_results:
+            connection.execute("DELETE FROM results WHERE source = ? AND query_index = ?", (source, query_index))
+
+
+def record_page(index, source, query_index, first_result_index, results, query_link_statistics):
+    """
+    Record a page of results of a query, numbered from first_result_index, and the query's link statistics.
+    A result that is already recorded keeps its download status unless it changed.
+    """
+    if index is None:
+        return
+    rows = [(source, query_index, result_index, result.get("title"), json.dumps(result, ensure_ascii=False))
+            for result_index, result in enumerate(results, start=first_result_index)]
+    with index["lock"], index["connection"] as connection:
+        connection.executemany(
+            "INSERT INTO results (source, query_index, result_index, title, result) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (source, query_index, result_index) DO UPDATE SET title = excluded.title, "
+            "result = excluded.result, download_status = NULL, duplicate_of = NULL, file_path = NULL, "
+            "file_hash = NULL, file_deleted = 0, pdf_probe = NULL, download_failed = 0 WHERE result != excluded.result",
+            rows
+        )
+        connection.execute(
+            "UPDATE queries SET query_link_statistics = ? WHERE source = ? AND query_index = ?",
+            (json.dumps(query_link_statistics), source, query_index)
+        )
+
+
+def record_query_end(index, source, query_index, query_metadata, query_link_statistics):
+    """
+    Record that a query has been crawled completely.
+    """
+    if index is None:
+        return
+    with index["lock"], index["connection"] as connection:
+        connection.execute(
+            "INSERT INTO queries (source, query_index, query_metadata, query_link_statistics, finished) "
+            "VALUES (?, ?, ?, ?, 1) ON CONFLICT (source, query_index) DO UPDATE SET "
+            "query_metadata = excluded.query_metadata, query_link_statistics = excluded.query_link_statistics, "
+            "finished = 1",
+            (source, query_index, json.dumps(query_metadata, ensure_ascii=False), json.dumps(query_link_statistics))
+        )
+
+
+def prune_queries(index, source, queries_count):
+    """
+    Remove the queries of a source, and their results, that are beyond the end of its queries file.
+    """
+    if index is None:
+        return
+    with index["lock"], index["connection"] as connection:
+        connection.execute("DELETE FROM queries WHERE source = ? AND query_index >= ?", (source, queries_count))
+        connection.execute("DELETE FROM results WHERE source = ? AND query_index >= ?", (source, queries_count))
+
+
+def record_downloads(index, source, downloads):
+    """
+    Record the download outcome of results of a source. Each download is a dictionary with the query_index
+    and result_index of the result, its status and, where there is one, the result it duplicates, the path
+    and SHA-256 hash of its file and the probe of its PDF link.
+    A result whose download failed stays marked as failed until it is saved, even once it is recorded as a
+    duplicate of another result later on.
+    """
+    if index is None or not downloads:
+        return
+    rows = [(download["status"],
+             json.dumps(download["duplicate_of"]) if download.get("duplicate_of") else None,
+             os.path.abspath(download["file_path"]) if download.get("file_path") else None,
+             download.get("file_hash"),
+             {SAVED: 0, NOT_SAVED: 1}.get(download["status"]),
+             json.dumps(download["pdf_probe"]) if download.get("pdf_probe") else None,
+             source, download["query_index"], download["result_index"])
+            for download in downloads]
+    with index["lock"], index["connection"] as connection:
+        connection.executemany(
+            "UPDATE results SET download_status = ?, duplicate_of = ?, file_path = ?, file_hash = ?, "
+            "download_failed = COALESCE(?, download_failed), "
+            "pdf_probe = ?, file_deleted = 0 WHERE source = ? AND query_index = ? AND result_index = ?",
+            rows
+        )
+
+
+def mark_deleted(index, filepaths):
+    """
+    Record that the given files were deleted as duplicates of other files.
+    """
+    if index is None or not filepaths:
+        return
+    with index["lock"], index["connection"] as connection:
+        connection.executemany("UPDATE results SET file_deleted = 1 WHERE file_path = ?",
+                               [(os.path.abspath(filepath),) for filepath in filepaths])
+
+
+def import_results(index, source, queries_results):
+    """
+    Replace the queries and results of a source with those of a results JSON file.
+    The download status is taken over from the fields the scraper of the source adds to its updated file.
+    """
+    saved_field = SOURCES[source]["saved_field"]
+    query_rows = []
+    result_rows = []
+    for query_index, query_data in enumerate(queries_results["queries_data"]):
+        query_link_statistics = dict(query_data["query_link_statistics"])
+        query_link_statistics.pop("downloaded_pdfs_count_query", None)
+        query_rows.append((source, query_index, json.dumps(query_data["query_metadata"], ensure_ascii=False),
+                           json.dumps(query_link_statistics)))
+
+        for result_index, result in enumerate(query_data["query_results"]):
+            result = dict(result)
+            saved = result.pop(saved_field, None)
+            duplicate_of = result.pop("duplicate_of", None)
+            pdf_probe = result.pop("pdf_probe", None)
+            if duplicate_of:
+                status = DUPLICATE
+            elif saved is not None:
+                status = SAVED if saved else NOT_SAVED
+            else:
+                status = None
+            result_rows.append((source, query_index, result_index, result.get("title"),
+                                json.dumps(result, ensure_ascii=False), status, int(status == NOT_SAVED),
+                                json.dumps(duplicate_of) if duplicate_of else None,
+                                json.dumps(pdf_probe) if pdf_probe else None))
+
+    with index["lock"], index["connection"] as connection:
+        connection.execute("DELETE FROM queries WHERE source = ?", (source,))
+        connection.execute("DELETE FROM results WHERE source = ?", (source,))
+        connection.executemany("INSERT INTO queries (source, query_index, query_metadata, query_link_statistics, "
+                               "finished) VALUES (?, ?, ?, ?, 1)", query_rows)
+        connection.executemany("INSERT INTO results (source, query_index, result_index, title, result, "
+                               "download_status, download_failed, duplicate_of, pdf_probe) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               result_rows)
+    return len(result_rows)
+
+
+def export_results(index, source, updated=False):
+    """
+    Return the queries and results of a source in the layout of its results JSON file or, with updated, of
+    the updated file its scraper writes.
+    """
+    saved_field = SOURCES[source]["saved_field"]
+    connection = index["connection"]
+    with index["lock"]:
+        query_rows = connection.execute(
+            "SELECT query_index, query_metadata, query_link_statistics FROM queries WHERE source = ? "
+            "ORDER BY query_index", (source,)
+        ).fetchall()
+        result_rows = connection.execute(
+            "SELECT query_index, result, download_status, duplicate_of, pdf_probe FROM results WHERE source = ? "
+            "ORDER BY query_index, result_index", (source,)
+        ).fetchall()
+
+    queries_data = {}
+    for query_index, query_metadata, query_link_statistics in query_rows:
+        queries_data[query_index] = {
+            "query_metadata": json.loads(query_metadata),
+            "query_link_statistics": json.loads(query_link_statistics),
+            "query_results": [],
+        }
+        if updated:
+            queries_data[query_index]["query_link_statistics"]["downloaded_pdfs_count_query"] = 0
+
+    for query_index, result, download_status, duplicate_of, pdf_probe in result_rows:
+        result = json.loads(result)
+        if updated:
+            result[saved_field] = download_status == SAVED
+            if duplicate_of:
+                result["duplicate_of"] = json.loads(duplicate_of)
+            if pdf_probe:
+                result["pdf_probe"] = json.loads(pdf_probe)
+            if download_status == SAVED:
+                queries_data[query_index]["query_link_statistics"]["downloaded_pdfs_count_query"] += 1
+        queries_data[query_index]["query_results"].append(result)
+
+    statistics = [query_data["query_link_statistics"] for query_data in queries_data.values()]
+    queries_results = {
+        "total_queries": len(queries_data),
+        "total_results": sum(query_statistics.get("total_results_query", 0) for query_statistics in statistics),
+        "total_pdf_links": sum(query_statistics.get("total_pdf_links_query", 0) for query_statistics in statistics),
+    }
+    if updated:
+        queries_results["total_downloaded_pdfs"] = sum(query_statistics["downloaded_pdfs_count_query"]
+                                                       for query_statistics in statistics)
+    queries_results["queries_data"] = list(queries_data.values())
+    return queries_results
+
+
+def find_results(index, source=None, query_index=None, status=None, title=None, file_hash=None, limit=None):
+    """
+    Return the results that match all of the given conditions, in the order of their source, query and
+    position. The title condition matches titles that contain the given text, ignoring case.
+    """
+    conditions = []
+    parameters = []
+    for column, value in (("source", source), ("query_index", query_index), ("download_status", status),
+                          ("file_hash", file_hash)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    if title is not None:
+        conditions.append("title LIKE ?")
+        parameters.append(f"%{title}%")
+
+    sql = ("SELECT source, query_index, result_index, title, download_status, duplicate_of, file_path, file_hash, "
+           "file_deleted, download_failed FROM results")
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY source, query_index, result_index"
+    if limit is not None:
+        sql += " LIMIT ?"
+        parameters.append(limit)
+
+    columns = ("source", "query_index", "result_index", "title", "download_status", "duplicate_of", "file_path",
+               "file_hash", "file_deleted", "download_failed")
+    with index["lock"]:
+        rows = index["connection"].execute(sql, parameters).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def statistics(index):
+    """
+    Count the queries, results and results of each download status of each source.
+    """
+    counts = {}
+    with index["lock"]:
+        for source, queries_count in index["connection"].execute(
+                "SELECT source, COUNT(*) FROM queries GROUP BY source ORDER BY source"):
+            counts[source] = {"queries": queries_count, "results": 0}
+        for source, download_status, results_count in index["connection"].execute(
+                "SELECT source, download_status, COUNT(*) FROM results GROUP BY source, download_status"):
+            source_counts = counts.setdefault(source, {"queries": 0, "results": 0})
+            source_counts["results"] += results_count
+            source_counts[download_status or "not_scraped"] = results_count
+    return counts
+
+
+def import_files(index, root_directory=ROOT_DIRECTORY):
+    """
+    Import the results files of all sources, preferring the updated file of a source where its scraper wrote one.
+    """
+    for source, source_files in SOURCES.items():
+        for file_name in (source_files["updated_file"], source_files["results_file"]):
+            path = os.path.join(root_directory, source_files["directory"], file_name)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as json_file:
+                    results_count = import_results(index, source, json.load(json_file))
+                print(f"Imported {results_count} results of {source} from {path}.")
+                break
+        else:
+            print(f"No results file for {source}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the corpus index of all sources, or import and export "
+                                                 "its results files.")
+    parser.add_argument("--index", default=INDEX_FILE, help="path of the corpus index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("import", help="load the results files of all sources into the index")
+    subparsers.add_parser("stats", help="count the queries and results of each source")
+    query_parser = subparsers.add_parser("query", help="list the results that match all given conditions")
+    query_parser.add_argument("--source", choices=SOURCES)
+    query_parser.add_argument("--query", type=int, help="number of the query, counted from 1 like the PDF directories")
+    query_parser.add_argument("--status", choices=(SAVED, NOT_SAVED, DUPLICATE), help="download status")
+    query_parser.add_argument("--title", help="text the title contains")
+    query_parser.add_argument("--hash", help="SHA-256 hash of the saved file")
+    query_parser.add_argument("--limit", type=int, help="maximum number of results listed")
+    export_parser = subparsers.add_parser("export", help="write the results of a source in the layout of its "
+                                                         "results file")
+    export_parser.add_argument("source", choices=SOURCES)
+    export_parser.add_argument("--updated", action="store_true",
+                               help="include the download status, like the updated file of the scraper")
+    export_parser.add_argument("--output", help="path of the JSON file (default: the source's file name)")
+    args = parser.parse_args()
+    if args.command == "query" and args.query is not None and args.query < 1:
+        query_parser.error("--query is counted from 1")
+
+    corpus_index = open_index(args.index)
+
+    if args.command == "import":
+        import_files(corpus_index)
+    elif args.command == "stats":
+        for source_name, source_counts in statistics(corpus_index).items():
+            print(f"{source_name}: " + ", ".join(f"{count} {name}" for name, count in source_counts.items()))
+    elif args.command == "query":
+        query_index = args.query - 1 if args.query is not None else None
+        matches = find_results(corpus_index, args.source, query_index, args.status, args.title, args.hash, args.limit)
+        for match in matches:
+            print(f"{match['source']:<15} query {match['query_index'] + 1:<4} result {match['result_index'] + 1:<4} "
+                  f"{match['download_status'] or '-':<10} {match['title']}")
+            if match["file_path"]:
+                print(f"{'':<15} {'deleted duplicate ' if match['file_deleted'] else ''}{match['file_path']}")
+        print(f"{len(matches)} results found.")
+    else:
+        source_format = SOURCES[args.source]
+        output = args.output or (source_format["updated_file"] if args.updated else source_format["results_file"])
+        with open(output, "w", encoding="utf-8") as output_file:
+            json.dump(export_results(corpus_index, args.source, args.updated), output_file,
+                      ensure_ascii=source_format["ensure_ascii"], indent=source_format["indent"])
+        print(f"The results of {args.source} have been exported to {output}.")
@@ -0,0 +1,137 @@
+import os
+import threading
+
+from result_stream import append_records, iter_records, remove_end_record
+
+# Serializes the writes to the journals, so that the records of queries crawled at the same time do not mix
+# within a line.
+_journal_lock = threading.Lock()
+
+
+def _append(journal, records):
+    """
+    Append records to a journal, one writer at a time.
+    """
+    with _journal_lock:
+        append_records(journal, records)
+
+
+def load_journal(journal_path):
+    """
+    Read a crawl journal and return the recorded state of each query, keyed by the query's index.
+    Each state holds the query's results so far, the page parameter of the next page to fetch, the link
+    statistics and whether the query was finished. Results of a page that was not completed are ignored.
+    """
+    query_states = {}
+    pending_results = {}
+
+    if not os.path.exists(journal_path):
+        return query_states
+
+    for record in iter_records(journal_path):
+        query_index = record["query_index"]
+        query_state = query_states.setdefault(query_index, {
+            "results": [],
+            "next_page": None,
+            "query_link_statistics": {},
+            "query_metadata": None,
+            "finished": False
+        })
+
+        if record["type"] == "result":
+            pending_results.setdefault(query_index, []).append(record["result"])
+        elif record["type"] in ("page", "query_end"):
+            # The results of a page count once the page is complete.
+            query_state["results"].extend(pending_results.pop(query_index, []))
+            query_state["query_link_statistics"] = record["query_link_statistics"]
+            if record["type"] == "page":
+                query_state["next_page"] = record["next_page"]
+            else:
+                query_state["finished"] = True
+                query_state["query_metadata"] = record["query_metadata"]
+
+    return query_states
+
+
+def open_journal(journal_path, resume=False):
+    """
+    Open a crawl journal for appending and return it together with the recorded query states.
+    Without resume the journal is started afresh. With resume, its "end" record and an incomplete last line
+    left by a crash are removed first.
+    """
+    if resume:
+        query_states = load_journal(journal_path)
+        remove_end_record(journal_path)
+    else:
+        query_states = {}
+    journal = open(journal_path, "a" if resume else "w", encoding="utf-8")
+    return journal, query_states
+
+
+def start_query(journal, query_index, query_metadata):
+    """
+    Record that the crawling of a query begins.
+    """
+    _append(journal, [{"type": "query", "query_index": query_index, "query_metadata": query_metadata}])
+
+
+def append_page(journal, query_index, next_page, results, query_link_statistics):
+    """
+    Record the results of a completed page, the page parameter to continue with and the statistics so far.
+    """
+    records = [{"type": "result", "query_index": query_index, "result": result} for result in results]
+    records.append({
+        "type": "page",
+        "query_index": query_index,
+        "next_page": next_page,
+        "query_link_statistics": query_link_statistics
+    })
+    _append(journal, records)
+
+
+def finish_query(journal, query_index, query_metadata, query_link_statistics):
+    """
+    Record that a query has been crawled completely.
+    """
+    _append(journal, [{
+        "type": "query_end",
+        "query_index": query_index,
+        "query_metadata": query_metadata,
+        "query_link_statistics": query_link_statistics
+    }])
+
+
+def close_journal(journal):
+    """
+    Mark the journal as complete and close it.
+    """
+    _append(journal, [{"type": "end"}])
+    journal.close()
+
+
+def rebuild_results(journal_path, queries):
+    """
+    Rebuild the query results of a crawl from its journal without fetching anything.
+    Queries that were not finished keep the metadata from the queries file.
+    """
+    query_states = load_journal(journal_path)
+    queries_data = []
+    total_results = 0
+    total_pdf_links = 0
+
+    for query_index in sorted(query_states):
+        query_state = query_states[query_index]
+        queries_data.append({
+            "query_metadata": query_state["query_metadata"] or queries[query_index],
+            "query_link_statistics": query_state["query_link_statistics"],
+            "query_results": query_state["results"]
+        })
+        total_results += query_state["query_link_statistics"].get("total_results_query", 0)
+        total_pdf_links += query_state["query_link_statistics"].get("total_pdf_links_query", 0)
+
+    return {
+        "total_queries": len(queries_data),
+        "total_results": total_results,
+        "total_pdf_links": total_pdf_links,
+        "queries_data": queries_data
+    }
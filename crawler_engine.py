@@ -0,0 +1,248 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from corpus_index import get_index, import_results, prune_queries, record_page, record_query, record_query_end
+from crawl_journal import (append_page, close_journal, finish_query, open_journal, rebuild_results,
+                           start_query)
+from http_client import ensure_pool_size
+from metrics import increment, timer
+from rate_limiter import configure_host, get_host, record_throttled, throttled_get
+
+# Number of times in a row a page is requested again after its connection timed out, like a throttled request.
+CONNECT_TIMEOUT_RETRIES = 3
+
+# A source is crawled through an adapter, a dictionary that holds what differs between the sources:
+#   "name": name of the source in the request headers and the metrics.
+#   "journal_file", "results_file": names of the crawl journal and of the results JSON file.
+#   "encoding", "indent", "ensure_ascii": how the queries file is read and the results file is written.
+#   "headers", "request_rate", "max_request_rate": request headers and requests per second at first and at most.
+#   "max_parallel_queries": budget of queries that may be crawled at the same time.
+#   "first_page": function that returns the page parameter of the first page of a query.
+#   "page_step": difference between the page parameters of two consecutive pages.
+#   "page_request": function that returns the URL and query parameters of a page of a query.
+#   "parse_page": function that returns the results of a page from its HTML.
+#   "has_pdf_link": function that checks if a result has a link to a PDF.
+#   "scrape_stream": function of the scraper that downloads the PDFs from the journal.
+
+
+def load_queries(queries_file, encoding=None):
+    """
+    Import the queries from a JSON file.
+    """
+    with open(queries_file, "r", encoding=encoding) as json_file:
+        return json.load(json_file)
+
+
+def write_results(adapter, queries_results):
+    """
+    Write the query results to the results JSON file of a source.
+    """
+    with timer("json_write_seconds", file=adapter["results_file"]):
+        with open(adapter["results_file"], "w", encoding=adapter["encoding"]) as json_file:
+            json.dump(queries_results, json_file, ensure_ascii=adapter["ensure_ascii"], indent=adapter["indent"])
+
+
+def link_statistics(adapter, results):
+    """
+    Count the results of a query and those with a link to a PDF.
+    """
+    return {
+        'total_results_query': len(results),
+        'total_pdf_links_query': sum(1 for result in results if adapter["has_pdf_link"](result)),
+    }
+
+
+def compile_results(queries_data):
+    """
+    Add up the link statistics of the queries and compile them with the query data.
+    """
+    return {
+        "total_queries": len(queries_data),
+        "total_results": sum(query_data["query_link_statistics"]["total_results_query"]
+                             for query_data in queries_data),
+        "total_pdf_links": sum(query_data["query_link_statistics"]["total_pdf_links_query"]
+                               for query_data in queries_data),
+        "queries_data": queries_data
+    }
+
+
+def crawl_query(adapter, journal, query_index, query, query_state=None, index=None):
+    """
+    Fetch the pages of a query until its maximum number of items is reached or a page has no results, and
+    return the query data. A query that was finished in a previous run is taken over from its journal state,
+    and one that was interrupted continues after its last completed page.
+    A query that stops because of a request error or connections that keep timing out is not marked as
+    finished, so that it can be resumed.
+    Every completed page is also recorded in the corpus index, if one is given.
+    """
+    # Bring the corpus index up to date with the pages of a previous run.
+    if query_state:
+        record_query(index, adapter["name"], query_index, query_state["query_metadata"] or query, keep_results=True)
+        record_page(index, adapter["name"], query_index, 0, query_state["results"],
+                    query_state["query_link_statistics"])
+
+    # Take over queries that were finished in a previous run.
+    if query_state and query_state["finished"]:
+        record_query_end(index, adapter["name"], query_index, query_state["query_metadata"],
+                         query_state["query_link_statistics"])
+        return {
+            "query_metadata": query_state["query_metadata"],
+            "query_link_statistics": query_state["query_link_statistics"],
+            "query_results": query_state["results"],
+        }
+
+    # Set up the data structure to store query results.
+    query_data = {
+        "query_metadata": query,
+        "query_link_statistics": {},
+        "query_results": [],
+    }
+    results = query_data["query_results"]
+    max_items = query["max_items"]
+    page = adapter["first_page"](query)
+
+    # Record the start of the query in the journal.
+    if not query_state:
+        start_query(journal, query_index, query)
+        record_query(index, adapter["name"], query_index, query)
+
+    # Continue after the last completed page of a previous run.
+    if query_state and query_state["next_page"] is not None:
+        results.extend(query_state["results"])
+        page = query_state["next_page"]
+
+    # The query is finished unless the crawling stops because of an error.
+    query_finished = True
+    connect_timeouts = 0
+
+    # Fetch pages until the maximum of recorded items is reached.
+    while len(results) < max_items:
+        url, params = adapter["page_request"](query, page)
+        configure_host(url, adapter["request_rate"], adapter["max_request_rate"])
+        try:
+            response = throttled_get(url, headers=adapter["headers"], params=params)
+            response.raise_for_status()
+        except requests.exceptions.ConnectTimeout:
+            record_throttled(url)
+            if connect_timeouts == CONNECT_TIMEOUT_RETRIES:
+                print(f"Connection to {get_host(url)} timed out {connect_timeouts + 1} times. Stopping the query.")
+                query_finished = False
+                break
+            print("Connection timed out. Trying again...")
+            increment("http_retries_total", host=get_host(url), reason="timeout")
+            connect_timeouts += 1
+            continue
+        except requests.exceptions.HTTPError as e:
+            print(f"HTTP error occurred: {e}")
+            query_finished = False
+            break
+        except requests.exceptions.RequestException as e:
+            print(f"Error during requests to {url}: {e}")
+            query_finished = False
+            break
+        connect_timeouts = 0
+
+        # Check if the end of the search results is reached.
+        with timer("parse_seconds", source=adapter["name"]):
+            page_results = adapter["parse_page"](response.text, page)
+        increment("pages_total", source=adapter["name"])
+        if not page_results:
+            print("No more results for this query.")
+            break
+
+        page_results = page_results[:max_items - len(results)]
+        first_result_index = len(results)
+        results.extend(page_results)
+        increment("results_total", len(page_results), source=adapter["name"])
+        for result in page_results:
+            # Print the title of each recorded document.
+            print(f"Document recorded: {result['title']}")
+
+        # Record the completed page in the journal.
+        page += adapter["page_step"]
+        query_link_statistics = link_statistics(adapter, results)
+        append_page(journal, query_index, page, page_results, query_link_statistics)
+        record_page(index, adapter["name"], query_index, first_result_index, page_results, query_link_statistics)
+
+    # Store link statistics.
+    query_data["query_link_statistics"] = link_statistics(adapter, results)
+    if query_finished:
+        finish_query(journal, query_index, query, query_data["query_link_statistics"])
+        record_query_end(index, adapter["name"], query_index, query, query_data["query_link_statistics"])
+    return query_data
+
+
+def crawl(adapter, queries_file, resume=False, download=False, max_concurrency=1, max_per_host=4,
+          parallel_queries=1):
+    """
+    Crawl the queries of a queries file through the adapter of a source and write the results to its JSON file.
+    With parallel_queries, up to that many queries, but no more than the budget of the source, are crawled at
+    the same time, so their pages are fetched interleaved. The pages of each query are still fetched in order,
+    so the results are the same as when the queries are crawled one after another.
+    Every completed page is appended to a journal and recorded in the corpus index. With resume, the queries continue from the last
+    completed page recorded in the journal instead of starting over.
+    With download, the PDFs of the results are downloaded from the journal while the crawling continues,
+    with the same outcome as running the scraper of the source afterwards.
+    """
+    # Load the queries from a JSON file.
+    try:
+        queries = load_queries(queries_file, adapter["encoding"])
+    except Exception as e:
+        print(f"Error loading queries: {e}")
+        return
+
+    # Open the journal of completed pages and the corpus index.
+    journal, query_states = open_journal(adapter["journal_file"], resume)
+    index = get_index()
+    prune_queries(index, adapter["name"], len(queries))
+
+    # Download the PDFs of completed pages while crawling.
+    if download:
+        download_thread = threading.Thread(target=adapter["scrape_stream"], daemon=True, kwargs={
+            "follow": True, "max_concurrency": max_concurrency, "max_per_host": max_per_host})
+        download_thread.start()
+
+    # Crawl the queries, keeping the results in the order of the queries file.
+    # The journal is closed even if a query fails, so that the download thread stops following it, and the
+    # remaining downloads are waited for before the interpreter exits.
+    parallel_queries = max(1, min(parallel_queries, adapter["max_parallel_queries"]))
+    ensure_pool_size(parallel_queries)
+    try:
+        with ThreadPoolExecutor(max_workers=parallel_queries) as executor:
+            queries_data = list(executor.map(
+                lambda query_index: crawl_query(adapter, journal, query_index, queries[query_index],
+                                                query_states.get(query_index), index),
+                range(len(queries))
+            ))
+    finally:
+        close_journal(journal)
+        if download:
+            download_thread.join()
+
+    # Compile query results and save them to a JSON file.
+    try:
+        write_results(adapter, compile_results(queries_data))
+        print(f"The query results have been saved to {adapter['results_file']}.")
+    except Exception as e:
+        print(f"Error saving query results: {e}")
+
+
+def rebuild(adapter, queries_file):
+    """
+    Rebuild the results JSON file of a source, and its queries in the corpus index, from its crawl journal
+    without sending any requests.
+    """
+    try:
+        queries = load_queries(queries_file, adapter["encoding"])
+        queries_results = rebuild_results(adapter["journal_file"], queries)
+        queries_results["total_queries"] = len(queries)
+        write_results(adapter, queries_results)
+        index = get_index()
+        if index is not None:
+            import_results(index, adapter["name"], queries_results)
+        print(f"The query results have been rebuilt from {adapter['journal_file']}.")
+    except Exception as e:
+        print(f"Error rebuilding query results: {e}")
@@ -1,90 +1,324 @@
-import os
-import hashlib
-import json
-
-
-def calculate_hash(filepath):
-    """
-    Calculate the SHA-256 hash of the file.
-    """
-    sha256_hash = hashlib.sha256()
-    with open(filepath, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
-
-
-def remove_duplicates(directory):
-    """
-    Remove duplicate PDFs and record their information.
-    """
-    records = {}
-    directory_info = {}
-    total_original_count = 0
-    total_deleted_count = 0
-    total_remaining_count = 0
-
-    for root, dirs, files in os.walk(directory):
-        pdf_files = [file for file in files if file.endswith(".pdf")]
-        total_files = len(pdf_files)
-        deleted_files = []
-
-        for file in pdf_files:
-            filepath = os.path.join(root, file)
-            file_hash = calculate_hash(filepath)
-
-            # Check for duplicates.
-            if file in records and records[file] == file_hash:
-                # Record the deleted file's info.
-                deleted_file_info = {
-                    "file_name": file,
-                    "file_path": os.path.relpath(filepath, start=directory)
-                }
-                deleted_files.append(deleted_file_info)
-
-                # Delete the file.
-                print(f"Deleting duplicate file: {filepath}")
-                os.remove(filepath)
-            else:
-                records[file] = file_hash
-
-        if total_files > 0:
-            dir_key = os.path.relpath(root, start=directory)
-            directory_info[dir_key] = {
-                "original_count": total_files,
-                "deleted_count": len(deleted_files),
-                "remaining_count": total_files - len(deleted_files),
-                "deleted_files": deleted_files
-            }
-            total_original_count += total_files
-            total_deleted_count += len(deleted_files)
-            total_remaining_count += total_files - len(deleted_files)
-
-    return directory_info, total_original_count, total_deleted_count, total_remaining_count
-
-
-def save_to_json(data, filename):
-    """Save the data to a JSON file."""
-    with open(filename, "w") as f:
-        json.dump(data, f, indent=4)
-
-
-# Directory containing the PDFs.
-pdf_directory = "pdfs"
-
-# Remove duplicates and get info about directories.
-directories_info, total_original, total_deleted, total_remaining = remove_duplicates(pdf_directory)
-
-# Prepare JSON structure.
-json_data = {
-    "total_original_count": total_original,
-    "total_deleted_count": total_deleted,
-    "total_remaining_count": total_remaining,
-    "directories": directories_info
-}
-
-# Save to JSON file.
-json_filename = "deleted_pdfs_record.json"
-save_to_json(json_data, json_filename)
-
-print(f"Record of deleted files saved to {json_filename}")
+import argparse
+import contextlib
+import os
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from corpus_index import get_index, mark_deleted
+from hash_cache import evict_missing, lookup_hashes, open_cache, store_hashes, verify_cache
+from metrics import enable, increment, start_metrics_server, timer, write_metrics
+from near_duplicates import NEAR_DUPLICATE_SIMILARITY, find_near_duplicates
+from pdf_store import STORE_DIRECTORY_NAME
+
+# Number of bytes read from the start and the end of a file for its partial hash.
+PARTIAL_HASH_BLOCK_SIZE = 64 * 1024
+
+# Number of bytes read at a time when calculating the full hash of a file.
+FULL_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def calculate_hash(filepath):
+    """
+    Calculate the SHA-256 hash of the file.
+    """
+    sha256_hash = hashlib.sha256()
+    size = 0
+    with timer("hash_seconds", kind="full_hash"):
+        with open(filepath, "rb") as f:
+            for byte_block in iter(lambda: f.read(FULL_HASH_BLOCK_SIZE), b""):
+                sha256_hash.update(byte_block)
+                size += len(byte_block)
+    increment("hashed_bytes_total", size, kind="full_hash")
+    return sha256_hash.hexdigest()
+
+
+def calculate_partial_hash(filepath, size):
+    """
+    Calculate the SHA-256 hash of the first and the last block of the file.
+    """
+    sha256_hash = hashlib.sha256()
+    with timer("hash_seconds", kind="partial_hash"):
+        with open(filepath, "rb") as f:
+            sha256_hash.update(f.read(PARTIAL_HASH_BLOCK_SIZE))
+            if size > PARTIAL_HASH_BLOCK_SIZE:
+                f.seek(max(size - PARTIAL_HASH_BLOCK_SIZE, PARTIAL_HASH_BLOCK_SIZE))
+                sha256_hash.update(f.read(PARTIAL_HASH_BLOCK_SIZE))
+    increment("hashed_bytes_total", min(size, 2 * PARTIAL_HASH_BLOCK_SIZE), kind="partial_hash")
+    return sha256_hash.hexdigest()
+
+
+def collect_pdf_files(directory):
+    """
+    Collect the PDFs below the directory in a fixed order, grouped by the directory they are in.
+    Returns a list of (directory path, [(file name, file path, file status)]) tuples.
+    """
+    pdf_directories = []
+
+    for root, dirs, files in os.walk(directory):
+        # The content-addressed store only holds the files the query directories link to.
+        if root == directory and STORE_DIRECTORY_NAME in dirs:
+            dirs.remove(STORE_DIRECTORY_NAME)
+        dirs.sort()
+
+        pdf_files = []
+        for file in sorted(files):
+            if file.endswith(".pdf"):
+                filepath = os.path.join(root, file)
+                pdf_files.append((file, filepath, os.stat(filepath)))
+        pdf_directories.append((root, pdf_files))
+
+    return pdf_directories
+
+
+def hash_files(hash_function, arguments, jobs=1, description="Hashing"):
+    """
+    Apply a hash function to each tuple of arguments and return the results in the same order.
+    With more than one job the files are hashed in a thread pool; hashlib releases the GIL while hashing,
+    so the threads run in parallel. A progress counter is printed while hashing.
+    """
+    total = len(arguments)
+    if total == 0:
+        return []
+
+    hashes = []
+    with ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else contextlib.nullcontext() as executor:
+        if executor:
+            results = executor.map(hash_function, *zip(*arguments))
+        else:
+            results = (hash_function(*argument) for argument in arguments)
+
+        for file_hash in results:
+            hashes.append(file_hash)
+            if len(hashes) % 100 == 0 or len(hashes) == total:
+                print(f"\r{description}: {len(hashes)}/{total} files", end="", flush=True)
+    print()
+
+    return hashes
+
+
+def hash_files_cached(cache, column, hash_function, filepaths, stats, arguments, jobs=1, description="Hashing"):
+    """
+    Like hash_files(), but take the hashes of unchanged files from the hash cache and store the new ones in it.
+    The column names the kind of hash in the cache ("partial_hash" or "full_hash").
+    """
+    if cache is None:
+        return hash_files(hash_function, arguments, jobs, description)
+
+    cached_hashes = lookup_hashes(cache, filepaths, stats, column)
+    increment("hash_cache_hits_total", len(cached_hashes), kind=column)
+    missing = [index for index, filepath in enumerate(filepaths) if filepath not in cached_hashes]
+    new_hashes = hash_files(hash_function, [arguments[index] for index in missing], jobs, description)
+    store_hashes(cache, [filepaths[index] for index in missing], [stats[index] for index in missing], column,
+                 new_hashes)
+    cached_hashes.update(zip((filepaths[index] for index in missing), new_hashes))
+
+    return [cached_hashes[filepath] for filepath in filepaths]
+
+
+def find_duplicates(filepaths, stats, jobs=1, cache=None):
+    """
+    Find files with identical content and return the set of paths that duplicate an earlier path in the list.
+    Files are compared in stages, so that only files that still collide are read in full:
+    first by size, then by a hash of their first and last block and finally by a hash of their whole content.
+    The hashes are calculated by the given number of parallel jobs, or taken from the hash cache if one is given.
+    """
+    # Hard links to the same file are identical without reading them.
+    file_keys = [("inode", stat.st_dev, stat.st_ino) if stat.st_ino else ("path", filepath)
+                 for filepath, stat in zip(filepaths, stats)]
+    content_keys = {}
+    stats_by_path = dict(zip(filepaths, stats))
+
+    # Stage 1: group the files by size. A file with a unique size cannot have a duplicate.
+    size_groups = {}
+    for filepath, stat, file_key in zip(filepaths, stats, file_keys):
+        size_groups.setdefault(stat.st_size, {}).setdefault(file_key, filepath)
+    candidates = [(file_key, filepath, size) for size, group in size_groups.items() if len(group) > 1
+                  for file_key, filepath in group.items()]
+
+    # Stage 2: hash the first and last block of each file that shares its size with another file.
+    candidate_paths = [filepath for file_key, filepath, size in candidates]
+    partial_hashes = hash_files_cached(cache, "partial_hash", calculate_partial_hash, candidate_paths,
+                                       [stats_by_path[filepath] for filepath in candidate_paths],
+                                       [(filepath, size) for file_key, filepath, size in candidates],
+                                       jobs, "Partial hashes")
+    partial_groups = {}
+    for (file_key, filepath, size), partial_hash in zip(candidates, partial_hashes):
+        partial_groups.setdefault((size, partial_hash), []).append((file_key, filepath))
+
+    # Stage 3: hash the whole content of the files that still collide.
+    # Files no larger than both blocks were already read in full for the partial hash.
+    full_candidates = []
+    for (size, partial_hash), partial_group in partial_groups.items():
+        if len(partial_group) < 2:
+            continue
+        for file_key, filepath in partial_group:
+            if size <= 2 * PARTIAL_HASH_BLOCK_SIZE:
+                content_keys[file_key] = ("partial", size, partial_hash)
+            else:
+                full_candidates.append((file_key, filepath))
+
+    full_candidate_paths = [filepath for file_key, filepath in full_candidates]
+    full_hashes = hash_files_cached(cache, "full_hash", calculate_hash, full_candidate_paths,
+                                    [stats_by_path[filepath] for filepath in full_candidate_paths],
+                                    [(filepath,) for filepath in full_candidate_paths], jobs, "Full hashes")
+    for (file_key, filepath), full_hash in zip(full_candidates, full_hashes):
+        content_keys[file_key] = ("content", full_hash)
+
+    seen_keys = set()
+    duplicates = set()
+    for filepath, file_key in zip(filepaths, file_keys):
+        content_key = content_keys.get(file_key, file_key)
+        if content_key in seen_keys:
+            duplicates.add(filepath)
+        else:
+            seen_keys.add(content_key)
+
+    return duplicates
+
+
+def remove_duplicates(directory, jobs=1, cache=None, index=None):
+    """
+    Remove duplicate PDFs and record their information.
+    A file counts as a duplicate if its content is identical to a file found before it, whatever its name.
+    The files are hashed by the given number of parallel jobs; the result does not depend on it.
+    If a hash cache is given, only new or modified files are hashed and entries of files that no longer
+    exist are removed from it. If a corpus index is given, the deleted files are marked in it.
+    """
+    directory_info = {}
+    total_original_count = 0
+    total_deleted_count = 0
+    total_remaining_count = 0
+
+    pdf_directories = collect_pdf_files(directory)
+    filepaths = [filepath for root, pdf_files in pdf_directories for file, filepath, stat in pdf_files]
+    stats = [stat for root, pdf_files in pdf_directories for file, filepath, stat in pdf_files]
+    duplicates = find_duplicates(filepaths, stats, jobs, cache)
+
+    for root, pdf_files in pdf_directories:
+        total_files = len(pdf_files)
+        deleted_files = []
+
+        for file, filepath, stat in pdf_files:
+            if filepath in duplicates:
+                # Record the deleted file's info.
+                deleted_file_info = {
+                    "file_name": file,
+                    "file_path": os.path.relpath(filepath, start=directory)
+                }
+                deleted_files.append(deleted_file_info)
+
+                # Delete the file.
+                print(f"Deleting duplicate file: {filepath}")
+                os.remove(filepath)
+                increment("duplicates_deleted_total")
+
+        if total_files > 0:
+            dir_key = os.path.relpath(root, start=directory)
+            directory_info[dir_key] = {
+                "original_count": total_files,
+                "deleted_count": len(deleted_files),
+                "remaining_count": total_files - len(deleted_files),
+                "deleted_files": deleted_files
+            }
+            total_original_count += total_files
+            total_deleted_count += len(deleted_files)
+            total_remaining_count += total_files - len(deleted_files)
+
+    # Mark the deleted files in the corpus index.
+    mark_deleted(index, [filepath for filepath in filepaths if filepath in duplicates])
+
+    # Evict the cache entries of deleted or vanished files.
+    if cache is not None:
+        evict_missing(cache, directory, [filepath for filepath in filepaths if filepath not in duplicates])
+
+    return directory_info, total_original_count, total_deleted_count, total_remaining_count
+
+
+def report_near_duplicates(directory, jobs=1, cache=None, similarity=NEAR_DUPLICATE_SIMILARITY):
+    """
+    Find the PDFs below the directory whose text is nearly the same although their content differs, like
+    a preprint and the publisher version of a paper, and describe them for the record of deleted files.
+    The files are identified by their full hash, so their text fingerprints can be cached by content.
+    """
+    pdf_directories = collect_pdf_files(directory)
+    filepaths = [filepath for root, pdf_files in pdf_directories for file, filepath, stat in pdf_files]
+    stats = [stat for root, pdf_files in pdf_directories for file, filepath, stat in pdf_files]
+    file_hashes = hash_files_cached(cache, "full_hash", calculate_hash, filepaths, stats,
+                                    [(filepath,) for filepath in filepaths], jobs, "Full hashes")
+    return find_near_duplicates(directory, filepaths, file_hashes, jobs, cache, similarity)
+
+
+def save_to_json(data, filename):
+    """Save the data to a JSON file."""
+    with timer("json_write_seconds", file=filename):
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove duplicate PDFs and record the deleted files.")
+    parser.add_argument("--jobs", type=int, default=1, help="number of files hashed in parallel")
+    parser.add_argument("--cache", default="pdf_hashes.db", help="path of the hash cache")
+    parser.add_argument("--no-cache", action="store_true", help="hash every file without using the hash cache")
+    parser.add_argument("--no-index", action="store_true", help="do not mark the deleted files in the corpus index")
+    parser.add_argument("--verify-cache", action="store_true",
+                        help="check the hash cache against the files on disk and exit")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="also report the remaining PDFs whose text is nearly the same")
+    parser.add_argument("--similarity", type=float, default=NEAR_DUPLICATE_SIMILARITY,
+                        help="share of word shingles two texts must have in common to be near-duplicates")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    args = parser.parse_args()
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    hash_cache = None if args.no_cache else open_cache(args.cache)
+
+    # Check the cached hashes instead of removing duplicates if requested.
+    if args.verify_cache:
+        if hash_cache is None:
+            parser.error("--verify-cache cannot be combined with --no-cache")
+        valid, stale, mismatched = verify_cache(hash_cache, calculate_partial_hash, calculate_hash)
+        print(f"Hash cache: {valid} valid, {stale} stale and {mismatched} mismatched entries. "
+              f"Stale and mismatched entries have been removed.")
+        raise SystemExit(1 if mismatched else 0)
+
+    # Directory containing the PDFs.
+    pdf_directory = "pdfs"
+
+    # Remove duplicates and get info about directories.
+    with timer("remove_duplicates_seconds"):
+        directories_info, total_original, total_deleted, total_remaining = remove_duplicates(
+            pdf_directory, args.jobs, hash_cache, None if args.no_index else get_index())
+
+    # Prepare JSON structure.
+    json_data = {
+        "total_original_count": total_original,
+        "total_deleted_count": total_deleted,
+        "total_remaining_count": total_remaining,
+        "directories": directories_info
+    }
+
+    # Report the files that differ but hold nearly the same text, without deleting them.
+    if args.near_duplicates:
+        with timer("near_duplicates_seconds"):
+            json_data["near_duplicates"] = report_near_duplicates(pdf_directory, args.jobs, hash_cache,
+                                                                  args.similarity)
+        print(f"{json_data['near_duplicates']['total_groups']} groups of near-duplicate files found.")
+
+    # Save to JSON file.
+    json_filename = "deleted_pdfs_record.json"
+    save_to_json(json_data, json_filename)
+
+    print(f"Record of deleted files saved to {json_filename}")
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
@@ -0,0 +1,551 @@
+import argparse
+import heapq
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+from corpus_index import ROOT_DIRECTORY, SOURCES, find_results, get_index
+from hash_cache import open_cache
+from metadata_dedup import normalize_text
+from metrics import enable, increment, start_metrics_server, timer, write_metrics
+from text_corpus import EXTRACTION_TIMEOUT_IN_S, MAX_MEMORY_IN_MB, extract_missing, hash_pdf_files, load_cached_text
+
+# Number of new documents written to one segment, which bounds the memory an update needs.
+SEGMENT_DOCUMENTS = 1000
+
+# Number of segments beyond which an update merges them into one, so that a search opens few files.
+MAX_SEGMENTS = 8
+
+# Entry of the lexicon of a segment for each term, in the order of the terms: offset and length of the term in
+# the terms file, number of documents, and offset and length of its posting list in the postings file.
+LEXICON_ENTRY = struct.Struct("<QIIQQ")
+
+# Array type codes of the position differences of a document by their width in bytes. The positions of a
+# document are stored in the narrowest width that holds their largest difference, so that they are decoded
+# as an array rather than one variable-length integer at a time.
+POSITION_TYPECODES = {1: "B", 2: "H", 4: "I"}
+
+# Files of a segment. Each is memory-mapped while the segment is searched.
+SEGMENT_FILES = ("lexicon", "terms", "postings")
+
+# File listing the segments and the documents of the index.
+MANIFEST_FILE = "manifest.json"
+
+# Characters the scrapers replace in titles to name the PDF files after them.
+INVALID_FILENAME_CHARACTERS = re.compile(r'[\\/:*?"<>|]')
+
+
+def _append_varint(output, value):
+    """
+    Append a non-negative integer to a bytearray in 7-bit groups, lowest first.
+    """
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def _read_varint(data, offset):
+    """
+    Read an integer written by _append_varint() and return it with the offset after it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _append_posting(output, document_delta, positions):
+    """
+    Append the posting of a document to a posting list: the difference to the previous document, the number of
+    positions, the width of the position differences in bytes, and the differences between the positions as
+    little-endian integers of that width. The width lets a search skip the documents it does not need.
+    """
+    _append_varint(output, document_delta)
+    _append_varint(output, len(positions))
+    if len(positions) == 1:
+        # Most terms occur once in a document; their position is written without building an array.
+        width = 1 if positions[0] < 1 << 8 else 2 if positions[0] < 1 << 16 else 4
+        output.append(width)
+        output += positions[0].to_bytes(width, "little")
+        return
+    position_deltas = [positions[0]] + [position - previous_position
+                                        for previous_position, position in zip(positions, positions[1:])]
+    largest_delta = max(position_deltas)
+    width = 1 if largest_delta < 1 << 8 else 2 if largest_delta < 1 << 16 else 4
+    encoded_positions = array(POSITION_TYPECODES[width], position_deltas)
+    if sys.byteorder == "big":
+        encoded_positions.byteswap()
+    output.append(width)
+    output += encoded_positions.tobytes()
+
+
+def decode_postings(data, documents=None):
+    """
+    Decode a posting list into a dictionary of the positions of the term in each document, in the order of the
+    documents. If documents is given, only the postings of these documents are decoded.
+    """
+    postings = {}
+    offset = 0
+    document = 0
+    while offset < len(data):
+        document_delta, offset = _read_varint(data, offset)
+        document += document_delta
+        positions_count, offset = _read_varint(data, offset)
+        width = data[offset]
+        offset += 1
+        length = positions_count * width
+        if documents is None or document in documents:
+            position_deltas = array(POSITION_TYPECODES[width], data[offset:offset + length])
+            if sys.byteorder == "big":
+                position_deltas.byteswap()
+            postings[document] = list(itertools.accumulate(position_deltas))
+        offset += length
+    return postings
+
+
+def segment_path(index_directory, name, kind):
+    """
+    Return the path of one of the files of a segment.
+    """
+    return os.path.join(index_directory, f"{name}.{kind}")
+
+
+def _write_segment_files(index_directory, name, postings):
+    """
+    Write a segment from (term, document count, posting list) tuples in the order of the terms.
+    Returns the number of terms; a segment without terms is not written.
+    """
+    terms_count = 0
+    term_offset = 0
+    postings_offset = 0
+    with open(segment_path(index_directory, name, "lexicon"), "wb") as lexicon_file, \
+            open(segment_path(index_directory, name, "terms"), "wb") as terms_file, \
+            open(segment_path(index_directory, name, "postings"), "wb") as postings_file:
+        for term, document_count, data in postings:
+            encoded_term = term.encode("utf-8")
+            lexicon_file.write(LEXICON_ENTRY.pack(term_offset, len(encoded_term), document_count, postings_offset,
+                                                  len(data)))
+            terms_file.write(encoded_term)
+            postings_file.write(data)
+            term_offset += len(encoded_term)
+            postings_offset += len(data)
+            terms_count += 1
+    if not terms_count:
+        remove_segment(index_directory, name)
+    return terms_count
+
+
+def write_segment(index_directory, name, documents):
+    """
+    Write the inverted index of (document number, words) tuples, in increasing document numbers, as a segment.
+    The posting lists are encoded as each document is read, so only the encoded lists are held in memory.
+    Returns the number of terms.
+    """
+    postings = {}
+    for document, words in documents:
+        positions_by_term = {}
+        for position, word in enumerate(words):
+            positions_by_term.setdefault(word, []).append(position)
+        for term, positions in positions_by_term.items():
+            # Last document, number of documents and posting list of the term.
+            term_postings = postings.get(term)
+            if term_postings is None:
+                term_postings = postings[term] = [0, 0, bytearray()]
+            _append_posting(term_postings[2], document - term_postings[0], positions)
+            term_postings[0] = document
+            term_postings[1] += 1
+    return _write_segment_files(index_directory, name, ((term, postings[term][1], postings[term][2])
+                                                        for term in sorted(postings)))
+
+
+def open_segment(index_directory, name):
+    """
+    Memory-map the files of a segment for searching.
+    """
+    segment = {"name": name, "files": []}
+    for kind in SEGMENT_FILES:
+        segment_file = open(segment_path(index_directory, name, kind), "rb")
+        segment["files"].append(segment_file)
+        segment[kind] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+    segment["terms_count"] = len(segment["lexicon"]) // LEXICON_ENTRY.size
+    return segment
+
+
+def close_segment(segment):
+    """
+    Unmap and close the files of a segment.
+    """
+    for kind in SEGMENT_FILES:
+        segment[kind].close()
+    for segment_file in segment["files"]:
+        segment_file.close()
+
+
+def remove_segment(index_directory, name):
+    """
+    Delete the files of a segment.
+    """
+    for kind in SEGMENT_FILES:
+        path = segment_path(index_directory, name, kind)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _read_entry(segment, position):
+    """
+    Return the term at a position of the lexicon of a segment with its lexicon entry.
+    """
+    entry = LEXICON_ENTRY.unpack_from(segment["lexicon"], position * LEXICON_ENTRY.size)
+    return segment["terms"][entry[0]:entry[0] + entry[1]], entry
+
+
+def lookup_term(segment, term):
+    """
+    Find a term in the lexicon of a segment by binary search. Returns the number of documents and the posting
+    list of the term, or None if no document of the segment contains it.
+    """
+    encoded_term = term.encode("utf-8")
+    low, high = 0, segment["terms_count"]
+    while low < high:
+        middle = (low + high) // 2
+        middle_term, entry = _read_entry(segment, middle)
+        if middle_term < encoded_term:
+            low = middle + 1
+        elif middle_term > encoded_term:
+            high = middle
+        else:
+            return entry[2], segment["postings"][entry[3]:entry[3] + entry[4]]
+    return None
+
+
+def merge_segments(index_directory, names, name, deleted_documents):
+    """
+    Merge segments with consecutive document numbers into a new one, leaving out the deleted documents.
+    Returns the number of terms of the new segment.
+    """
+    segments = [open_segment(index_directory, segment_name) for segment_name in names]
+
+    def segment_terms(segment_number, segment):
+        for position in range(segment["terms_count"]):
+            term, entry = _read_entry(segment, position)
+            yield term, segment_number, entry
+
+    def merged_postings():
+        merged = heapq.merge(*(segment_terms(segment_number, segment)
+                               for segment_number, segment in enumerate(segments)))
+        for term, term_entries in itertools.groupby(merged, key=lambda item: item[0]):
+            data = bytearray()
+            document_count = 0
+            previous_document = 0
+            for _, segment_number, entry in term_entries:
+                postings = segments[segment_number]["postings"][entry[3]:entry[3] + entry[4]]
+                for document, positions in decode_postings(postings).items():
+                    if document not in deleted_documents:
+                        _append_posting(data, document - previous_document, positions)
+                        previous_document = document
+                        document_count += 1
+            if document_count:
+                yield term.decode("utf-8"), document_count, data
+
+    try:
+        return _write_segment_files(index_directory, name, merged_postings())
+    finally:
+        for segment in segments:
+            close_segment(segment)
+
+
+def load_manifest(index_directory):
+    """
+    Load the list of segments and documents of the index, or describe an empty index.
+    Each document has the SHA-256 hash of its PDF, the paths of its files relative to the PDF directory, and
+    its number of words. Its number is its position in the list.
+    """
+    path = os.path.join(index_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"segments": [], "next_segment": 1, "documents": []}
+    with open(path, "r", encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(index_directory, manifest):
+    """
+    Replace the manifest of the index. It is written under a temporary name and then renamed, so that a search
+    sees either the old or the new index.
+    """
+    path = os.path.join(index_directory, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def update_index(index_directory, directory, cache_directory, jobs=1, timeout=EXTRACTION_TIMEOUT_IN_S,
+                 max_memory=MAX_MEMORY_IN_MB, cache=None, merge=False):
+    """
+    Bring the index up to date with the PDFs below the directory. The text of new files is extracted into the
+    text cache and written as new segments; the files of known documents are updated, and documents whose files
+    are all gone are left out of searches. Segments are merged when there are more than MAX_SEGMENTS of them,
+    or always with merge. Returns the number of documents, new documents and segments.
+    """
+    os.makedirs(index_directory, exist_ok=True)
+    manifest = load_manifest(index_directory)
+    files_by_hash = hash_pdf_files(directory, jobs, cache)
+    extract_missing(files_by_hash, cache_directory, jobs, timeout, max_memory)
+
+    def relative_paths(file_hash):
+        return [os.path.relpath(filepath, start=directory) for filepath in files_by_hash.get(file_hash, [])]
+
+    known_hashes = set()
+    for document in manifest["documents"]:
+        if document["file_hash"] is not None:
+            known_hashes.add(document["file_hash"])
+            document["files"] = relative_paths(document["file_hash"])
+    new_hashes = [file_hash for file_hash in files_by_hash if file_hash not in known_hashes]
+
+    def read_documents(first_document, batch_hashes):
+        for document, file_hash in enumerate(batch_hashes, start=first_document):
+            words = normalize_text(load_cached_text(cache_directory, file_hash)["text"]).split()
+            manifest["documents"][document]["word_count"] = len(words)
+            yield document, words
+
+    with timer("fulltext_index_seconds", kind="update"):
+        for start in range(0, len(new_hashes), SEGMENT_DOCUMENTS):
+            batch_hashes = new_hashes[start:start + SEGMENT_DOCUMENTS]
+            first_document = len(manifest["documents"])
+            manifest["documents"].extend({"file_hash": file_hash, "files": relative_paths(file_hash),
+                                          "word_count": 0} for file_hash in batch_hashes)
+            name = f"segment_{manifest['next_segment']}"
+            manifest["next_segment"] += 1
+            if write_segment(index_directory, name, read_documents(first_document, batch_hashes)):
+                manifest["segments"].append(name)
+            print(f"\rIndexing: {start + len(batch_hashes)}/{len(new_hashes)} files", end="", flush=True)
+        if new_hashes:
+            print()
+        increment("fulltext_documents_indexed_total", len(new_hashes))
+
+    old_segments = []
+    if len(manifest["segments"]) > MAX_SEGMENTS or (merge and manifest["segments"]):
+        with timer("fulltext_index_seconds", kind="merge"):
+            deleted_documents = {document for document, entry in enumerate(manifest["documents"])
+                                 if not entry["files"]}
+            name = f"segment_{manifest['next_segment']}"
+            manifest["next_segment"] += 1
+            old_segments = manifest["segments"]
+            manifest["segments"] = [name] if merge_segments(index_directory, old_segments, name,
+                                                            deleted_documents) else []
+            # The postings of the deleted documents are gone, so their files are indexed anew if they come back.
+            for document in deleted_documents:
+                manifest["documents"][document]["file_hash"] = None
+    save_manifest(index_directory, manifest)
+    for name in old_segments:
+        remove_segment(index_directory, name)
+
+    return {"documents": sum(1 for document in manifest["documents"] if document["files"]),
+            "new": len(new_hashes), "segments": len(manifest["segments"])}
+
+
+def parse_query(query):
+    """
+    Split a query into clauses that must all match: phrases in double quotes and single words, normalized like
+    the indexed text. A clause of several terms matches where the terms follow each other.
+    """
+    clauses = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        terms = normalize_text(phrase or word).split()
+        if terms:
+            clauses.append(terms)
+    return clauses
+
+
+def count_occurrences(term_positions):
+    """
+    Count the positions at which the terms of a clause occur one after the other, given their positions in a
+    document.
+    """
+    starts = set(term_positions[0])
+    for offset, positions in enumerate(term_positions[1:], 1):
+        starts &= {position - offset for position in positions}
+    return len(starts)
+
+
+def match_segment(segment, clauses):
+    """
+    Return the documents of a segment that match all clauses, with the number of occurrences of the clauses.
+    The rarest term is decoded first, and of the other terms only the documents that still match.
+    """
+    terms = {term for clause in clauses for term in clause}
+    entries = {}
+    for term in terms:
+        entries[term] = lookup_term(segment, term)
+        if entries[term] is None:
+            return {}
+
+    positions = {}
+    candidates = None
+    for term in sorted(terms, key=lambda term: entries[term][0]):
+        positions[term] = decode_postings(entries[term][1], candidates)
+        candidates = set(positions[term])
+        if not candidates:
+            return {}
+
+    matches = {}
+    for document in candidates:
+        counts = [count_occurrences([positions[term][document] for term in clause]) for clause in clauses]
+        if all(counts):
+            matches[document] = sum(counts)
+    return matches
+
+
+def in_scope(filepath, source=None, query_number=None):
+    """
+    Tell if a file, relative to the PDF directory, belongs to the given source and query.
+    """
+    parts = os.path.normpath(filepath).split(os.sep)
+    if source is not None and parts[0] != SOURCES[source]["pdf_directory"]:
+        return False
+    return query_number is None or (len(parts) > 1 and parts[1] == f"query_{query_number}")
+
+
+def search(index_directory, query, source=None, query_number=None):
+    """
+    Find the documents that match all clauses of a query, with the most occurrences first. Only the files of
+    the given source and query are listed, counting queries from 1 like the PDF directories.
+    """
+    manifest = load_manifest(index_directory)
+    clauses = parse_query(query)
+    if not clauses:
+        return []
+
+    matches = {}
+    with timer("fulltext_index_seconds", kind="search"):
+        for name in manifest["segments"]:
+            segment = open_segment(index_directory, name)
+            try:
+                matches.update(match_segment(segment, clauses))
+            finally:
+                close_segment(segment)
+
+    found = []
+    for document, occurrences in matches.items():
+        entry = manifest["documents"][document]
+        files = [filepath for filepath in entry["files"] if in_scope(filepath, source, query_number)]
+        if files:
+            found.append({"file_hash": entry["file_hash"], "files": files, "word_count": entry["word_count"],
+                          "occurrences": occurrences})
+    found.sort(key=lambda match: (-match["occurrences"], match["files"][0]))
+    return found
+
+
+def load_result_records(root_directory=ROOT_DIRECTORY):
+    """
+    Load the results of the updated results files of all sources. Returns the results by source, query index
+    and result index, and the keys of the results whose PDF was saved by the path the scraper saved it under,
+    relative to the PDF directory.
+    """
+    records = {}
+    keys_by_path = {}
+    for source, source_files in SOURCES.items():
+        path = os.path.join(root_directory, source_files["directory"], source_files["updated_file"])
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as json_file:
+            queries_results = json.load(json_file)
+        for query_index, query_data in enumerate(queries_results["queries_data"]):
+            for result_index, result in enumerate(query_data["query_results"]):
+                records[(source, query_index, result_index)] = result
+                if result.get(source_files["saved_field"]) and isinstance(result.get("title"), str):
+                    file_name = INVALID_FILENAME_CHARACTERS.sub("_", result["title"]).strip() + ".pdf"
+                    filepath = os.path.join(source_files["pdf_directory"], f"query_{query_index + 1}", file_name)
+                    keys_by_path.setdefault(filepath, []).append((source, query_index, result_index))
+    return records, keys_by_path
+
+
+def linked_results(match, records, keys_by_path, index=None):
+    """
+    Return the result records whose PDF is one of the files of a match. With the corpus index, the results
+    whose file was deleted as a duplicate of one of them are included as well.
+    """
+    keys = [key for filepath in match["files"] for key in keys_by_path.get(os.path.normpath(filepath), [])]
+    if index is not None:
+        keys += [(result["source"], result["query_index"], result["result_index"])
+                 for result in find_results(index, file_hash=match["file_hash"])]
+    return [{"source": key[0], "query_index": key[1], "result_index": key[2], "result": records[key]}
+            for key in dict.fromkeys(keys) if key in records]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a full-text index of the downloaded PDFs and search it.")
+    parser.add_argument("--index-directory", default="fulltext_index", help="directory of the full-text index")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="index the PDFs that are new since the last update")
+    update_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                               help="number of PDFs extracted in parallel")
+    update_parser.add_argument("--timeout", type=float, default=EXTRACTION_TIMEOUT_IN_S,
+                               help="seconds a worker may spend on one PDF")
+    update_parser.add_argument("--max-memory", type=int, default=MAX_MEMORY_IN_MB,
+                               help="address space a worker may use in MB (Unix only, 0 for no limit)")
+    update_parser.add_argument("--text-cache", default="text_cache", help="directory of the cached texts")
+    update_parser.add_argument("--cache", default="pdf_hashes.db", help="path of the hash cache")
+    update_parser.add_argument("--no-cache", action="store_true", help="hash every file without using the hash cache")
+    update_parser.add_argument("--merge", action="store_true", help="merge all segments into one")
+    search_parser = subparsers.add_parser("search", help="list the saved results whose PDF matches all words and "
+                                                         "quoted phrases")
+    search_parser.add_argument("query", nargs="+", help='words and "quoted phrases" the text must contain')
+    search_parser.add_argument("--source", choices=SOURCES)
+    search_parser.add_argument("--query", dest="query_number", type=int,
+                               help="number of the query, counted from 1 like the PDF directories")
+    search_parser.add_argument("--limit", type=int, help="maximum number of files listed")
+    search_parser.add_argument("--output", help="write the matching result records to this JSON file")
+    search_parser.add_argument("--no-index", action="store_true",
+                               help="link the files to their results without the corpus index")
+    args = parser.parse_args()
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    # Directory containing the PDFs.
+    pdf_directory = "pdfs"
+
+    if args.command == "update":
+        index_counts = update_index(args.index_directory, pdf_directory, args.text_cache, args.jobs, args.timeout,
+                                    args.max_memory, None if args.no_cache else open_cache(args.cache), args.merge)
+        print(f"{index_counts['documents']} PDFs indexed in {index_counts['segments']} segments "
+              f"({index_counts['new']} new).")
+    else:
+        # The shell splits the query into words; quotes that reach the script mark phrases.
+        matches = search(args.index_directory, " ".join(args.query), args.source, args.query_number)
+        result_records, result_keys_by_path = load_result_records()
+        corpus_index = None if args.no_index else get_index()
+        found_results = []
+        for match in matches[:args.limit]:
+            match["results"] = linked_results(match, result_records, result_keys_by_path, corpus_index)
+            found_results.append(match)
+            print(f"{match['occurrences']:>6} {match['files'][0]}")
+            for linked in match["results"]:
+                print(f"{'':>6} {linked['source']:<15} query {linked['query_index'] + 1:<4} "
+                      f"result {linked['result_index'] + 1:<4} {linked['result'].get('title')}")
+        print(f"{len(matches)} files found.")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as output_file:
+                json.dump(found_results, output_file, ensure_ascii=False, indent=2)
+            print(f"The matching results have been saved to {args.output}")
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
@@ -1,185 +1,194 @@
-import requests
-from bs4 import BeautifulSoup
-from time import sleep
-import json
-
-
-def load_json(json_file_path):
-    """
-    Import data from a JSON file.
-    """
-    with open(json_file_path, "r", encoding='utf-8') as json_file:
-        return json.load(json_file)
-
-
-def write_json(json_file_path, data):
-    """
-    Write data to a JSON file.
-    """
-    with open(json_file_path, "w", encoding="utf-8") as json_file:
-        json.dump(data, json_file, ensure_ascii=False, indent=2)
-
-
-def crawl_google_scholar():
-    """
-    Record data from Google Scholar based on queries and write the results to a JSON file
-    """
-    # An HTTP request header is being set to mimic a request sent by a browser.
-    headers = {
-        "User-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/105.0.0.0 Safari/537.36 "
-    }
-
-    # Initialize counting variables for the statistics.
-    total_queries = 0
-    total_results = 0
-    total_links = 0
-    total_pdf_links = 0
-    queries_data = []
-
-    # Load the queries from a JSON file.
-    try:
-        queries = load_json("gs_queries.json")
-    except Exception as e:
-        print(f"Error loading queries: {e}")
-        return
-
-    # Iterate over queries and perform actions for each query.
-    for query in queries:
-        total_results_query = 0
-        total_links_query = 0
-        max_items = query["max_items"]
-
-        # Set up the data structure to store query results.
-        query_data = {
-            "query_metadata": query,
-            "query_link_statistics": {},
-            "query_results": [],
-        }
-
-        params = query["params"]
-
-        # Fetch data until the maximum of recorded items is reached.
-        while total_results_query < max_items:
-            try:
-                # Add a timeout parameter to the request
-                response = requests.get(params["base"], headers=headers, params=params, timeout=10)
-                response.raise_for_status()
-                html = response.text
-                soup = BeautifulSoup(html, "lxml")
-
-                # Parse HTML content using BeautifulSoup and extract relevant data.
-                for result in soup.select(".gs_r.gs_or.gs_scl"):
-                    if total_results_query >= max_items:
-                        break
-
-                    # Try to record relevant data such as title, title link and publication information.
-                    try:
-                        title = result.select_one(".gs_rt").text
-                        # Remove specific prefixes from the title and trim whitespace.
-                        prefixes = ["[CITAT][C]", "[PDF][PDF]", "[BOK][B]", "[HTML][HTML]"]
-                        for prefix in prefixes:
-                            if title.startswith(prefix):
-                                title = title[len(prefix):].strip()
-                                break
-                    except TypeError:
-                        title = None
-
-                    try:
-                        title_link = result.select_one(".gs_rt a")["href"]
-                    except TypeError:
-                        title_link = None
-
-                    try:
-                        publication_info = result.select_one(".gs_a").text
-                    except TypeError:
-                        publication_info = None
-
-                    try:
-                        snippet = result.select_one(".gs_rs").text
-                    except TypeError:
-                        snippet = None
-
-                    try:
-                        cited_by = result.select_one("#gs_res_ccl_mid .gs_nph+ a")["href"]
-                    except TypeError:
-                        cited_by = None
-
-                    try:
-                        doc_type = result.select_one(".gs_ctg2").text.strip("[]")
-                        if doc_type == "PDF":
-                            total_links += 1
-                            total_links_query += 1
-                            total_pdf_links += 1
-                    except AttributeError:
-                        doc_type = None
-                    try:
-                        doc_link = result.select_one(".gs_or_ggsm a:nth-child(1)")["href"]
-                    except TypeError:
-                        doc_link = None
-
-                    total_results += 1
-                    total_results_query += 1
-
-                    # Construct the data structure to record extracted data.
-                    result_data = {
-                        "title": title,
-                        "title_link": title_link,
-                        "publication_info": publication_info,
-                        "snippet": snippet,
-                        "cited_by": f"https://scholar.google.com{cited_by}" if cited_by else None,
-                        "page": params["start"] // 10,
-                        "doc_type": doc_type,
-                        "doc_link": doc_link
-                    }
-
-                    query_data["query_results"].append(result_data)
-
-                    # Print the title of each recorded document.
-                    print(f"Document recorded: {result_data['title']}")
-
-                if total_results_query >= max_items:
-                    break
-
-                params["start"] += 10
-
-                # Wait inbetween requests to lessen the load on the server.
-                sleep(3)
-
-            except requests.exceptions.ConnectTimeout:
-                print("Connection timed out. Trying again...")
-                sleep(5)
-                continue
-            except requests.exceptions.HTTPError as e:
-                print(f"HTTP error occurred: {e}")
-                break
-            except requests.exceptions.RequestException as e:
-                print(f"Error during requests to {params['base']}: {e}")
-                break
-
-        # Store link statistics.
-        query_data["query_link_statistics"] = {
-            'total_results_query': total_results_query,
-            'total_pdf_links_query': total_links_query,
-        }
-        queries_data.append(query_data)
-        total_queries += 1
-
-    # Compile query results and save them to a JSON file.
-    try:
-        json_file_path = "gs_search_results.json"
-        queries_results = {
-            "total_queries": total_queries,
-            "total_results": total_results,
-            "total_pdf_links": total_pdf_links,
-            "queries_data": queries_data
-        }
-
-        write_json(json_file_path, queries_results)
-        print(f"The query results have been saved to {json_file_path}.")
-    except Exception as e:
-        print(f"Error saving query results: {e}")
-
-
-if __name__ == "__main__":
-    crawl_google_scholar()
+import argparse
+import os
+import sys
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_index import configure as configure_index
+from crawler_engine import crawl, rebuild
+from gs_scraper import scrape_gs_stream
+from http_archive import ARCHIVE_FILE, RECORD, REPLAY
+from http_client import SOURCE_HEADERS, configure
+from metrics import enable, start_metrics_server, write_metrics
+
+# Requests per second sent to Google Scholar at first and at most.
+REQUEST_RATE = 1 / 3
+MAX_REQUEST_RATE = 1
+
+# Number of queries that may be crawled from Google Scholar at the same time.
+MAX_PARALLEL_QUERIES = 2
+
+
+def parse_html(html, start):
+    """
+    Parse the HTML content of a Google Scholar results page that begins with the result start and extract
+    the relevant data of each result.
+    """
+    soup = BeautifulSoup(html, "lxml")
+    results = []
+
+    for result in soup.select(".gs_r.gs_or.gs_scl"):
+        # Try to record relevant data such as title, title link and publication information.
+        try:
+            title = result.select_one(".gs_rt").text
+            # Remove specific prefixes from the title and trim whitespace.
+            prefixes = ["[CITAT][C]", "[PDF][PDF]", "[BOK][B]", "[HTML][HTML]"]
+            for prefix in prefixes:
+                if title.startswith(prefix):
+                    title = title[len(prefix):].strip()
+                    break
+        except TypeError:
+            title = None
+
+        try:
+            title_link = result.select_one(".gs_rt a")["href"]
+        except TypeError:
+            title_link = None
+
+        try:
+            publication_info = result.select_one(".gs_a").text
+        except TypeError:
+            publication_info = None
+
+        try:
+            snippet = result.select_one(".gs_rs").text
+        except TypeError:
+            snippet = None
+
+        try:
+            cited_by = result.select_one("#gs_res_ccl_mid .gs_nph+ a")["href"]
+        except TypeError:
+            cited_by = None
+
+        try:
+            doc_type = result.select_one(".gs_ctg2").text.strip("[]")
+        except AttributeError:
+            doc_type = None
+        try:
+            doc_link = result.select_one(".gs_or_ggsm a:nth-child(1)")["href"]
+        except TypeError:
+            doc_link = None
+
+        # Construct the data structure to record extracted data.
+        results.append({
+            "title": title,
+            "title_link": title_link,
+            "publication_info": publication_info,
+            "snippet": snippet,
+            "cited_by": f"https://scholar.google.com{cited_by}" if cited_by else None,
+            "page": start // 10,
+            "doc_type": doc_type,
+            "doc_link": doc_link
+        })
+
+    return results
+
+
+def page_request(query, start):
+    """
+    Return the URL and query parameters of the results page of a query that begins with the result start.
+    The start parameter of the query is set to it, so the query metadata shows the last page fetched.
+    """
+    params = query["params"]
+    params["start"] = start
+    return params["base"], params
+
+
+# Adapter of Google Scholar for the crawler engine.
+GOOGLE_SCHOLAR_ADAPTER = {
+    "name": "google_scholar",
+    "journal_file": "gs_search_results.ndjson",
+    "results_file": "gs_search_results.json",
+    "encoding": "utf-8",
+    "indent": 2,
+    "ensure_ascii": False,
+    "headers": SOURCE_HEADERS["google_scholar"],
+    "request_rate": REQUEST_RATE,
+    "max_request_rate": MAX_REQUEST_RATE,
+    "max_parallel_queries": MAX_PARALLEL_QUERIES,
+    "first_page": lambda query: query["params"]["start"],
+    "page_step": 10,
+    "page_request": page_request,
+    "parse_page": parse_html,
+    "has_pdf_link": lambda result: result["doc_type"] == "PDF",
+    "scrape_stream": scrape_gs_stream,
+}
+
+
+def crawl_google_scholar(resume=False, download=False, max_concurrency=1, max_per_host=4,
+                        parallel_queries=1):
+    """
+    Record data from Google Scholar based on queries and write the results to a JSON file
+    Every completed page is appended to a journal. With resume, the queries continue from the last
+    completed page recorded in the journal instead of starting over.
+    With download, the PDFs of the results are downloaded from the journal while the crawling continues,
+    with the same outcome as running gs_scraper.py afterwards.
+    With parallel_queries, that many queries are crawled at the same time, up to MAX_PARALLEL_QUERIES.
+    """
+    crawl(GOOGLE_SCHOLAR_ADAPTER, "gs_queries.json", resume=resume, download=download,
+          max_concurrency=max_concurrency, max_per_host=max_per_host, parallel_queries=parallel_queries)
+
+
+def rebuild_google_scholar_results():
+    """
+    Rebuild the results JSON file from the crawl journal without sending any requests.
+    """
+    rebuild(GOOGLE_SCHOLAR_ADAPTER, "gs_queries.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record search results from Google Scholar.")
+    parser.add_argument("--resume", action="store_true", help="continue from the last completed page of each query")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the results file from the crawl journal without crawling")
+    parser.add_argument("--download", action="store_true",
+                        help="download the PDFs while crawling instead of running gs_scraper.py afterwards")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of simultaneous downloads")
+    parser.add_argument("--per-host", type=int, default=4, help="maximum number of simultaneous downloads per host")
+    parser.add_argument("--parallel-queries", type=int, default=1,
+                        help=f"number of queries crawled at the same time (at most {MAX_PARALLEL_QUERIES})")
+    parser.add_argument("--no-index", action="store_true", help="do not record the results in the corpus index")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="fetch everything in full instead of revalidating the HTTP cache")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument("--record", nargs="?", const=ARCHIVE_FILE, metavar="FILE",
+                               help="record every response to an HTTP archive (default: http_archive.db)")
+    archive_group.add_argument("--replay", nargs="?", const=ARCHIVE_FILE, metavar="FILE",
+                               help="serve the responses from an HTTP archive without sending requests or "
+                                    "waiting between them (default: http_archive.db)")
+    args = parser.parse_args()
+    if args.replay and args.download:
+        parser.error("--download cannot be combined with --replay, since PDFs are not recorded")
+
+    # Bypass the HTTP cache and the corpus index if requested.
+    if args.no_cache:
+        configure(use_cache=False)
+    if args.no_index:
+        configure_index(use_index=False)
+
+    # Record the responses to an HTTP archive or replay them from it if requested.
+    if args.record:
+        configure(archive_mode=RECORD, archive_file=args.record)
+    if args.replay:
+        if not os.path.exists(args.replay):
+            parser.error(f"no HTTP archive at {args.replay}")
+        configure(archive_mode=REPLAY, archive_file=args.replay)
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    if args.rebuild:
+        rebuild_google_scholar_results()
+    else:
+        crawl_google_scholar(resume=args.resume, download=args.download, max_concurrency=args.concurrency,
+                             max_per_host=args.per_host, parallel_queries=args.parallel_queries)
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
@@ -1,136 +1,340 @@
-import requests
-import os
-import re
-import json
-
-
-def load_json(json_file_path):
-    """
-    Load data from a JSON file.
-    """
-    with open(json_file_path, "r", encoding='utf-8') as json_file:
-        json_data = json.load(json_file)
-        print(f"Importing successful. Imported queries:\n{json_data}")
-        return json_data
-
-
-def write_json(json_file_path, data):
-    """
-    Write data to a JSON file.
-    """
-    with open(json_file_path, "w", encoding="utf-8") as json_file:
-        json.dump(data, json_file, ensure_ascii=False, indent=2)
-
-
-def scrape_gs():
-    """
-    Scrape and download PDFs from links stored in a JSON file.
-    The function handles file size limits, and retries for failed downloads.
-    """
-    # Set timeout and file size limits.
-    timeout_in_s = 20
-    max_file_size = 20 * 1024 * 1024
-
-    # Initialize counters.
-    pdfs_amount = 0
-
-    # Load search queries from a JSON file.
-    try:
-        queries = load_json("gs_search_results.json")
-    except Exception as e:
-        print(f"Error loading queries results: {e}")
-        return
-
-    # Set up directories for saving downloaded PDFs.
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(script_dir)
-    base_directory_name = "pdfs"
-    gs_pdfs_directory_name = "gs_pdfs"
-    base_directory_path = os.path.join(parent_dir, base_directory_name)
-    gs_pdfs_directory_path = os.path.join(base_directory_path, gs_pdfs_directory_name)
-
-    # Create base PDF directory if it doesn't exist.
-    if not os.path.exists(base_directory_path):
-        os.makedirs(base_directory_path)
-
-    # Create gs_pdfs directory if it doesn't exist.
-    if not os.path.exists(gs_pdfs_directory_path):
-        os.makedirs(gs_pdfs_directory_path)
-
-    try:
-        # Iterate through each query.
-        for i, query in enumerate(queries["queries_data"], start=1):
-            query_directory_name = f"query_{i}"
-            query_directory_path = os.path.join(gs_pdfs_directory_path, query_directory_name)
-
-            # Create directory for the query if it doesn't exist.
-            if not os.path.exists(query_directory_path):
-                os.makedirs(query_directory_path)
-
-            # Counter for downloaded PDFs per query
-            downloaded_pdfs_count_query = 0
-
-            # Iterate through each query result.
-            for query_result in query["query_results"]:
-                query_result['file_saved'] = False
-                if query_result["doc_type"] == "PDF":
-                    doc_link = query_result["doc_link"]
-
-                    # Try downloading the PDF up to 3 times.
-                    for attempt in range(3):
-                        try:
-                            # Set request headers.
-                            headers = {
-                                "User-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, "
-                                              "like Gecko) Chrome/105.0.0.0 Safari/537.36 "
-                            }
-                            # Make the request.
-                            r = requests.get(doc_link, timeout=timeout_in_s, headers=headers)
-
-                            # Check for successful response and if file size is within limit.
-                            if r.status_code == 200 and len(r.content) <= max_file_size:
-                                original_filename = query_result["title"]
-                                invalid_chars_pattern = re.compile(r'[\\/:*?"<>|]')
-                                valid_filename = re.sub(invalid_chars_pattern, '_', original_filename)
-                                valid_filename = valid_filename.strip()
-                                filename = valid_filename
-                                filepath = os.path.join(query_directory_path, f'{filename}.pdf')
-
-                                # Save file if it doesn't already exist.
-                                if not os.path.exists(filepath):
-                                    with open(filepath, 'wb') as f:
-                                        f.write(r.content)
-                                    query_result['file_saved'] = True
-                                    pdfs_amount += 1
-                                    downloaded_pdfs_count_query += 1
-                                    break
-                        except requests.exceptions.Timeout:
-                            if attempt == 2:
-                                print("Request timed out while fetching PDF document.")
-                        except Exception as e:
-                            if attempt == 2:
-                                print(f"Could not fetch PDF document: {e}")
-                            continue
-
-            # Record statistics for each query.
-            query["query_link_statistics"]["downloaded_pdfs_count_query"] = downloaded_pdfs_count_query
-    except Exception as e:
-        print(f"Error handling query results: {e}")
-        return
-
-    # Construct a dictionary and save the final results.
-    result_data = {
-        "total_queries": queries["total_queries"],
-        "total_results": queries["total_results"],
-        "total_pdf_links": queries["total_pdf_links"],
-        "total_downloaded_pdfs": pdfs_amount,
-        "queries_data": queries["queries_data"]
-    }
-
-    # Write the final results to a JSON file.
-    json_file_path = "gs_search_results_updated.json"
-    write_json(json_file_path, result_data)
-
-
-if __name__ == "__main__":
-    scrape_gs()
+import argparse
+import os
+import re
+import json
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus_index import DUPLICATE, NOT_SAVED, SAVED, get_index, record_downloads
+from corpus_index import configure as configure_index
+from http_client import SOURCE_HEADERS, configure
+from metadata_dedup import load_duplicates
+from metrics import enable, start_metrics_server, timer, write_metrics
+from pdf_downloader import download_pdfs, iter_downloads, load_dead_letters
+from pdf_store import STORE_DIRECTORY_NAME
+from result_stream import append_records, iter_records, records_to_nested
+
+
+def load_json(json_file_path):
+    """
+    Load data from a JSON file.
+    """
+    with timer("json_read_seconds", file=json_file_path):
+        with open(json_file_path, "r", encoding='utf-8') as json_file:
+            json_data = json.load(json_file)
+    print(f"Importing successful. Imported queries:\n{json_data}")
+    return json_data
+
+
+def write_json(json_file_path, data):
+    """
+    Write data to a JSON file.
+    """
+    with timer("json_write_seconds", file=json_file_path):
+        with open(json_file_path, "w", encoding="utf-8") as json_file:
+            json.dump(data, json_file, ensure_ascii=False, indent=2)
+
+
+# Set timeout and file size limits.
+TIMEOUT_IN_S = 20
+MAX_FILE_SIZE = 20 * 1024 * 1024
+
+# Set request headers.
+HEADERS = SOURCE_HEADERS["google_scholar"]
+
+# File listing the downloads that failed for good, so that they can be tried again on their own.
+DEAD_LETTER_FILE = "gs_dead_letters.json"
+
+
+def create_pdf_directories():
+    """
+    Set up the directories for saving downloaded PDFs.
+    Returns the path of the gs_pdfs directory and of the content-addressed store.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(script_dir)
+    base_directory_name = "pdfs"
+    gs_pdfs_directory_name = "gs_pdfs"
+    base_directory_path = os.path.join(parent_dir, base_directory_name)
+    gs_pdfs_directory_path = os.path.join(base_directory_path, gs_pdfs_directory_name)
+
+    # Create base PDF directory if it doesn't exist.
+    if not os.path.exists(base_directory_path):
+        os.makedirs(base_directory_path)
+
+    # Create gs_pdfs directory if it doesn't exist.
+    if not os.path.exists(gs_pdfs_directory_path):
+        os.makedirs(gs_pdfs_directory_path)
+
+    return gs_pdfs_directory_path, os.path.join(base_directory_path, STORE_DIRECTORY_NAME)
+
+
+def create_download_job(query_result, query_directory_path):
+    """
+    Create the download job for a query result, or return None if the result has no PDF to download.
+    """
+    if query_result["doc_type"] != "PDF":
+        return None
+
+    try:
+        original_filename = query_result["title"]
+        invalid_chars_pattern = re.compile(r'[\\/:*?"<>|]')
+        valid_filename = re.sub(invalid_chars_pattern, '_', original_filename)
+        valid_filename = valid_filename.strip()
+        filename = valid_filename
+    except TypeError as e:
+        print(f"Could not fetch PDF document: {e}")
+        return None
+
+    return {
+        "url": query_result["doc_link"],
+        "filepath": os.path.join(query_directory_path, f'{filename}.pdf')
+    }
+
+
+def scrape_gs(max_concurrency=1, max_per_host=4, skip_duplicates=False):
+    """
+    Scrape and download PDFs from links stored in a JSON file.
+    The function handles file size limits, and retries for failed downloads.
+    Up to max_concurrency PDFs are downloaded at the same time, at most max_per_host of them from one host.
+    With skip_duplicates, results that metadata_dedup.py found to describe the same work as a result of
+    another source or query are not downloaded; they are marked with the result whose PDF is used instead.
+    """
+    # Initialize counters.
+    pdfs_amount = 0
+
+    # Load search queries from a JSON file.
+    try:
+        queries = load_json("gs_search_results.json")
+    except Exception as e:
+        print(f"Error loading queries results: {e}")
+        return
+
+    gs_pdfs_directory_path, store_directory = create_pdf_directories()
+
+    # Leave out the results whose work is downloaded from another result.
+    duplicates = load_duplicates("google_scholar", index=get_index()) if skip_duplicates else {}
+
+    try:
+        # Collect a download job for each PDF link of each query.
+        jobs = []
+        downloads = []
+        for i, query in enumerate(queries["queries_data"], start=1):
+            query_directory_name = f"query_{i}"
+            query_directory_path = os.path.join(gs_pdfs_directory_path, query_directory_name)
+
+            # Create directory for the query if it doesn't exist.
+            if not os.path.exists(query_directory_path):
+                os.makedirs(query_directory_path)
+
+            # Counter for downloaded PDFs per query
+            query["query_link_statistics"]["downloaded_pdfs_count_query"] = 0
+
+            # Iterate through each query result.
+            for result_index, query_result in enumerate(query["query_results"]):
+                query_result['file_saved'] = False
+                download = {"query_index": i - 1, "result_index": result_index, "status": NOT_SAVED}
+                downloads.append(download)
+                if (i - 1, result_index) in duplicates:
+                    query_result['duplicate_of'] = duplicates[(i - 1, result_index)]
+                    download.update(status=DUPLICATE, duplicate_of=query_result['duplicate_of'])
+                    continue
+                job = create_download_job(query_result, query_directory_path)
+                if job:
+                    job.update({"query_index": i - 1, "result_index": result_index, "query": query,
+                                "query_result": query_result, "download": download})
+                    jobs.append(job)
+
+        # Try downloading each PDF up to 3 times.
+        file_hashes = download_pdfs(jobs, HEADERS, TIMEOUT_IN_S, MAX_FILE_SIZE, attempts=3,
+                                    max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                    store_directory=store_directory, dead_letter_file=DEAD_LETTER_FILE)
+
+        # Record the outcome and the statistics for each query.
+        for job, file_hash in zip(jobs, file_hashes):
+            if "pdf_probe" in job:
+                job["query_result"]['pdf_probe'] = job["download"]["pdf_probe"] = job["pdf_probe"]
+            if file_hash:
+                job["query_result"]['file_saved'] = True
+                job["download"].update(status=SAVED, file_path=job["filepath"], file_hash=file_hash)
+                job["query"]["query_link_statistics"]["downloaded_pdfs_count_query"] += 1
+                pdfs_amount += 1
+
+        # Record the download status of each result in the corpus index.
+        record_downloads(get_index(), "google_scholar", downloads)
+    except Exception as e:
+        print(f"Error handling query results: {e}")
+        return
+
+    # Construct a dictionary and save the final results.
+    result_data = {
+        "total_queries": queries["total_queries"],
+        "total_results": queries["total_results"],
+        "total_pdf_links": queries["total_pdf_links"],
+        "total_downloaded_pdfs": pdfs_amount,
+        "queries_data": queries["queries_data"]
+    }
+
+    # Write the final results to a JSON file.
+    json_file_path = "gs_search_results_updated.json"
+    write_json(json_file_path, result_data)
+
+
+def scrape_gs_stream(follow=False, max_concurrency=1, max_per_host=4, window=100):
+    """
+    Scrape and download PDFs from the record stream of the crawler, one result at a time.
+    The updated records are written to a stream of their own, which is then converted to the updated JSON file,
+    so memory use does not grow with the number of results. With follow, the PDFs are downloaded while the
+    crawler is still writing the stream.
+    """
+    gs_pdfs_directory_path, store_directory = create_pdf_directories()
+    downloaded_pdfs_counts = {}
+
+    # Record the download status of the results in the corpus index after each completed page.
+    index = get_index()
+    results_counts = {}
+    downloads = []
+
+    def read_jobs():
+        for record in iter_records("gs_search_results.ndjson", follow):
+            job = {"record": record}
+            if record["type"] == "result":
+                query_directory_path = os.path.join(gs_pdfs_directory_path, f"query_{record['query_index'] + 1}")
+                os.makedirs(query_directory_path, exist_ok=True)
+                record["result"]['file_saved'] = False
+                job.update(create_download_job(record["result"], query_directory_path) or {})
+                result_index = results_counts.get(record["query_index"], 0)
+                results_counts[record["query_index"]] = result_index + 1
+                job.update({"query_index": record["query_index"], "result_index": result_index})
+                job["download"] = {"query_index": record["query_index"], "result_index": result_index,
+                                   "status": NOT_SAVED}
+            yield job
+
+    try:
+        with open("gs_search_results_updated.ndjson", "w", encoding="utf-8") as updated_stream:
+            # Try downloading each PDF up to 3 times.
+            for job, file_hash in iter_downloads(read_jobs(), HEADERS, TIMEOUT_IN_S, MAX_FILE_SIZE, attempts=3,
+                                                 max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                                 store_directory=store_directory, window=window,
+                                                 dead_letter_file=DEAD_LETTER_FILE):
+                record = job["record"]
+                query_index = record.get("query_index")
+
+                # Record the outcome and the statistics for each query.
+                if "pdf_probe" in job:
+                    record["result"]['pdf_probe'] = job["download"]["pdf_probe"] = job["pdf_probe"]
+                if record["type"] == "result" and file_hash:
+                    record["result"]['file_saved'] = True
+                    job["download"].update(status=SAVED, file_path=job["filepath"], file_hash=file_hash)
+                    downloaded_pdfs_counts[query_index] = downloaded_pdfs_counts.get(query_index, 0) + 1
+                elif record["type"] in ("page", "query_end"):
+                    record["query_link_statistics"]["downloaded_pdfs_count_query"] = \
+                        downloaded_pdfs_counts.get(query_index, 0)
+                    record_downloads(index, "google_scholar", downloads)
+                    downloads.clear()
+                if record["type"] == "result":
+                    downloads.append(job["download"])
+                append_records(updated_stream, [record], sync=False)
+            append_records(updated_stream, [{"type": "end"}])
+            record_downloads(index, "google_scholar", downloads)
+    except Exception as e:
+        print(f"Error handling query results: {e}")
+        return
+
+    # Write the final results to a JSON file.
+    with timer("json_write_seconds", file="gs_search_results_updated.json"):
+        records_to_nested("gs_search_results_updated.ndjson", "gs_search_results_updated.json", indent=2)
+
+
+def retry_failed_gs(max_concurrency=1, max_per_host=4):
+    """
+    Try again to download the PDFs that failed for good in the last run, as listed in the dead-letter file,
+    and mark the ones that are saved now in the updated JSON file. The downloads that still fail are written
+    back to the dead-letter file.
+    """
+    dead_letters = load_dead_letters(DEAD_LETTER_FILE)
+    if not dead_letters:
+        print(f"No failed downloads listed in {DEAD_LETTER_FILE}.")
+        return
+
+    try:
+        queries = load_json("gs_search_results_updated.json")
+    except Exception as e:
+        print(f"Error loading updated query results: {e}")
+        return
+
+    _, store_directory = create_pdf_directories()
+
+    # Try downloading each PDF up to 3 times again.
+    file_hashes = download_pdfs(dead_letters, HEADERS, TIMEOUT_IN_S, MAX_FILE_SIZE, attempts=3,
+                                max_concurrency=max_concurrency, max_per_host=max_per_host,
+                                store_directory=store_directory, dead_letter_file=DEAD_LETTER_FILE)
+
+    # Record the PDFs that were saved this time and the probes of the links.
+    downloads = []
+    for dead_letter, file_hash in zip(dead_letters, file_hashes):
+        if "query_index" not in dead_letter:
+            continue
+        query = queries["queries_data"][dead_letter["query_index"]]
+        query_result = query["query_results"][dead_letter["result_index"]]
+        download = {"query_index": dead_letter["query_index"], "result_index": dead_letter["result_index"],
+                    "status": NOT_SAVED}
+        if "pdf_probe" in dead_letter:
+            query_result['pdf_probe'] = download["pdf_probe"] = dead_letter["pdf_probe"]
+        if file_hash:
+            query_result['file_saved'] = True
+            download.update(status=SAVED, file_path=dead_letter["filepath"], file_hash=file_hash)
+            query["query_link_statistics"]["downloaded_pdfs_count_query"] += 1
+            queries["total_downloaded_pdfs"] += 1
+        downloads.append(download)
+    record_downloads(get_index(), "google_scholar", downloads)
+    saved_count = sum(1 for file_hash in file_hashes if file_hash)
+    print(f"{saved_count} of {len(dead_letters)} failed downloads have been saved.")
+
+    write_json("gs_search_results_updated.json", queries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the PDFs found by the Google Scholar crawler.")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of simultaneous downloads")
+    parser.add_argument("--per-host", type=int, default=4, help="maximum number of simultaneous downloads per host")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the results one at a time from gs_search_results.ndjson")
+    parser.add_argument("--follow", action="store_true",
+                        help="like --stream, but keep reading while the crawler is still writing the results")
+    parser.add_argument("--skip-duplicates", action="store_true",
+                        help="do not download the results that metadata_dedup.py found in another source or query "
+                             "(not with --stream)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help=f"only try again the downloads that failed in the last run, listed in {DEAD_LETTER_FILE}")
+    parser.add_argument("--no-index", action="store_true", help="do not record the downloads in the corpus index")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="fetch everything in full instead of revalidating the HTTP cache")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    args = parser.parse_args()
+
+    # Bypass the HTTP cache and the corpus index if requested.
+    if args.no_cache:
+        configure(use_cache=False)
+    if args.no_index:
+        configure_index(use_index=False)
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    if args.retry_failed:
+        retry_failed_gs(max_concurrency=args.concurrency, max_per_host=args.per_host)
+    elif args.stream or args.follow:
+        scrape_gs_stream(follow=args.follow, max_concurrency=args.concurrency, max_per_host=args.per_host)
+    else:
+        scrape_gs(max_concurrency=args.concurrency, max_per_host=args.per_host,
+                  skip_duplicates=args.skip_duplicates)
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)
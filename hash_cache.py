@@ -0,0 +1,124 @@
+import os
+import sqlite3
+
+
+def open_cache(cache_path):
+    """
+    Open the SQLite hash cache, creating it if it doesn't exist.
+    Each file is stored with its size, modification time and inode, so that a changed file is not served
+    from the cache.
+    """
+    connection = sqlite3.connect(cache_path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS file_hashes ("
+        "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, partial_hash TEXT, full_hash TEXT)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS fingerprints (full_hash TEXT PRIMARY KEY, word_count INTEGER, signature BLOB)"
+    )
+    return connection
+
+
+def lookup_hashes(connection, filepaths, stats, column):
+    """
+    Return the cached hashes of the given kind ("partial_hash" or "full_hash") for the files whose size,
+    modification time and inode are unchanged, as a dictionary of path -> hash.
+    """
+    cached_hashes = {}
+    for filepath, stat in zip(filepaths, stats):
+        row = connection.execute(
+            f"SELECT size, mtime_ns, inode, {column} FROM file_hashes WHERE path = ?", (os.path.abspath(filepath),)
+        ).fetchone()
+        if row and row[3] and tuple(row[:3]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            cached_hashes[filepath] = row[3]
+    return cached_hashes
+
+
+def store_hashes(connection, filepaths, stats, column, hashes):
+    """
+    Store hashes of the given kind for the given files.
+    An entry whose size, modification time or inode changed loses its other hash.
+    """
+    for filepath, stat, file_hash in zip(filepaths, stats, hashes):
+        path = os.path.abspath(filepath)
+        file_status = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        row = connection.execute("SELECT size, mtime_ns, inode FROM file_hashes WHERE path = ?", (path,)).fetchone()
+        if row and tuple(row) == file_status:
+            connection.execute(f"UPDATE file_hashes SET {column} = ? WHERE path = ?", (file_hash, path))
+        else:
+            connection.execute(
+                f"INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, {column}) VALUES (?, ?, ?, ?, ?)",
+                (path, *file_status, file_hash)
+            )
+    connection.commit()
+
+
+def lookup_fingerprints(connection, file_hashes):
+    """
+    Return the cached text fingerprints of the files with the given SHA-256 hashes, as a dictionary of
+    hash -> (word count, signature). The signature is None for a file without enough text.
+    Fingerprints are kept by content, so they stay valid when a file is moved, renamed or deleted.
+    """
+    fingerprints = {}
+    for file_hash in file_hashes:
+        row = connection.execute("SELECT word_count, signature FROM fingerprints WHERE full_hash = ?",
+                                 (file_hash,)).fetchone()
+        if row:
+            fingerprints[file_hash] = row
+    return fingerprints
+
+
+def store_fingerprints(connection, file_hashes, fingerprints):
+    """
+    Store the text fingerprints, as (word count, signature) pairs, of the files with the given SHA-256 hashes.
+    """
+    connection.executemany("INSERT OR REPLACE INTO fingerprints (full_hash, word_count, signature) VALUES (?, ?, ?)",
+                           [(file_hash, *fingerprint) for file_hash, fingerprint in zip(file_hashes, fingerprints)])
+    connection.commit()
+
+
+def evict_missing(connection, directory, filepaths):
+    """
+    Remove the entries of files below the directory that are not in the given list of existing files.
+    Returns the number of removed entries.
+    """
+    existing_paths = {os.path.abspath(filepath) for filepath in filepaths}
+    prefix = os.path.join(os.path.abspath(directory), "")
+    stale_paths = [(path,) for (path,) in connection.execute("SELECT path FROM file_hashes")
+                   if path.startswith(prefix) and path not in existing_paths]
+    connection.executemany("DELETE FROM file_hashes WHERE path = ?", stale_paths)
+    connection.commit()
+    return len(stale_paths)
+
+
+def verify_cache(connection, calculate_partial_hash, calculate_hash):
+    """
+    Check every entry of the cache against the file on disk and remove the entries that are wrong.
+    Returns the number of valid entries, of entries whose file is missing or changed and of entries
+    whose hash does not match the file's content.
+    """
+    valid_count = 0
+    stale_count = 0
+    mismatched_count = 0
+
+    rows = connection.execute("SELECT path, size, mtime_ns, inode, partial_hash, full_hash FROM file_hashes").fetchall()
+    for path, size, mtime_ns, inode, partial_hash, full_hash in rows:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+
+        if stat is None or (stat.st_size, stat.st_mtime_ns, stat.st_ino) != (size, mtime_ns, inode):
+            stale_count += 1
+        elif (partial_hash and calculate_partial_hash(path, size) != partial_hash) or \
+                (full_hash and calculate_hash(path) != full_hash):
+            print(f"Cached hash does not match the file: {path}")
+            mismatched_count += 1
+        else:
+            valid_count += 1
+            continue
+
+        connection.execute("DELETE FROM file_hashes WHERE path = ?", (path,))
+
+    connection.commit()
+    return valid_count, stale_count, mismatched_count
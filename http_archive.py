@@ -0,0 +1,88 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Archive of recorded responses, next to the "pdfs" directory.
+ARCHIVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_archive.db")
+
+# Modes of the archive: responses are recorded to it while they are fetched, or replayed from it instead.
+RECORD = "record"
+REPLAY = "replay"
+
+# Response headers that are not recorded, since the body is stored decoded and in full.
+SKIPPED_HEADERS = ("Content-Encoding", "Content-Length", "Transfer-Encoding", "Connection", "Keep-Alive")
+
+# Compression level of the recorded bodies.
+COMPRESSION_LEVEL = 6
+
+
+def open_archive(archive_file=ARCHIVE_FILE, mode=RECORD):
+    """
+    Open the HTTP archive in the given mode, creating it if it doesn't exist.
+    The archive holds the last response to each URL with its status, headers and compressed body.
+    """
+    connection = sqlite3.connect(archive_file, check_same_thread=False)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "url TEXT PRIMARY KEY, status_code INTEGER, reason TEXT, headers TEXT, body BLOB, recorded REAL)"
+    )
+    connection.commit()
+    return {"connection": connection, "lock": threading.Lock(), "mode": mode}
+
+
+def record_response(archive, url, response):
+    """
+    Record a response to a URL, replacing an earlier one. The body must not be streamed.
+    """
+    headers = {name: value for name, value in response.headers.items() if name.title() not in SKIPPED_HEADERS}
+    with archive["lock"]:
+        archive["connection"].execute(
+            "INSERT OR REPLACE INTO responses (url, status_code, reason, headers, body, recorded) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, response.status_code, response.reason, json.dumps(headers),
+             zlib.compress(response.content, COMPRESSION_LEVEL), time.time())
+        )
+        archive["connection"].commit()
+
+
+def replay_response(archive, url):
+    """
+    Return the recorded response to a URL as a response object, without sending a request.
+    A URL that was not recorded fails like a request that cannot connect.
+    """
+    with archive["lock"]:
+        row = archive["connection"].execute(
+            "SELECT status_code, reason, headers, body FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+    if row is None:
+        raise requests.exceptions.ConnectionError(f"No response to {url} in the HTTP archive")
+
+    status_code, reason, headers, body = row
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(json.loads(headers))
+    response._content = zlib.decompress(body)
+    response._content_consumed = True
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.elapsed = datetime.timedelta(0)
+    return response
+
+
+def count_responses(archive):
+    """
+    Return the number of recorded responses and the compressed size of their bodies in bytes.
+    """
+    with archive["lock"]:
+        return archive["connection"].execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM responses"
+        ).fetchone()
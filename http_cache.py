@@ -0,0 +1,183 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Directory of the HTTP cache, next to the "pdfs" directory.
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_cache")
+
+# Total size in bytes of the cached bodies and of the PDFs cached responses were saved as, beyond which the least
+# recently used responses are evicted.
+MAX_CACHE_SIZE = 512 * 1024 * 1024
+
+
+def open_cache(directory=CACHE_DIRECTORY, max_size=MAX_CACHE_SIZE):
+    """
+    Open the HTTP cache in the directory, creating it if it doesn't exist.
+    The cache holds the validators (ETag and Last-Modified) of each URL together with either its body, which is
+    kept in a file of its own, or the hash of the PDF it was saved as in the content-addressed store.
+    The total size of the entries is kept in a table of its own, so that it is not summed up on every store.
+    """
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_type TEXT, body_file TEXT, file_hash TEXT, "
+        "size INTEGER, last_used REAL)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+    connection.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)")
+    # Caches created before the total was kept are summed up once.
+    connection.execute("INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+    connection.commit()
+    return {"directory": directory, "connection": connection, "max_size": max_size, "lock": threading.Lock()}
+
+
+def lookup(cache, url):
+    """
+    Return the cache entry of a URL as a dictionary, or None if the URL is not cached.
+    """
+    with cache["lock"]:
+        row = cache["connection"].execute(
+            "SELECT etag, last_modified, content_type, body_file, file_hash FROM responses WHERE url = ?", (url,)
+        ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(("etag", "last_modified", "content_type", "body_file", "file_hash"), row))
+
+
+def conditional_headers(entry):
+    """
+    Return the headers that ask the server to answer with 304 if the cached response is still current.
+    """
+    headers = {}
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def read_body(cache, entry):
+    """
+    Return the cached body of an entry, or None if the entry has none or its file is missing.
+    """
+    if not entry["body_file"]:
+        return None
+    try:
+        with open(os.path.join(cache["directory"], entry["body_file"]), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def touch(cache, url):
+    """
+    Mark the entry of a URL as used, so that it is evicted last.
+    """
+    with cache["lock"]:
+        cache["connection"].execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+        cache["connection"].commit()
+
+
+def get_total_size(cache):
+    """
+    Return the total size in bytes of the cache entries.
+    """
+    with cache["lock"]:
+        return cache["connection"].execute("SELECT total FROM cache_size").fetchone()[0]
+
+
+def _add_to_total_size(cache, size):
+    """
+    Change the total size of the cache entries by the given number of bytes. Must hold the lock.
+    """
+    cache["connection"].execute("UPDATE cache_size SET total = total + ?", (size,))
+
+
+def store_response(cache, url, response, body=None, file_hash=None, size=None):
+    """
+    Cache a response together with its body or the hash of the PDF it was saved as.
+    The size of an entry is that of its body, or that of the PDF, which is given as size, so that PDFs are
+    evicted like pages.
+    Responses without an ETag or Last-Modified header cannot be revalidated and are not cached.
+    """
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not (etag or last_modified):
+        return
+
+    body_file = None
+    if body is not None:
+        # Write the body to a temporary file first, so that a reader never sees a partial body.
+        body_file = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        temp_path = os.path.join(cache["directory"], f"{uuid.uuid4().hex}.part")
+        with open(temp_path, "wb") as f:
+            f.write(body)
+        os.replace(temp_path, os.path.join(cache["directory"], body_file))
+
+    size = len(body) if body is not None else (size or 0)
+    with cache["lock"]:
+        connection = cache["connection"]
+        row = connection.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        replaced_size = (row[0] or 0) if row else 0
+        connection.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(url, etag, last_modified, content_type, body_file, file_hash, size, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, response.headers.get("Content-Type"), body_file, file_hash, size,
+             time.time())
+        )
+        _add_to_total_size(cache, size - replaced_size)
+        connection.commit()
+    evict(cache)
+
+
+def remove(cache, url):
+    """
+    Remove the entry of a URL and its body from the cache.
+    """
+    with cache["lock"]:
+        _remove_entries(cache, [url])
+        cache["connection"].commit()
+
+
+def _remove_entries(cache, urls):
+    """
+    Remove the entries of the URLs and their bodies. Must hold the lock.
+    """
+    for url in urls:
+        row = cache["connection"].execute("SELECT body_file, size FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            continue
+        if row[0]:
+            try:
+                os.remove(os.path.join(cache["directory"], row[0]))
+            except FileNotFoundError:
+                pass
+        cache["connection"].execute("DELETE FROM responses WHERE url = ?", (url,))
+        _add_to_total_size(cache, -(row[1] or 0))
+
+
+def evict(cache):
+    """
+    Evict the least recently used entries until the entries fit into the maximum size.
+    Returns the number of evicted entries.
+    """
+    with cache["lock"]:
+        connection = cache["connection"]
+        total_size = connection.execute("SELECT total FROM cache_size").fetchone()[0]
+        if total_size <= cache["max_size"]:
+            return 0
+
+        evicted_urls = []
+        for url, size in connection.execute("SELECT url, size FROM responses ORDER BY last_used"):
+            if total_size <= cache["max_size"]:
+                break
+            evicted_urls.append(url)
+            total_size -= size or 0
+        _remove_entries(cache, evicted_urls)
+        connection.commit()
+        return len(evicted_urls)
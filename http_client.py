@@ -0,0 +1,227 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+
+from http_archive import ARCHIVE_FILE, REPLAY, open_archive, record_response, replay_response
+from http_cache import (CACHE_DIRECTORY, MAX_CACHE_SIZE, conditional_headers, lookup, open_cache, read_body,
+                        store_response, touch)
+from metrics import increment, is_enabled, observe
+
+# Number of connections kept alive per host.
+POOL_SIZE = 10
+
+# Number of times a request is retried after its connection could not be established.
+RETRIES = 2
+
+# Timeout in seconds of requests that do not set their own.
+TIMEOUT_IN_S = 10
+
+# Request headers that mimic a browser, by source.
+SOURCE_HEADERS = {
+    "google_scholar": {
+        "User-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                      "Chrome/105.0.0.0 Safari/537.36 "
+    },
+    "acm": {
+        "User-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                      "Chrome/105.0.0.0 Safari/537.36 "
+    },
+    "core": {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                      'Chrome/58.0.3029.110 Safari/537.3'
+    }
+}
+
+# Settings of the shared session and the session, HTTP cache and HTTP archive themselves, which are created on
+# first use. The archive is only used with an archive mode, to record responses or to replay them.
+_settings = {"pool_size": POOL_SIZE, "retries": RETRIES, "timeout_in_s": TIMEOUT_IN_S, "use_cache": True,
+             "cache_directory": CACHE_DIRECTORY, "max_cache_size": MAX_CACHE_SIZE, "archive_mode": None,
+             "archive_file": ARCHIVE_FILE}
+_session = {"session": None, "cache": None, "archive": None}
+
+# Serializes the creation of the shared session, cache and archive.
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size=POOL_SIZE, retries=RETRIES):
+    """
+    Create a session that keeps up to pool_size connections per host alive and retries requests whose
+    connection could not be established. Responses are never retried, so a request is not sent twice.
+    """
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=Retry(total=retries, connect=retries, read=0, status=0, redirect=None,
+                                            backoff_factor=0.5, raise_on_status=False))
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure(pool_size=None, retries=None, timeout_in_s=None, use_cache=None, cache_directory=None,
+              max_cache_size=None, archive_mode=None, archive_file=None):
+    """
+    Change the settings of the shared session, HTTP cache and HTTP archive. They are created anew with them on
+    their next use. With archive_mode http_archive.RECORD, responses are recorded to the archive file, and with
+    http_archive.REPLAY, they are served from it without sending any requests.
+    """
+    with _session_lock:
+        for key, value in (("pool_size", pool_size), ("retries", retries), ("timeout_in_s", timeout_in_s),
+                           ("use_cache", use_cache), ("cache_directory", cache_directory),
+                           ("max_cache_size", max_cache_size), ("archive_mode", archive_mode),
+                           ("archive_file", archive_file)):
+            if value is not None:
+                _settings[key] = value
+        _session["session"] = None
+        _session["cache"] = None
+        _session["archive"] = None
+
+
+def ensure_pool_size(pool_size):
+    """
+    Make sure the shared session keeps at least pool_size connections per host alive, so that that many
+    simultaneous requests to a host can all reuse their connections.
+    An existing session is resized in place, so that it keeps its cookies and the cache and archive stay open.
+    """
+    with _session_lock:
+        if pool_size <= _settings["pool_size"]:
+            return
+        _settings["pool_size"] = pool_size
+        if _session["session"] is None:
+            return
+        # Both schemes share one adapter. Requests under way return their connections to the old pools.
+        for adapter in set(_session["session"].adapters.values()):
+            adapter.init_poolmanager(pool_size, pool_size, adapter._pool_block)
+
+
+def get_session():
+    """
+    Return the shared session, creating it if necessary.
+    """
+    with _session_lock:
+        if _session["session"] is None:
+            _session["session"] = create_session(_settings["pool_size"], _settings["retries"])
+        return _session["session"]
+
+
+def get_cache():
+    """
+    Return the shared HTTP cache, opening it if necessary, or None if caching is turned off.
+    """
+    with _session_lock:
+        if not _settings["use_cache"]:
+            return None
+        if _session["cache"] is None:
+            _session["cache"] = open_cache(_settings["cache_directory"], _settings["max_cache_size"])
+        return _session["cache"]
+
+
+def get_archive():
+    """
+    Return the shared HTTP archive, opening it if necessary, or None without an archive mode.
+    """
+    with _session_lock:
+        if _settings["archive_mode"] is None:
+            return None
+        if _session["archive"] is None:
+            _session["archive"] = open_archive(_settings["archive_file"], _settings["archive_mode"])
+        return _session["archive"]
+
+
+def is_replaying():
+    """
+    Return whether responses are replayed from the HTTP archive instead of being fetched.
+    """
+    return _settings["archive_mode"] == REPLAY
+
+
+def send(url, **kwargs):
+    """
+    Send a GET request through the shared session and record its duration, the time until its headers
+    arrived, its status or error and, unless the body is streamed, the size of its body.
+    """
+    if not is_enabled():
+        return get_session().get(url, **kwargs)
+
+    host = urlparse(url).netloc
+    start = time.perf_counter()
+    try:
+        response = get_session().get(url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        observe("http_request_seconds", time.perf_counter() - start, host=host)
+        increment("http_requests_total", host=host, status=type(e).__name__)
+        raise
+    observe("http_request_seconds", time.perf_counter() - start, host=host)
+    observe("http_time_to_headers_seconds", response.elapsed.total_seconds(), host=host)
+    increment("http_requests_total", host=host, status=response.status_code)
+    if not kwargs.get("stream"):
+        increment("http_response_bytes_total", len(response.content), host=host)
+    return response
+
+
+def fetch(url, **kwargs):
+    """
+    Send a GET request through the shared session. Unless the body is streamed, a cached response is
+    revalidated with the server and served from the HTTP cache if it is still current.
+    """
+    cache = None if kwargs.get("stream") else get_cache()
+    if cache is None:
+        return send(url, **kwargs)
+
+    # The cache is keyed by the full URL, including the query parameters.
+    url = requests.Request("GET", url, params=kwargs.pop("params", None)).prepare().url
+    entry = lookup(cache, url)
+    body = read_body(cache, entry) if entry else None
+    headers = dict(kwargs.pop("headers", None) or {})
+    if body is not None:
+        headers.update(conditional_headers(entry))
+
+    response = send(url, headers=headers, **kwargs)
+    if response.status_code == 304 and body is not None:
+        # Serve the unchanged body from the cache.
+        increment("http_cache_hits_total", host=urlparse(url).netloc)
+        touch(cache, url)
+        response.status_code = 200
+        response._content = body
+        if entry["content_type"]:
+            response.headers["Content-Type"] = entry["content_type"]
+        response.encoding = get_encoding_from_headers(response.headers)
+    elif response.status_code == 200:
+        store_response(cache, url, response, body=response.content)
+    return response
+
+
+def get(url, **kwargs):
+    """
+    Send a GET request through the shared session, with the default timeout unless one is given.
+    Takes the same keyword arguments as requests.get().
+    Unless the body is streamed, a cached response is revalidated with the server and served from the
+    HTTP cache if it is still current.
+    When recording, every response whose body is not streamed is also recorded to the HTTP archive, and when
+    replaying, the recorded response is returned instead without sending a request.
+    """
+    kwargs.setdefault("timeout", _settings["timeout_in_s"])
+    archive = get_archive()
+    if archive is None:
+        return fetch(url, **kwargs)
+
+    # The archive is keyed by the full URL, including the query parameters.
+    url = requests.Request("GET", url, params=kwargs.pop("params", None)).prepare().url
+    if archive["mode"] == REPLAY:
+        try:
+            response = replay_response(archive, url)
+        except requests.exceptions.ConnectionError:
+            increment("http_archive_misses_total", host=urlparse(url).netloc)
+            raise
+        increment("http_archive_replays_total", host=urlparse(url).netloc)
+        return response
+
+    response = fetch(url, **kwargs)
+    if not kwargs.get("stream"):
+        record_response(archive, url, response)
+        increment("http_archive_records_total", host=urlparse(url).netloc)
+    return response
@@ -0,0 +1,336 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import unicodedata
+
+from corpus_index import NOT_SAVED, SAVED, find_results
+
+# Results files of the crawlers by source, in the order in which a work's PDF is preferred.
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILES = {
+    "google_scholar": os.path.join(ROOT_DIRECTORY, "google_scholar", "gs_search_results.json"),
+    "acm": os.path.join(ROOT_DIRECTORY, "acm", "acm_search_results.json"),
+    "core": os.path.join(ROOT_DIRECTORY, "core", "core_search_results.json"),
+}
+
+# File listing the works that were found more than once.
+DUPLICATE_WORKS_FILE = os.path.join(ROOT_DIRECTORY, "duplicate_works.json")
+
+# Share of title words two records must have in common to be the same work.
+TITLE_SIMILARITY = 0.8
+
+# Titles with fewer words are only matched exactly, since short titles are often shared by different works.
+MIN_TITLE_WORDS = 3
+
+# MinHash signatures of the title words are split into bands; records that agree on all values of a band
+# become candidates. With 8 bands of 4 values, titles that share 80% of their words become candidates with a
+# probability of about 98%, titles that share 50% with about 40%.
+BANDS = 8
+ROWS = 4
+
+# Number of records of an LSH bucket or a title a record is compared with, so that very common titles do not
+# make the comparisons grow quadratically.
+MAX_CANDIDATES = 100
+
+# Prime modulus and coefficients of the hash functions of the MinHash signatures. The coefficients are fixed,
+# so signatures do not change between runs.
+_PRIME = (1 << 61) - 1
+_generator = random.Random(0)
+_COEFFICIENTS = [(_generator.randrange(1, _PRIME), _generator.randrange(_PRIME)) for _ in range(BANDS * ROWS)]
+
+DOI_PATTERN = re.compile(r'10\.\d{4,9}/[^\s"<>?#&]+')
+
+
+def normalize_text(text):
+    """
+    Lowercase a text, strip its accents and replace everything but letters and digits with spaces.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def extract_dois(*texts):
+    """
+    Return the DOIs found in URLs or other texts, lowercased.
+    """
+    dois = set()
+    for text in texts:
+        for doi in DOI_PATTERN.findall(text or ""):
+            dois.add(doi.rstrip(".,;)").lower())
+    return dois
+
+
+def author_names(authors):
+    """
+    Return the names of a list of authors as a set of normalized words, leaving out initials.
+    Sources write names in different orders ("AS Villar", "Andrianto Susilo", "Dzhu O. S."), so the words of
+    the names are compared rather than the names themselves.
+    """
+    names = set()
+    for author in authors:
+        for word in (author or "").split():
+            # Initials are either abbreviated ("O.") or written in capitals ("AS").
+            if word.endswith(".") or (word.isupper() and len(word) <= 3):
+                continue
+            word = normalize_text(word)
+            if len(word) >= 2:
+                names.add(word)
+    return names
+
+
+def make_record(source, query_index, result_index, result):
+    """
+    Extract the fields that identify a work from a result of a source.
+    """
+    if source == "google_scholar":
+        # The authors are listed in the publication info before the venue, e.g. "AS Villar, N Khan - Journal".
+        publication_info = result.get("publication_info") or ""
+        authors = publication_info.split("\xa0- ")[0].split(" - ")[0].split(",")
+        dois = extract_dois(result.get("title_link"), result.get("doc_link"))
+        pdf_url = result.get("doc_link") if result.get("doc_type") == "PDF" else None
+        title = result.get("title")
+    elif source == "acm":
+        authors = result.get("authors") or []
+        dois = extract_dois(result.get("title_link"), result.get("doc_link"), result.get("publication_info"))
+        pdf_url = result.get("doc_link")
+        title = result.get("title") if result.get("title") != "No Title" else None
+    else:
+        authors = result.get("authors") or []
+        dois = extract_dois(result.get("pdf_link"))
+        pdf_link = result.get("pdf_link")
+        pdf_url = pdf_link if pdf_link and pdf_link.startswith("http") else None
+        title = result.get("title")
+
+    return {
+        "source": source,
+        "query_index": query_index,
+        "result_index": result_index,
+        "title": title,
+        "title_key": normalize_text(title),
+        "authors": author_names(authors),
+        "dois": dois,
+        "pdf_url": pdf_url,
+    }
+
+
+def load_records(results_files=RESULTS_FILES):
+    """
+    Read the results files of the sources and return a record for each result.
+    Missing files are skipped.
+    """
+    records = []
+    for source, results_file in results_files.items():
+        if not os.path.exists(results_file):
+            print(f"No results file for {source}: {results_file}")
+            continue
+        with open(results_file, "r", encoding="utf-8") as json_file:
+            data = json.load(json_file)
+        for query_index, query_data in enumerate(data["queries_data"]):
+            for result_index, result in enumerate(query_data["query_results"]):
+                records.append(make_record(source, query_index, result_index, result))
+    return records
+
+
+def minhash_signature(words, word_hashes):
+    """
+    Return the MinHash signature of a set of words. The hashes of each word are kept in word_hashes, so that
+    they are calculated once per distinct word.
+    """
+    columns = []
+    for word in words:
+        hashes = word_hashes.get(word)
+        if hashes is None:
+            value = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+            hashes = word_hashes[word] = [(a * value + b) % _PRIME for a, b in _COEFFICIENTS]
+        columns.append(hashes)
+    return [min(values) for values in zip(*columns)]
+
+
+def same_work(record, other, title_similarity=TITLE_SIMILARITY):
+    """
+    Check if two records with similar titles describe the same work: their title words must overlap enough
+    and, if both name authors, they must share at least one of them.
+    """
+    if record["authors"] and other["authors"] and not record["authors"] & other["authors"]:
+        return False
+    words, other_words = record["title_words"], other["title_words"]
+    return len(words & other_words) >= title_similarity * len(words | other_words)
+
+
+def find_root(parents, index):
+    """
+    Return the representative of the cluster of a record, shortening the path to it on the way.
+    """
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+def cluster_records(records, title_similarity=TITLE_SIMILARITY):
+    """
+    Group the records that describe the same work and return the cluster number of each record.
+    Records are joined if they share a DOI, or if their titles match exactly or nearly and their authors
+    overlap. Candidates are looked up in inverted indexes of the DOIs and titles and in the buckets of a
+    MinHash LSH index of the title words, so records are never compared pairwise.
+    """
+    parents = list(range(len(records)))
+
+    def join(index, other_index):
+        root, other_root = find_root(parents, index), find_root(parents, other_index)
+        if root != other_root:
+            parents[max(root, other_root)] = min(root, other_root)
+
+    doi_index = {}
+    title_index = {}
+    buckets = {}
+    word_hashes = {}
+
+    for index, record in enumerate(records):
+        # A shared DOI identifies a work on its own.
+        for doi in record["dois"]:
+            if doi in doi_index:
+                join(index, doi_index[doi])
+            else:
+                doi_index[doi] = index
+
+        if not record["title_key"]:
+            continue
+        record["title_words"] = set(record["title_key"].split())
+
+        # Identical titles.
+        same_title = title_index.setdefault(record["title_key"], [])
+        for other_index in same_title[:MAX_CANDIDATES]:
+            if same_work(record, records[other_index], title_similarity):
+                join(index, other_index)
+        same_title.append(index)
+
+        # Similar titles, from the LSH buckets the record falls into.
+        if len(record["title_words"]) < MIN_TITLE_WORDS:
+            continue
+        signature = minhash_signature(record["title_words"], word_hashes)
+        candidates = set()
+        for band in range(BANDS):
+            bucket = buckets.setdefault((band, tuple(signature[band * ROWS:(band + 1) * ROWS])), [])
+            candidates.update(bucket[:MAX_CANDIDATES])
+            bucket.append(index)
+        for other_index in sorted(candidates):
+            if find_root(parents, index) != find_root(parents, other_index) and \
+                    same_work(record, records[other_index], title_similarity):
+                join(index, other_index)
+
+    # Number the clusters in the order of their first record.
+    cluster_numbers = {}
+    return [cluster_numbers.setdefault(find_root(parents, index), len(cluster_numbers))
+            for index in range(len(records))]
+
+
+def record_reference(record):
+    """
+    Return the fields that locate a record in the results files.
+    """
+    return {"source": record["source"], "query_index": record["query_index"], "result_index": record["result_index"]}
+
+
+def find_duplicate_works(records, title_similarity=TITLE_SIMILARITY):
+    """
+    Cluster the records and describe each work that was found more than once.
+    The primary record of a work is the first one with a PDF link, in the order of RESULTS_FILES; its PDF is
+    the one that is downloaded for the work.
+    """
+    clusters = {}
+    for record, cluster_number in zip(records, cluster_records(records, title_similarity)):
+        clusters.setdefault(cluster_number, []).append(record)
+
+    works = []
+    for cluster in clusters.values():
+        if len(cluster) < 2:
+            continue
+        primary = next((record for record in cluster if record["pdf_url"]), None)
+        works.append({
+            "title": next((record["title"] for record in cluster if record["title"]), None),
+            "dois": sorted(set().union(*(record["dois"] for record in cluster))),
+            "primary": record_reference(primary) if primary else None,
+            "records": [dict(record_reference(record), title=record["title"], pdf_url=record["pdf_url"])
+                        for record in cluster],
+        })
+
+    return {
+        "total_records": len(records),
+        "total_works": len(clusters),
+        "duplicate_records": sum(len(work["records"]) - 1 for work in works),
+        "works": works,
+    }
+
+
+def pdf_result(work, downloads):
+    """
+    Return the reference of the result a work's PDF is downloaded from, or None if there is none left to try.
+    downloads maps the source, query index and result index of the results in the corpus index to their entry.
+    The first result with a PDF link whose PDF is available is preferred. Otherwise the first one whose download
+    has never failed is chosen, so that every copy is tried once after the primary result's download failed.
+    A failed result that was left out as a duplicate later on is still counted as failed.
+    """
+    candidates = [record for record in work["records"] if record["pdf_url"]]
+    for record in candidates:
+        download = downloads.get((record["source"], record["query_index"], record["result_index"]))
+        if download and download["download_status"] == SAVED and \
+                (download["file_deleted"] or os.path.exists(download["file_path"] or "")):
+            return record_reference(record)
+    for record in candidates:
+        download = downloads.get((record["source"], record["query_index"], record["result_index"]))
+        if not download or not (download["download_failed"] or download["download_status"] == NOT_SAVED):
+            return record_reference(record)
+    return None
+
+
+def load_duplicates(source, duplicate_works_file=DUPLICATE_WORKS_FILE, index=None):
+    """
+    Return the results of a source whose work is downloaded from another result, keyed by their query index
+    and result index, with the reference of that other result as value.
+    With the corpus index, a work is downloaded from its primary result only while that result's PDF is saved
+    or not tried yet. Once its download failed, the next result with a PDF link is used, and if all of them
+    failed, none of the work's results is left out.
+    """
+    if not os.path.exists(duplicate_works_file):
+        print(f"No duplicate works file found at {duplicate_works_file}; run metadata_dedup.py first.")
+        return {}
+
+    with open(duplicate_works_file, "r", encoding="utf-8") as json_file:
+        works = json.load(json_file)["works"]
+
+    downloads = {}
+    if index is not None:
+        downloads = {(download["source"], download["query_index"], download["result_index"]): download
+                     for download in find_results(index)}
+
+    duplicates = {}
+    for work in works:
+        reference = pdf_result(work, downloads) if work["primary"] else None
+        if reference is None:
+            continue
+        for record in work["records"]:
+            if record["source"] == source and record_reference(record) != reference:
+                duplicates[(record["query_index"], record["result_index"])] = reference
+    return duplicates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the works that appear in the results of several sources "
+                                                 "or queries, so that their PDFs are downloaded once.")
+    parser.add_argument("--output", default=DUPLICATE_WORKS_FILE, help="path of the duplicate works file")
+    parser.add_argument("--similarity", type=float, default=TITLE_SIMILARITY,
+                        help="share of title words two records must have in common to be the same work")
+    args = parser.parse_args()
+
+    all_records = load_records()
+    duplicate_works = find_duplicate_works(all_records, args.similarity)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(duplicate_works, output_file, ensure_ascii=False, indent=2)
+    print(f"{duplicate_works['total_records']} results describe {duplicate_works['total_works']} works; "
+          f"{duplicate_works['duplicate_records']} results duplicate another one.")
+    print(f"The duplicate works have been saved to {args.output}.")
@@ -0,0 +1,209 @@
+import contextlib
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the buckets of the duration histograms.
+DURATION_BUCKETS_IN_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Metrics are only recorded once they are enabled; until then every function returns at once.
+_state = {"enabled": False}
+
+# Counters and histograms by name and labels. A label set is a sorted tuple of (name, value) pairs.
+# Each histogram holds the count of each bucket, the number of observations and their sum.
+_counters = {}
+_histograms = {}
+
+# Serializes the updates of the metrics, which come from the crawling, download and hashing threads.
+_metrics_lock = threading.Lock()
+
+# Context manager returned by timer() while the metrics are disabled.
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable():
+    """
+    Start recording metrics.
+    """
+    _state["enabled"] = True
+
+
+def is_enabled():
+    """
+    Check if metrics are being recorded.
+    """
+    return _state["enabled"]
+
+
+def reset():
+    """
+    Discard the metrics recorded so far.
+    """
+    with _metrics_lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def increment(name, value=1, **labels):
+    """
+    Add a value to a counter.
+    """
+    if not _state["enabled"]:
+        return
+    key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """
+    Record a duration in seconds in a histogram.
+    """
+    if not _state["enabled"]:
+        return
+    key = (name, tuple(sorted((label, str(label_value)) for label, label_value in labels.items())))
+    with _metrics_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DURATION_BUCKETS_IN_S), "count": 0, "sum": 0.0}
+        for index, bound in enumerate(DURATION_BUCKETS_IN_S):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+                break
+        histogram["count"] += 1
+        histogram["sum"] += value
+
+
+@contextlib.contextmanager
+def _timer(name, labels):
+    """
+    Record the time spent in the block in a histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timer(name, **labels):
+    """
+    Return a context manager that records the time spent in its block in a histogram.
+    """
+    if not _state["enabled"]:
+        return _NULL_TIMER
+    return _timer(name, labels)
+
+
+def snapshot():
+    """
+    Return the recorded metrics as a dictionary that can be written as JSON.
+    Histogram buckets are cumulative, like in Prometheus. The error rate of each host is the share of its
+    requests that failed or were answered with a status code of 400 or above.
+    """
+    with _metrics_lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = []
+        for (name, labels), histogram in sorted(_histograms.items()):
+            cumulative_counts = list(itertools.accumulate(histogram["buckets"]))
+            histograms.append({
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram["count"],
+                "sum": histogram["sum"],
+                "mean": histogram["sum"] / histogram["count"],
+                "buckets": {**dict(zip(map(str, DURATION_BUCKETS_IN_S), cumulative_counts)),
+                            "+Inf": histogram["count"]}
+            })
+
+    hosts = {}
+    for counter in counters:
+        if counter["name"] == "http_requests_total":
+            host = hosts.setdefault(counter["labels"]["host"], {"requests": 0, "errors": 0})
+            host["requests"] += counter["value"]
+            status = counter["labels"]["status"]
+            if not status.isdigit() or int(status) >= 400:
+                host["errors"] += counter["value"]
+    for host in hosts.values():
+        host["error_rate"] = host["errors"] / host["requests"]
+
+    return {"counters": counters, "histograms": histograms, "hosts": hosts}
+
+
+def write_metrics(path):
+    """
+    Write the recorded metrics to a JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as metrics_file:
+        json.dump(snapshot(), metrics_file, indent=2)
+    print(f"The metrics have been saved to {path}.")
+
+
+def _format_labels(labels, extra=()):
+    """
+    Format labels the way the Prometheus text format writes them, escaping backslashes, quotes and newlines.
+    """
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped_pairs = ((label, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                     for label, value in pairs)
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped_pairs) + "}"
+
+
+def prometheus_text():
+    """
+    Return the recorded metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    with _metrics_lock:
+        names = set()
+        for (name, labels), value in sorted(_counters.items()):
+            if name not in names:
+                names.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(_histograms.items()):
+            if name not in names:
+                names.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, cumulative_count in zip(DURATION_BUCKETS_IN_S, itertools.accumulate(histogram["buckets"])):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port, address="127.0.0.1"):
+    """
+    Enable the metrics and serve them in the Prometheus text format at /metrics from a background thread.
+    Returns the server.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    enable()
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics at http://{address}:{server.server_address[1]}/metrics")
+    return server
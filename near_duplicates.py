@@ -0,0 +1,161 @@
+import contextlib
+import hashlib
+import os
+import random
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from hash_cache import lookup_fingerprints, store_fingerprints
+from metadata_dedup import find_root, normalize_text
+from metrics import increment, timer
+from pdf_text import extract_text
+
+# Share of word shingles two texts must have in common to be near-duplicates. A preprint and the publisher
+# version of a paper usually share most of their text but differ in their front matter, headers and layout.
+NEAR_DUPLICATE_SIMILARITY = 0.7
+
+# Number of consecutive words of a shingle.
+SHINGLE_SIZE = 3
+
+# Texts with fewer words, like scanned PDFs without a text layer, get no fingerprint.
+MIN_WORDS = 50
+
+# MinHash signatures of the shingles are split into bands; files that agree on all values of a band become
+# candidates. With 16 bands of 4 values, texts that share 70% of their shingles become candidates with a
+# probability of about 99%, texts that share 30% with about 12%.
+BANDS = 16
+ROWS = 4
+
+# Number of files of an LSH bucket a file is compared with, so that boilerplate texts do not make the
+# comparisons grow quadratically.
+MAX_CANDIDATES = 100
+
+# Prime modulus and coefficients of the hash functions of the MinHash signatures. The coefficients are fixed,
+# so that cached signatures stay comparable between runs.
+_PRIME = (1 << 61) - 1
+_generator = random.Random(1)
+_COEFFICIENTS = [(_generator.randrange(1, _PRIME), _generator.randrange(_PRIME)) for _ in range(BANDS * ROWS)]
+_SIGNATURE_FORMAT = f"<{BANDS * ROWS}Q"
+
+
+def text_fingerprint(text):
+    """
+    Return the number of words of a text and the MinHash signature of its word shingles, packed into bytes,
+    or None as signature if the text is too short.
+    """
+    words = normalize_text(text).split()
+    if len(words) < MIN_WORDS:
+        return len(words), None
+
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    values = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+              for shingle in shingles]
+    signature = [min([(a * value + b) % _PRIME for value in values]) for a, b in _COEFFICIENTS]
+    return len(words), struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def file_fingerprint(filepath):
+    """
+    Extract the text of a PDF and return its fingerprint, like text_fingerprint().
+    """
+    return text_fingerprint(extract_text(filepath))
+
+
+def fingerprint_files(filepaths, file_hashes, jobs=1, cache=None):
+    """
+    Return the fingerprint of each file, in the same order. Files with the same hash are only read once, and
+    the fingerprints of files whose hash is in the cache are taken from it.
+    Text extraction is CPU-bound, so with more than one job the files are read in a process pool.
+    """
+    cached = lookup_fingerprints(cache, set(file_hashes)) if cache is not None else {}
+    increment("fingerprint_cache_hits_total", len(cached))
+
+    # One file per missing hash.
+    missing = {}
+    for filepath, file_hash in zip(filepaths, file_hashes):
+        if file_hash not in cached:
+            missing.setdefault(file_hash, filepath)
+
+    total = len(missing)
+    fingerprints = []
+    with timer("fingerprint_seconds"):
+        with ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and total > 1 else contextlib.nullcontext() \
+                as executor:
+            results = executor.map(file_fingerprint, missing.values()) if executor else \
+                map(file_fingerprint, missing.values())
+            for fingerprint in results:
+                fingerprints.append(fingerprint)
+                if len(fingerprints) % 100 == 0 or len(fingerprints) == total:
+                    print(f"\rText fingerprints: {len(fingerprints)}/{total} files", end="", flush=True)
+    if total:
+        print()
+
+    if cache is not None:
+        store_fingerprints(cache, list(missing), fingerprints)
+    cached.update(zip(missing, fingerprints))
+    return [cached[file_hash] for file_hash in file_hashes]
+
+
+def signature_similarity(signature, other_signature):
+    """
+    Estimate the share of shingles two texts have in common from their MinHash signatures.
+    """
+    values = struct.unpack(_SIGNATURE_FORMAT, signature)
+    other_values = struct.unpack(_SIGNATURE_FORMAT, other_signature)
+    return sum(1 for value, other_value in zip(values, other_values) if value == other_value) / len(values)
+
+
+def group_near_duplicates(signatures, similarity=NEAR_DUPLICATE_SIMILARITY):
+    """
+    Group the signatures of texts that are near-duplicates of each other and return the groups of two or
+    more, as lists of the positions of the signatures, in the order of their first member.
+    Candidates are looked up in the buckets of an LSH index of the signatures, so signatures are never
+    compared pairwise. Signatures that are None are left out.
+    """
+    parents = list(range(len(signatures)))
+    buckets = {}
+
+    for index, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        candidates = set()
+        for band in range(BANDS):
+            bucket = buckets.setdefault((band, signature[band * ROWS * 8:(band + 1) * ROWS * 8]), [])
+            candidates.update(bucket[:MAX_CANDIDATES])
+            bucket.append(index)
+        for other_index in sorted(candidates):
+            root, other_root = find_root(parents, index), find_root(parents, other_index)
+            if root != other_root and signature_similarity(signature, signatures[other_index]) >= similarity:
+                parents[max(root, other_root)] = min(root, other_root)
+
+    groups = {}
+    for index, signature in enumerate(signatures):
+        if signature is not None:
+            groups.setdefault(find_root(parents, index), []).append(index)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_near_duplicates(directory, filepaths, file_hashes, jobs=1, cache=None,
+                         similarity=NEAR_DUPLICATE_SIMILARITY):
+    """
+    Find the PDFs whose text is nearly the same, although their bytes differ, and describe them for the
+    record of deleted files. Each group lists its files with the estimated similarity of their text to the
+    text of the first file. Nothing is deleted, since the files are usually different versions of a paper.
+    """
+    fingerprints = fingerprint_files(filepaths, file_hashes, jobs, cache)
+    signatures = [signature for word_count, signature in fingerprints]
+    groups = group_near_duplicates(signatures, similarity)
+
+    return {
+        "similarity": similarity,
+        "total_files": len(filepaths),
+        "files_without_text": sum(1 for signature in signatures if signature is None),
+        "total_groups": len(groups),
+        "groups": [[{
+            "file_name": os.path.basename(filepaths[index]),
+            "file_path": os.path.relpath(filepaths[index], start=directory),
+            "file_hash": file_hashes[index],
+            "word_count": fingerprints[index][0],
+            "similarity": round(signature_similarity(signatures[group[0]], signatures[index]), 3),
+        } for index in group] for group in groups],
+    }
@@ -0,0 +1,363 @@
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse
+
+import requests
+
+from http_cache import conditional_headers, lookup, store_response, touch
+from http_client import ensure_pool_size, get_cache
+from metrics import increment, is_enabled, timer
+from pdf_store import add_to_store, blob_path, link_from_store
+from rate_limiter import parse_retry_after, throttled_get
+
+# Status codes after which a download is tried again. Any other error status fails it for good.
+RETRYABLE_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+# Errors after which a download is tried again. Timeouts are retried as well.
+RETRYABLE_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)
+
+# Bound in seconds of the delay before the first retry of a download. It doubles with each further retry, up
+# to the maximum.
+RETRY_BASE_DELAY_IN_S = 1.0
+RETRY_MAX_DELAY_IN_S = 60.0
+
+# Number of bytes at the start of a body in which the %PDF- signature is looked for before the rest of the
+# body is downloaded. PDF readers accept the signature anywhere in the first 1024 bytes.
+PROBE_SIZE = 1024
+PDF_SIGNATURE = b"%PDF-"
+
+
+def probe_response(response, max_file_size, chunk_size=64 * 1024):
+    """
+    Check that a response holds a PDF within the size limit before its body is downloaded: its Content-Length
+    must not exceed the limit and its first PROBE_SIZE bytes must hold the %PDF- signature. The Content-Type
+    is only recorded, since servers send PDFs as text/html or application/octet-stream as well.
+    Returns a description of the response, whose outcome is "too_large" or "not_pdf" if it was rejected and
+    None otherwise, and an iterator over the chunks of the whole body, starting with the bytes already read.
+    """
+    content_length = response.headers.get("Content-Length")
+    probe = {
+        "status_code": response.status_code,
+        "content_type": response.headers.get("Content-Type"),
+        "content_length": int(content_length) if content_length and content_length.isdigit() else None,
+        "pdf_signature": None,
+        "outcome": None,
+    }
+    if probe["content_length"] is not None and probe["content_length"] > max_file_size:
+        return dict(probe, outcome="too_large"), iter(())
+
+    # The rest of the body is read in larger chunks, unless the head was all there was.
+    head = b""
+    rest = ()
+    for chunk in response.iter_content(chunk_size=PROBE_SIZE):
+        head += chunk
+        if len(head) >= PROBE_SIZE:
+            rest = response.iter_content(chunk_size=chunk_size)
+            break
+    probe["pdf_signature"] = PDF_SIGNATURE in head[:PROBE_SIZE]
+    if not probe["pdf_signature"]:
+        if is_enabled():
+            increment("http_response_bytes_total", len(head), host=urlparse(response.url or "").netloc)
+        return dict(probe, outcome="not_pdf"), iter(())
+    return probe, itertools.chain([head], rest)
+
+
+def stream_to_file(response, filepath, max_file_size, store_directory=None, chunk_size=64 * 1024, chunks=None):
+    """
+    Stream a response body to a temporary file and move it into place once complete.
+    The transfer stops as soon as the body is larger than max_file_size. The SHA-256 hash of the body is
+    calculated while streaming and returned, or None if the file was too large.
+    If a store directory is given, the body is kept in the content-addressed store and filepath becomes a
+    link to it, so that content shared by several queries or sources is only written once.
+    The body is read from chunks if given, e.g. by probe_response(), or else from the response.
+    """
+    sha256_hash = hashlib.sha256()
+    size = 0
+    temp_directory = store_directory or os.path.dirname(filepath) or "."
+    os.makedirs(temp_directory, exist_ok=True)
+    temp_path = os.path.join(temp_directory, f"{uuid.uuid4().hex}.part")
+    try:
+        with open(temp_path, "xb") as f:
+            for chunk in chunks if chunks is not None else response.iter_content(chunk_size=chunk_size):
+                size += len(chunk)
+                if size > max_file_size:
+                    os.remove(temp_path)
+                    return None
+                sha256_hash.update(chunk)
+                f.write(chunk)
+
+        if store_directory:
+            link_from_store(add_to_store(store_directory, temp_path, sha256_hash.hexdigest()), filepath)
+        else:
+            os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        if is_enabled():
+            increment("http_response_bytes_total", size, host=urlparse(response.url or "").netloc)
+
+    return sha256_hash.hexdigest()
+
+
+def backoff_delay(retry, retry_after=None):
+    """
+    Return the number of seconds to wait before the given retry of a download, counted from 1.
+    The delay is drawn at random below a bound that doubles with each retry, so that downloads that failed
+    together do not retry together, but it is never shorter than a Retry-After the server asked for.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_IN_S, RETRY_BASE_DELAY_IN_S * 2 ** (retry - 1)))
+    return max(delay, retry_after or 0.0)
+
+
+def attempt_pdf(url, filepath, headers, timeout_in_s, max_file_size, store_directory=None):
+    """
+    Try to download a single PDF once and save it to the given path, through the content-addressed store if one
+    is given. With a store, a PDF that was downloaded before is revalidated with the server and taken from the
+    store if it is unchanged.
+    Returns a dictionary with the hash of the saved file, the outcome, the probe of the response, if there was
+    one, and, for a failure, the error and the Retry-After the server sent, if any.
+    The outcome is "saved", "not_modified", "duplicate", "too_large", "not_pdf", "retry" for a failure that
+    may be temporary or "failed" for one that is not.
+    """
+    if not is_enabled():
+        return _attempt_pdf(url, filepath, headers, timeout_in_s, max_file_size, store_directory)
+
+    with timer("pdf_fetch_seconds", host=urlparse(url or "").netloc):
+        return _attempt_pdf(url, filepath, headers, timeout_in_s, max_file_size, store_directory)
+
+
+def _attempt_pdf(url, filepath, headers, timeout_in_s, max_file_size, store_directory):
+    """
+    Try to download a single PDF once without recording metrics. See attempt_pdf().
+    """
+    result = {"file_hash": None, "outcome": "failed", "probe": None, "error": None, "retry_after": None}
+
+    # Do not overwrite a file that has already been saved.
+    if os.path.exists(filepath):
+        print(f"Duplicate file skipped: {os.path.basename(filepath)}")
+        return dict(result, outcome="duplicate")
+
+    # Ask for the PDF only if it changed since it was stored.
+    cache = get_cache() if store_directory else None
+    entry = lookup(cache, url) if cache else None
+    revalidate = bool(entry and entry["file_hash"] and
+                      os.path.exists(blob_path(store_directory, entry["file_hash"])))
+    request_headers = {**headers, **conditional_headers(entry)} if revalidate else headers
+
+    try:
+        with throttled_get(url, retries=0, timeout=timeout_in_s, headers=request_headers,
+                           stream=True) as response:
+            if response.status_code == 304 and revalidate:
+                touch(cache, url)
+                link_from_store(blob_path(store_directory, entry["file_hash"]), filepath)
+                print(f"Not modified, taken from the store: {os.path.basename(filepath)}")
+                return dict(result, file_hash=entry["file_hash"], outcome="not_modified")
+            if response.status_code != 200:
+                return dict(result, outcome="retry" if response.status_code in RETRYABLE_STATUS_CODES else "failed",
+                            error=f"status code {response.status_code}",
+                            retry_after=parse_retry_after(response.headers.get("Retry-After")))
+
+            # Check the headers and the first bytes before downloading the rest of the body.
+            probe, chunks = probe_response(response, max_file_size)
+            if probe["outcome"] == "too_large":
+                print(f"File exceeds the size limit: {url}")
+                return dict(result, outcome="too_large", probe=probe)
+            if probe["outcome"] == "not_pdf":
+                print(f"Not a PDF ({probe['content_type']}): {url}")
+                return dict(result, outcome="not_pdf", probe=probe)
+
+            # Stream the body to disk, stopping early if the file size exceeds the limit.
+            file_hash = stream_to_file(response, filepath, max_file_size, store_directory, chunks=chunks)
+            if file_hash is None:
+                print(f"File exceeds the size limit: {url}")
+                return dict(result, outcome="too_large", probe=dict(probe, outcome="too_large"))
+            if cache:
+                store_response(cache, url, response, file_hash=file_hash, size=os.path.getsize(filepath))
+            print(f"Downloaded and saved: {os.path.basename(filepath)}")
+            return dict(result, file_hash=file_hash, outcome="saved", probe=dict(probe, outcome="saved"))
+    except requests.exceptions.Timeout:
+        print(f"Request timed out for {url}.")
+        return dict(result, outcome="retry", error="timeout")
+    except RETRYABLE_EXCEPTIONS as e:
+        print(f"Could not fetch PDF document from {url}: {e}")
+        return dict(result, outcome="retry", error=str(e))
+    except Exception as e:
+        print(f"Could not fetch PDF document from {url}: {e}")
+        return dict(result, error=str(e))
+
+
+def load_dead_letters(dead_letter_file):
+    """
+    Load the downloads that failed for good in an earlier run, or an empty list if there are none.
+    Each entry can be passed on as a download job.
+    """
+    if not os.path.exists(dead_letter_file):
+        return []
+    with open(dead_letter_file, "r", encoding="utf-8") as json_file:
+        return json.load(json_file)["dead_letters"]
+
+
+def save_dead_letters(dead_letter_file, dead_letters):
+    """
+    Write the downloads that failed for good to a JSON file, so that a later run can try them again.
+    """
+    with open(dead_letter_file, "w", encoding="utf-8") as json_file:
+        json.dump({"total_dead_letters": len(dead_letters), "dead_letters": dead_letters}, json_file,
+                  ensure_ascii=False, indent=2)
+
+
+def merge_dead_letters(dead_letters, finished_jobs):
+    """
+    Merge the outcomes of the finished jobs of a run into the dead letters of earlier runs, keyed by file path.
+    finished_jobs holds the file path and the dead letter of each finished job, or None if its download did
+    not fail, in the order of the jobs. An earlier dead letter is replaced in place if its download failed
+    again and dropped if it did not, and the dead letters of new failures are added at the end.
+    """
+    merged = {os.path.normcase(os.path.abspath(dead_letter["filepath"])): dead_letter
+              for dead_letter in dead_letters}
+    for path, dead_letter in finished_jobs:
+        if dead_letter is None:
+            merged.pop(path, None)
+        else:
+            merged[path] = dead_letter
+    return list(merged.values())
+
+
+def iter_downloads(jobs, headers, timeout_in_s, max_file_size, attempts=1, max_concurrency=1, max_per_host=1,
+                   store_directory=None, window=None, dead_letter_file=None):
+    """
+    Download the PDFs described by an iterable of jobs and yield each job together with the SHA-256 hash of
+    its saved file, or None if the file was not saved, in the order of the jobs.
+    Each job is a dictionary with a "url" and a "filepath"; jobs without a filepath are passed through without
+    downloading anything. Up to max_concurrency downloads run at the same time, of which at most max_per_host
+    go to the same host. Jobs are taken from the iterable as they are needed and at most window jobs are in
+    progress or waiting to be yielded at a time, so that memory use stays flat for a stream of any length.
+    A download that fails in a way that may be temporary is tried again up to attempts times in all, after a
+    jittered exponential backoff during which it holds no download slot, so the other downloads go on.
+    If a dead-letter file is given, the downloads that failed for good are merged into it at the end, with
+    their query_index and result_index if the job has them. The dead letters of earlier runs are kept until
+    a job for the same file no longer fails.
+    Each job whose response was probed before its body was downloaded gets a "pdf_probe" with the status
+    code, Content-Type, Content-Length and outcome of the response and whether it starts like a PDF.
+    """
+    # Keep a connection alive for each simultaneous download from a host.
+    ensure_pool_size(max_per_host)
+
+    fetch = partial(attempt_pdf, headers=headers, timeout_in_s=timeout_in_s, max_file_size=max_file_size,
+                    store_directory=store_directory)
+    finished_jobs = []
+
+    # The downloads run on an event loop in a background thread, while the jobs are read and the results
+    # are yielded in this thread.
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    semaphores = {}
+    chain_tasks = {}
+
+    async def run_job(sequence_number, job):
+        if "global" not in semaphores:
+            semaphores["global"] = asyncio.Semaphore(max_concurrency)
+
+        # Jobs that target the same file are chained and run in their original order, so the first
+        # successful download keeps the file, exactly as in a sequential run.
+        path = os.path.normcase(os.path.abspath(job["filepath"]))
+        previous_task = chain_tasks.get(path)
+        current_task = chain_tasks[path] = asyncio.current_task()
+        try:
+            if previous_task is not None:
+                await asyncio.wait([previous_task])
+
+            host = urlparse(job["url"] or "").netloc
+            host_semaphore = semaphores.setdefault(host, asyncio.Semaphore(max_per_host))
+
+            for attempt in range(attempts):
+                # Wait for the retry without holding a slot.
+                if attempt > 0:
+                    increment("http_retries_total", host=host, reason="download")
+                    await asyncio.sleep(backoff_delay(attempt, result["retry_after"]))
+
+                # Take the host slot first, so that a job waiting for a busy host does not block a global slot.
+                async with host_semaphore:
+                    async with semaphores["global"]:
+                        result = await loop.run_in_executor(executor, fetch, job["url"], job["filepath"])
+                if result["outcome"] != "retry":
+                    break
+
+            outcome = "failed" if result["outcome"] == "retry" else result["outcome"]
+            increment("pdf_downloads_total", host=host, outcome=outcome)
+            dead_letter = None
+            if outcome == "failed":
+                dead_letter = {
+                    "url": job["url"],
+                    "filepath": job["filepath"],
+                    **{key: job[key] for key in ("query_index", "result_index") if key in job},
+                    "error": result["error"],
+                    "retryable": result["outcome"] == "retry",
+                    "attempts": attempt + 1,
+                }
+            finished_jobs.append((sequence_number, path, dead_letter))
+            if result["probe"]:
+                job["pdf_probe"] = result["probe"]
+            return result["file_hash"]
+        finally:
+            if chain_tasks.get(path) is current_task:
+                del chain_tasks[path]
+
+    pending = collections.deque()
+    try:
+        for sequence_number, job in enumerate(jobs):
+            future = None
+            if job.get("filepath"):
+                future = asyncio.run_coroutine_threadsafe(run_job(sequence_number, job), loop)
+            pending.append((job, future))
+
+            while window and len(pending) >= window:
+                job, future = pending.popleft()
+                yield job, future.result() if future else None
+
+        while pending:
+            job, future = pending.popleft()
+            yield job, future.result() if future else None
+    finally:
+        for job, future in pending:
+            if future:
+                future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+
+        # Keep the downloads that failed for good for a later run, together with those of earlier runs that
+        # were not tried again, in the order of the jobs.
+        if dead_letter_file:
+            finished_jobs.sort(key=lambda finished_job: finished_job[0])
+            save_dead_letters(dead_letter_file, merge_dead_letters(
+                load_dead_letters(dead_letter_file),
+                [(path, dead_letter) for sequence_number, path, dead_letter in finished_jobs]))
+
+
+def download_pdfs(jobs, headers, timeout_in_s, max_file_size, attempts=1, max_concurrency=1, max_per_host=1,
+                  store_directory=None, dead_letter_file=None):
+    """
+    Download the PDFs described by a list of jobs and return the SHA-256 hash of each saved file, or None
+    for each job whose file was not saved.
+    Each job is a dictionary with a "url" and a "filepath". Up to max_concurrency downloads run at
+    the same time, of which at most max_per_host go to the same host. Failures are retried and the downloads
+    that failed for good are written to the dead-letter file, as in iter_downloads().
+    """
+    return [file_hash for job, file_hash in iter_downloads(jobs, headers, timeout_in_s, max_file_size, attempts,
+                                                            max_concurrency, max_per_host, store_directory,
+                                                            dead_letter_file=dead_letter_file)]
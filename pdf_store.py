@@ -0,0 +1,120 @@
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+
+# Name of the directory inside "pdfs" that holds the content-addressed files.
+STORE_DIRECTORY_NAME = "blobs"
+
+# Serializes insertions, so that two downloads of the same content cannot both write the file.
+_store_lock = threading.Lock()
+
+
+def calculate_hash(filepath):
+    """
+    Calculate the SHA-256 hash of the file.
+    """
+    sha256_hash = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for byte_block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
+
+def blob_path(store_directory, file_hash):
+    """
+    Return the path of the stored file with the given SHA-256 hash.
+    """
+    return os.path.join(store_directory, file_hash[:2], f"{file_hash}.pdf")
+
+
+def add_to_store(store_directory, temp_path, file_hash):
+    """
+    Move a downloaded file into the store under its hash.
+    If the content is already stored the downloaded copy is discarded. Returns the path of the stored file.
+    """
+    path = blob_path(store_directory, file_hash)
+    with _store_lock:
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    return path
+
+
+def link_from_store(path, filepath):
+    """
+    Make filepath point to a stored file, using a hard link where possible and a symbolic link otherwise.
+    The link is created under a temporary name first and then moved into place.
+    """
+    temp_link = f"{filepath}.link"
+    if os.path.lexists(temp_link):
+        os.remove(temp_link)
+
+    try:
+        os.link(path, temp_link)
+    except OSError:
+        try:
+            os.symlink(os.path.relpath(path, os.path.dirname(filepath)), temp_link)
+        except OSError:
+            # Fall back to a plain copy on file systems that support neither kind of link.
+            shutil.copyfile(path, temp_link)
+    os.replace(temp_link, filepath)
+
+
+def migrate(pdfs_directory):
+    """
+    Convert an existing tree of PDFs in place: every PDF is moved into the store and replaced by a link to it.
+    Returns the number of migrated files, the number of files stored and the number of bytes freed.
+    """
+    store_directory = os.path.join(pdfs_directory, STORE_DIRECTORY_NAME)
+    migrated_count = 0
+    stored_count = 0
+    freed_bytes = 0
+
+    for root, dirs, files in os.walk(pdfs_directory):
+        # Skip the store itself.
+        if root == pdfs_directory and STORE_DIRECTORY_NAME in dirs:
+            dirs.remove(STORE_DIRECTORY_NAME)
+
+        for file in sorted(files):
+            filepath = os.path.join(root, file)
+            if not file.endswith(".pdf") or os.path.islink(filepath):
+                continue
+
+            file_hash = calculate_hash(filepath)
+            path = blob_path(store_directory, file_hash)
+
+            if not os.path.exists(path):
+                # The first copy of the content becomes the stored file.
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    os.link(filepath, path)
+                except OSError:
+                    shutil.copyfile(filepath, path)
+                    link_from_store(path, filepath)
+                stored_count += 1
+            elif not os.path.samefile(filepath, path):
+                freed_bytes += os.path.getsize(filepath)
+                link_from_store(path, filepath)
+            else:
+                continue
+
+            migrated_count += 1
+            print(f"Migrated: {os.path.relpath(filepath, start=pdfs_directory)}")
+
+    return migrated_count, stored_count, freed_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the content-addressed PDF store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="convert an existing PDF directory in place")
+    migrate_parser.add_argument("directory", nargs="?", default="pdfs", help="directory containing the PDFs")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrated, stored, freed = migrate(args.directory)
+        print(f"Migrated {migrated} files into {stored} stored files, freeing {freed / (1024 * 1024):.1f} MB.")
@@ -0,0 +1,100 @@
+import re
+import zlib
+
+# PDF libraries are optional. Without them, text is taken from the content streams of the file directly,
+# which works for most PDFs written with standard fonts but not for fonts with their own encodings.
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from pdfminer.high_level import extract_text as pdfminer_extract_text
+except ImportError:
+    pdfminer_extract_text = None
+
+# The end of line before endstream is kept, since it cannot be told apart from the last byte of a deflated
+# stream. Decompression ignores it.
+STREAM_PATTERN = re.compile(rb"stream\r?\n(.*?)endstream", re.S)
+TEXT_OBJECT_PATTERN = re.compile(rb"\bBT\b(.*?)\bET\b", re.S)
+
+# A literal string, followed by the operator that shows it, or an array of strings shown with TJ.
+SHOW_TEXT_PATTERN = re.compile(rb"\(((?:[^()\\]|\\.)*)\)\s*(?:Tj|'|\")|\[((?:[^\]\\]|\\.)*)\]\s*TJ", re.S)
+ARRAY_ITEM_PATTERN = re.compile(rb"\(((?:[^()\\]|\\.)*)\)|(-?\d+(?:\.\d+)?)", re.S)
+ESCAPE_PATTERN = re.compile(rb"\\([0-7]{1,3}|.)", re.S)
+ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+# Kerning in thousandths of the font size beyond which two strings of a TJ array are separate words.
+WORD_SPACING = -200
+
+
+def extractor_name():
+    """
+    Return the name of the library the text of PDFs is extracted with.
+    """
+    if PdfReader is not None:
+        return "pypdf"
+    if pdfminer_extract_text is not None:
+        return "pdfminer"
+    return "builtin"
+
+
+def _unescape(string):
+    """
+    Decode the escape sequences of a literal PDF string.
+    """
+    def replace(match):
+        escape = match.group(1)
+        if escape[:1].isdigit():
+            return bytes([int(escape, 8) & 0xFF])
+        if escape in b"\r\n":
+            return b""
+        return ESCAPES.get(escape, escape)
+
+    return ESCAPE_PATTERN.sub(replace, string).decode("latin-1")
+
+
+def _extract_text_builtin(filepath):
+    """
+    Extract the text shown by the content streams of a PDF, decompressing them if they are deflated.
+    """
+    with open(filepath, "rb") as f:
+        data = f.read()
+
+    lines = []
+    for stream in STREAM_PATTERN.findall(data):
+        try:
+            stream = zlib.decompressobj().decompress(stream)
+        except zlib.error:
+            pass
+        for text_object in TEXT_OBJECT_PATTERN.findall(stream):
+            for string, array in SHOW_TEXT_PATTERN.findall(text_object):
+                if not array:
+                    lines.append(_unescape(string))
+                    continue
+                words = [""]
+                for item, kerning in ARRAY_ITEM_PATTERN.findall(array):
+                    if kerning and float(kerning) < WORD_SPACING:
+                        words.append("")
+                    elif not kerning:
+                        words[-1] += _unescape(item)
+                lines.append(" ".join(words))
+    return "\n".join(lines)
+
+
+def extract_text(filepath, raise_errors=False):
+    """
+    Extract the text of a PDF with the first PDF library that is installed, or from its content streams.
+    Returns an empty string if no text could be extracted, or raises the error if raise_errors is set.
+    """
+    try:
+        if PdfReader is not None:
+            return "\n".join(page.extract_text() or "" for page in PdfReader(filepath).pages)
+        if pdfminer_extract_text is not None:
+            return pdfminer_extract_text(filepath)
+        return _extract_text_builtin(filepath)
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Could not extract the text of {filepath}: {e}")
+        return ""
@@ -0,0 +1,168 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from http_client import get, is_replaying
+from metrics import increment, timer
+
+# Status codes with which a host asks for fewer requests.
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Rate in requests per second a host without a configured rate falls back to once it throttles.
+BACKOFF_RATE = 1.0
+
+# A host without a configured rate is no longer limited once its rate has recovered to this value.
+RECOVERED_RATE = 16.0
+
+# The rate is never lowered below one request per this many seconds.
+MIN_INTERVAL_IN_S = 60
+
+# Factor by which the rate is raised after each healthy response, up to the host's maximum rate.
+RECOVERY_FACTOR = 1.1
+
+# Token buckets by host. Each bucket holds the current rate in requests per second (None for no limit), the
+# maximum rate, the number of tokens, the time they were last counted, the time before which no request
+# may be sent and the time the rate was last lowered.
+_buckets = {}
+
+# Serializes access to the buckets, so that threads downloading from the same host share its rate.
+_buckets_lock = threading.Lock()
+
+
+def get_host(url):
+    """
+    Return the host part of a URL.
+    """
+    return urlparse(url or "").netloc
+
+
+def _get_bucket(host):
+    """
+    Return the bucket of a host, creating an unlimited one if the host has none yet. Must hold the lock.
+    """
+    return _buckets.setdefault(host, {
+        "rate": None,
+        "max_rate": None,
+        "tokens": 1.0,
+        "updated": time.monotonic(),
+        "blocked_until": 0.0,
+        "lowered": 0.0
+    })
+
+
+def configure_host(url, rate, max_rate=None):
+    """
+    Set the rate in requests per second for the host of a URL and the maximum rate it may speed up to.
+    A host that already has a configured rate keeps its current, possibly adapted, rate.
+    """
+    with _buckets_lock:
+        bucket = _get_bucket(get_host(url))
+        if bucket["rate"] is None:
+            bucket["rate"] = rate
+            bucket["max_rate"] = max_rate or rate
+
+
+def wait_for_slot(url):
+    """
+    Block until a request may be sent to the host of a URL.
+    """
+    while True:
+        with _buckets_lock:
+            bucket = _get_bucket(get_host(url))
+            now = time.monotonic()
+            if bucket["rate"] is not None:
+                bucket["tokens"] = min(1.0, bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+            bucket["updated"] = now
+
+            if now < bucket["blocked_until"]:
+                delay = bucket["blocked_until"] - now
+            elif bucket["rate"] is None:
+                return
+            elif bucket["tokens"] >= 1.0:
+                bucket["tokens"] -= 1.0
+                return
+            else:
+                delay = (1.0 - bucket["tokens"]) / bucket["rate"]
+        time.sleep(delay)
+
+
+def parse_retry_after(value):
+    """
+    Return the number of seconds a Retry-After header asks to wait, or None if it cannot be parsed.
+    The header holds either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def record_throttled(url, retry_after=None):
+    """
+    Halve the rate of the host of a URL after it asked for fewer requests or stopped responding.
+    No request is sent to the host for retry_after seconds if given. Requests that were already under way
+    when the rate was lowered do not lower it again.
+    """
+    with _buckets_lock:
+        bucket = _get_bucket(get_host(url))
+        now = time.monotonic()
+        if bucket["rate"] is None or now - bucket["lowered"] >= 1 / bucket["rate"]:
+            rate = BACKOFF_RATE if bucket["rate"] is None else bucket["rate"] / 2
+            bucket["rate"] = max(rate, 1 / MIN_INTERVAL_IN_S)
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+            bucket["lowered"] = now
+        if retry_after:
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + retry_after)
+
+
+def record_success(url):
+    """
+    Raise the rate of the host of a URL again after a healthy response.
+    A host without a configured rate becomes unlimited again once it has recovered.
+    """
+    with _buckets_lock:
+        bucket = _get_bucket(get_host(url))
+        if bucket["rate"] is None:
+            return
+        bucket["rate"] *= RECOVERY_FACTOR
+        if bucket["max_rate"] is not None and bucket["rate"] >= bucket["max_rate"]:
+            bucket["rate"] = bucket["max_rate"]
+        elif bucket["max_rate"] is None and bucket["rate"] >= RECOVERED_RATE:
+            bucket["rate"] = None
+
+
+def record_response(url, response):
+    """
+    Adapt the rate of the host of a URL to the status of its response.
+    """
+    if response.status_code in THROTTLE_STATUS_CODES:
+        record_throttled(url, parse_retry_after(response.headers.get("Retry-After")))
+    else:
+        record_success(url)
+
+
+def throttled_get(url, retries=3, **kwargs):
+    """
+    Send a GET request once the host of the URL allows it and adapt the host's rate to the response.
+    A throttled request is retried up to the given number of times, after which its response is returned.
+    Takes the same keyword arguments as http_client.get().
+    Responses replayed from the HTTP archive are not throttled, since no request reaches the host.
+    """
+    for attempt in range(retries + 1):
+        if not is_replaying():
+            with timer("rate_limit_wait_seconds", host=get_host(url)):
+                wait_for_slot(url)
+        response = get(url, **kwargs)
+        record_response(url, response)
+        if response.status_code not in THROTTLE_STATUS_CODES or attempt == retries:
+            return response
+        print(f"Throttled by {get_host(url)} (status code {response.status_code}). Trying again...")
+        increment("http_retries_total", host=get_host(url), reason="throttled")
+        response.close()
@@ -0,0 +1,254 @@
+import argparse
+import codecs
+import json
+import os
+import tempfile
+import time
+
+from metrics import timer
+
+# The record stream holds one JSON record per line. Each record has a "type":
+# "query"       - a query starts; holds its index and metadata.
+# "result"      - one query result.
+# "page"        - a page of results is complete; holds the page parameter to continue with and the
+#                 query's link statistics so far.
+# "query_end"   - a query is complete; holds its final metadata and link statistics.
+# "end"         - the stream is complete.
+
+# Number of bytes of spooled results copied at a time when writing the nested layout.
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def append_records(stream, records, sync=True):
+    """
+    Append records to an open stream with a single write and flush them to disk.
+    Writing a page in one go means a crash can leave at most the last line incomplete.
+    Without sync the records are only flushed to the operating system, which is much faster.
+    """
+    with timer("record_write_seconds", file=stream.name, sync=sync):
+        stream.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        stream.flush()
+        if sync:
+            os.fsync(stream.fileno())
+
+
+def iter_records(records_path, follow=False, poll_interval=0.5):
+    """
+    Read the records of a stream one at a time, so that memory use does not grow with the stream's size.
+    With follow, the function waits for records that are still being written and stops at the "end" record,
+    so that a stream can be consumed while it is produced. Without follow it stops at the end of the file.
+    An incomplete last line is not returned.
+    """
+    while follow and not os.path.exists(records_path):
+        time.sleep(poll_interval)
+
+    with open(records_path, "r", encoding="utf-8") as records_file:
+        while True:
+            position = records_file.tell()
+            line = records_file.readline()
+
+            # Wait for a line that is still being written.
+            if not line.endswith("\n"):
+                if not follow:
+                    return
+                records_file.seek(position)
+                time.sleep(poll_interval)
+                continue
+
+            record = json.loads(line)
+            if record["type"] == "end":
+                if follow:
+                    return
+                continue
+            yield record
+
+
+def _complete_length(records_file, chunk_size=4096):
+    """
+    Return the length of an open stream up to the end of its last complete line.
+    """
+    end = records_file.seek(0, os.SEEK_END)
+    position = end
+    while position > 0:
+        chunk_start = max(position - chunk_size, 0)
+        records_file.seek(chunk_start)
+        chunk = records_file.read(position - chunk_start)
+        newline = chunk.rfind(b"\n")
+        if newline >= 0:
+            return chunk_start + newline + 1
+        position = chunk_start
+    return 0
+
+
+def remove_end_record(records_path):
+    """
+    Remove the "end" record from the end of a stream, so that more records can be appended to it.
+    An incomplete last line, which a crash while writing can leave behind, is removed as well, so that the
+    appended records start on a line of their own.
+    """
+    if not os.path.exists(records_path):
+        return
+
+    with open(records_path, "rb+") as records_file:
+        complete_length = _complete_length(records_file)
+        records_file.truncate(complete_length)
+        tail_start = max(complete_length - 4096, 0)
+        records_file.seek(tail_start)
+        tail = records_file.read()
+
+        last_line_start = tail.rfind(b"\n", 0, len(tail) - 1) + 1
+        try:
+            record = json.loads(tail[last_line_start:])
+        except ValueError:
+            return
+        if record.get("type") == "end":
+            records_file.truncate(tail_start + last_line_start)
+
+
+def nested_to_records(json_path, records_path):
+    """
+    Convert a results JSON file in the nested layout to a record stream.
+    """
+    with open(json_path, "r", encoding="utf-8") as json_file:
+        data = json.load(json_file)
+
+    with open(records_path, "w", encoding="utf-8") as records_file:
+        for query_index, query_data in enumerate(data["queries_data"]):
+            records = [{"type": "query", "query_index": query_index, "query_metadata": query_data["query_metadata"]}]
+            records += [{"type": "result", "query_index": query_index, "result": result}
+                        for result in query_data["query_results"]]
+            records.append({
+                "type": "query_end",
+                "query_index": query_index,
+                "query_metadata": query_data["query_metadata"],
+                "query_link_statistics": query_data["query_link_statistics"]
+            })
+            append_records(records_file, records)
+        append_records(records_file, [{"type": "end"}])
+
+
+def _dump(value, indent, ensure_ascii, level):
+    """
+    Format a value the way json.dump() formats it at the given nesting level.
+    """
+    return json.dumps(value, indent=indent, ensure_ascii=ensure_ascii).replace("\n", "\n" + " " * (indent * level))
+
+
+def _copy_runs(spool, json_file, runs):
+    """
+    Copy the given ranges of bytes of the spool to the JSON file, a chunk at a time.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for start, end in runs:
+        spool.seek(start)
+        while start < end:
+            chunk = spool.read(min(COPY_CHUNK_SIZE, end - start))
+            start += len(chunk)
+            json_file.write(decoder.decode(chunk))
+    json_file.write(decoder.decode(b"", final=True))
+
+
+def records_to_nested(records_path, json_path, indent=2, ensure_ascii=False):
+    """
+    Convert a record stream to a results JSON file in the nested layout.
+    The file is written piece by piece with the same formatting as json.dump(). The stream is read once: the
+    formatted results are spooled to a temporary file, and only the ranges each query's results take up in it
+    are kept, so memory use grows with the number of runs of consecutive results of a query rather than with
+    the number of results.
+    """
+    space = " " * indent
+    with tempfile.TemporaryFile() as spool:
+        # Single pass: the metadata and link statistics of each query, and its spooled results.
+        queries = {}
+        runs = {}
+        results_counts = {}
+        position = 0
+        for record in iter_records(records_path):
+            if record["type"] == "result":
+                # The results of a query are spooled with the commas between them, so its ranges can be joined.
+                query_index = record["query_index"]
+                data = space * 4 + _dump(record["result"], indent, ensure_ascii, 4)
+                if results_counts.get(query_index):
+                    data = ",\n" + data
+                data = data.encode("utf-8")
+                spool.write(data)
+                query_runs = runs.setdefault(query_index, [])
+                if query_runs and query_runs[-1][1] == position:
+                    query_runs[-1][1] += len(data)
+                else:
+                    query_runs.append([position, position + len(data)])
+                position += len(data)
+                results_counts[query_index] = results_counts.get(query_index, 0) + 1
+            elif record["type"] in ("query", "page", "query_end"):
+                query = queries.setdefault(record["query_index"], {"query_metadata": None,
+                                                                   "query_link_statistics": {}})
+                if record["type"] == "query_end" or query["query_metadata"] is None:
+                    query["query_metadata"] = record.get("query_metadata", query["query_metadata"])
+                if "query_link_statistics" in record:
+                    query["query_link_statistics"] = record["query_link_statistics"]
+
+        with open(json_path, "w", encoding="utf-8") as json_file:
+            _write_nested(json_file, queries, runs, spool, indent, ensure_ascii)
+
+
+def _write_nested(json_file, queries, runs, spool, indent, ensure_ascii):
+    """
+    Write the nested layout of the queries, copying the results of one query at a time from the spool.
+    """
+    statistics = [query["query_link_statistics"] for query in queries.values()]
+    totals = {
+        "total_queries": len(queries),
+        "total_results": sum(query_statistics.get("total_results_query", 0) for query_statistics in statistics),
+        "total_pdf_links": sum(query_statistics.get("total_pdf_links_query", 0) for query_statistics in statistics)
+    }
+    if any("downloaded_pdfs_count_query" in query_statistics for query_statistics in statistics):
+        totals["total_downloaded_pdfs"] = sum(query_statistics.get("downloaded_pdfs_count_query", 0)
+                                              for query_statistics in statistics)
+
+    space = " " * indent
+    json_file.write("{\n")
+    for key, value in totals.items():
+        json_file.write(f"{space}{json.dumps(key)}: {json.dumps(value)},\n")
+
+    if not queries:
+        json_file.write(f'{space}"queries_data": []\n}}')
+        return
+    json_file.write(f'{space}"queries_data": [\n')
+
+    for position, query_index in enumerate(sorted(queries)):
+        query = queries[query_index]
+        json_file.write(f"{space * 2}{{\n")
+        json_file.write(f'{space * 3}"query_metadata": {_dump(query["query_metadata"], indent, ensure_ascii, 3)},\n')
+        json_file.write(f'{space * 3}"query_link_statistics": '
+                        f'{_dump(query["query_link_statistics"], indent, ensure_ascii, 3)},\n')
+
+        if query_index in runs:
+            json_file.write(f'{space * 3}"query_results": [\n')
+            _copy_runs(spool, json_file, runs[query_index])
+            json_file.write(f"\n{space * 3}]\n")
+        else:
+            json_file.write(f'{space * 3}"query_results": []\n')
+
+        json_file.write(f"{space * 2}}}" + (",\n" if position < len(queries) - 1 else "\n"))
+
+    json_file.write(f"{space}]\n}}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert search results between the nested JSON layout and the "
+                                                 "record stream with one record per line.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    to_json_parser = subparsers.add_parser("to-json", help="convert a record stream to the nested layout")
+    to_json_parser.add_argument("records_path")
+    to_json_parser.add_argument("json_path")
+    to_json_parser.add_argument("--indent", type=int, default=2, help="indentation (the CORE files use 4)")
+    to_json_parser.add_argument("--ascii", action="store_true", help="escape non-ASCII characters (as CORE does)")
+    from_json_parser = subparsers.add_parser("from-json", help="convert the nested layout to a record stream")
+    from_json_parser.add_argument("json_path")
+    from_json_parser.add_argument("records_path")
+    args = parser.parse_args()
+
+    if args.command == "to-json":
+        records_to_nested(args.records_path, args.json_path, args.indent, args.ascii)
+    else:
+        nested_to_records(args.json_path, args.records_path)
+    print("Conversion complete.")
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIRECTORY)
+sys.path.append(os.path.join(ROOT_DIRECTORY, "benchmarks"))
+for source_directory in ("google_scholar", "acm", "core"):
+    sys.path.append(os.path.join(ROOT_DIRECTORY, source_directory))
+import http_client
+import rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def isolated_state():
+    """
+    Start every test with no rate limits and without the HTTP cache of the working directory.
+    """
+    http_client.configure(use_cache=False)
+    with rate_limiter._buckets_lock:
+        rate_limiter._buckets.clear()
+    yield
+    http_client.configure(use_cache=True)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from crawl_journal import append_page, close_journal, finish_query, load_journal, open_journal, start_query
+from result_stream import records_to_nested
+
+QUERY = {"params": {"q": "robotic process automation"}, "max_items": 100}
+
+
+def write_journal(path, pages):
+    """
+    Write a journal of one query with the given pages of results and close it.
+    """
+    journal, _ = open_journal(str(path))
+    start_query(journal, 0, QUERY)
+    for page, results in enumerate(pages, start=1):
+        append_page(journal, 0, page, results, {"total_results_query": page})
+    return journal
+
+
+@pytest.mark.parametrize("partial_line", ['{"type": "result", "query_index": 0, "res',
+                                          '{"type": "page", "query_index": 0, "next_page": 3, "query_link_statis' * 200])
+def test_resume_after_an_incomplete_last_line(tmp_path, partial_line):
+    path = tmp_path / "journal.ndjson"
+    write_journal(path, [[{"title": "A"}], [{"title": "B"}]]).close()
+    # A crash while a page was written leaves its last line incomplete.
+    with open(path, "a", encoding="utf-8") as journal_file:
+        journal_file.write(partial_line)
+
+    journal, query_states = open_journal(str(path), resume=True)
+    assert query_states[0]["next_page"] == 2
+    append_page(journal, 0, 3, [{"title": "C"}], {"total_results_query": 3})
+    finish_query(journal, 0, QUERY, {"total_results_query": 3})
+    close_journal(journal)
+
+    query_states = load_journal(str(path))
+    assert [result["title"] for result in query_states[0]["results"]] == ["A", "B", "C"]
+    assert query_states[0]["finished"]
+    records_to_nested(str(path), str(tmp_path / "results.json"))
+    with open(tmp_path / "results.json", "r", encoding="utf-8") as json_file:
+        assert json.load(json_file)["total_results"] == 3
+
+
+def test_resume_removes_the_end_record(tmp_path):
+    path = tmp_path / "journal.ndjson"
+    close_journal(write_journal(path, [[{"title": "A"}]]))
+
+    journal, _ = open_journal(str(path), resume=True)
+    append_page(journal, 0, 2, [{"title": "B"}], {"total_results_query": 2})
+    journal.close()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["type"] for line in lines] == ["query", "result", "page", "result", "page"]
@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+import requests
+
+from core_crawler import CORE_ADAPTER
+from corpus_index import configure as configure_index
+import crawler_engine
+from crawl_journal import close_journal, load_journal, open_journal
+from crawler_engine import CONNECT_TIMEOUT_RETRIES, crawl, crawl_query
+from local_server import start_server
+from result_stream import iter_records
+
+
+@pytest.fixture
+def crawl_directory(tmp_path, monkeypatch):
+    """
+    Crawl in a temporary directory without the corpus index.
+    """
+    monkeypatch.chdir(tmp_path)
+    configure_index(use_index=False)
+    yield tmp_path
+    configure_index(use_index=True)
+
+
+def test_failed_crawl_closes_journal_and_waits_for_downloads(crawl_directory):
+    server, base_url = start_server({"/search?q=query&page=1": b"<html></html>"},
+                                    content_types={"/search?q=query&page=1": "text/html"})
+    with open("core_queries.json", "w") as queries_file:
+        json.dump([{"params": {"base": f"{base_url}/search", "q": "query", "page": 1}, "max_items": 10}],
+                  queries_file)
+
+    followed_records = []
+
+    def parse_page(html, page):
+        raise ValueError("unexpected markup")
+
+    def scrape_stream(follow=False, **kwargs):
+        followed_records.extend(iter_records(CORE_ADAPTER["journal_file"], follow=follow, poll_interval=0.05))
+
+    adapter = dict(CORE_ADAPTER, parse_page=parse_page, scrape_stream=scrape_stream, request_rate=100,
+                   max_request_rate=100)
+    try:
+        with pytest.raises(ValueError):
+            crawl(adapter, "core_queries.json", download=True)
+    finally:
+        server.shutdown()
+
+    # The download thread has followed the journal to its end before the crawl returned.
+    assert [record["type"] for record in followed_records] == ["query"]
+    with open(os.path.join(crawl_directory, CORE_ADAPTER["journal_file"]), "r", encoding="utf-8") as journal:
+        assert json.loads(journal.readlines()[-1]) == {"type": "end"}
+
+
+def test_query_stops_unfinished_after_repeated_connect_timeouts(tmp_path, monkeypatch):
+    requested_urls = []
+
+    def throttled_get(url, **kwargs):
+        requested_urls.append(url)
+        raise requests.exceptions.ConnectTimeout(f"Connection to {url} timed out")
+
+    monkeypatch.setattr(crawler_engine, "throttled_get", throttled_get)
+    journal_path = str(tmp_path / "core_journal.ndjson")
+    journal, _ = open_journal(journal_path)
+    query = {"params": {"base": "http://core.invalid/search", "q": "query", "page": 1}, "max_items": 10}
+    try:
+        query_data = crawl_query(CORE_ADAPTER, journal, 0, query)
+    finally:
+        close_journal(journal)
+
+    assert len(requested_urls) == CONNECT_TIMEOUT_RETRIES + 1
+    assert query_data["query_results"] == []
+    # Without a query_end record, the query is crawled again on resume.
+    assert not load_journal(journal_path)[0]["finished"]
@@ -0,0 +1,75 @@
+import time
+
+import requests
+
+from http_cache import evict, get_total_size, lookup, open_cache, remove, store_response
+
+
+def response_with_etag(etag):
+    """
+    Build a response with the given ETag, as the server would send it.
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["ETag"] = etag
+    response.headers["Content-Type"] = "text/html"
+    return response
+
+
+def summed_size(cache):
+    """
+    Sum up the sizes of the cache entries.
+    """
+    return cache["connection"].execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_total_size_follows_stores_replacements_and_removals(tmp_path):
+    cache = open_cache(str(tmp_path))
+    store_response(cache, "http://a.test/1", response_with_etag('"1"'), body=b"x" * 100)
+    store_response(cache, "http://a.test/2", response_with_etag('"2"'), body=b"x" * 30)
+    store_response(cache, "http://a.test/pdf", response_with_etag('"3"'), file_hash="ab" * 32, size=500)
+    assert get_total_size(cache) == summed_size(cache) == 630
+
+    store_response(cache, "http://a.test/1", response_with_etag('"4"'), body=b"x" * 10)
+    assert get_total_size(cache) == summed_size(cache) == 540
+
+    remove(cache, "http://a.test/2")
+    remove(cache, "http://a.test/unknown")
+    assert get_total_size(cache) == summed_size(cache) == 510
+
+
+def test_total_size_of_an_older_cache_is_summed_up_once(tmp_path):
+    cache = open_cache(str(tmp_path))
+    store_response(cache, "http://a.test/1", response_with_etag('"1"'), body=b"x" * 100)
+    cache["connection"].execute("DROP TABLE cache_size")
+    cache["connection"].commit()
+    cache["connection"].close()
+
+    cache = open_cache(str(tmp_path))
+    assert get_total_size(cache) == 100
+
+
+def test_pdf_entries_are_evicted_like_pages(tmp_path):
+    cache = open_cache(str(tmp_path), max_size=1000)
+    store_response(cache, "http://a.test/old.pdf", response_with_etag('"1"'), file_hash="ab" * 32, size=700)
+    time.sleep(0.01)
+    store_response(cache, "http://a.test/page", response_with_etag('"2"'), body=b"x" * 400)
+
+    assert lookup(cache, "http://a.test/old.pdf") is None
+    assert lookup(cache, "http://a.test/page") is not None
+    assert get_total_size(cache) == summed_size(cache) == 400
+
+
+def test_entries_without_size_are_evicted_in_order_of_use(tmp_path):
+    cache = open_cache(str(tmp_path), max_size=1000)
+    # An entry of a PDF stored before PDFs had a size.
+    store_response(cache, "http://a.test/legacy.pdf", response_with_etag('"1"'), file_hash="ab" * 32)
+    time.sleep(0.01)
+    store_response(cache, "http://a.test/page_1", response_with_etag('"2"'), body=b"x" * 600)
+    time.sleep(0.01)
+    store_response(cache, "http://a.test/page_2", response_with_etag('"3"'), body=b"x" * 600)
+
+    assert lookup(cache, "http://a.test/legacy.pdf") is None
+    assert lookup(cache, "http://a.test/page_1") is None
+    assert lookup(cache, "http://a.test/page_2") is not None
+    assert evict(cache) == 0
@@ -0,0 +1,43 @@
+import pytest
+
+import http_client
+from http_archive import RECORD
+from local_server import start_server
+
+
+@pytest.fixture
+def shared_state(tmp_path, monkeypatch):
+    """
+    Give the test its own settings and shared session, with the HTTP cache and archive in a temporary directory.
+    """
+    monkeypatch.setattr(http_client, "_settings", dict(http_client._settings))
+    monkeypatch.setattr(http_client, "_session", {"session": None, "cache": None, "archive": None})
+    http_client.configure(use_cache=True, cache_directory=str(tmp_path / "http_cache"), archive_mode=RECORD,
+                          archive_file=str(tmp_path / "http_archive.db"))
+
+
+def test_pool_is_resized_without_replacing_the_shared_state(shared_state):
+    session, cache, archive = http_client.get_session(), http_client.get_cache(), http_client.get_archive()
+    pool_size = http_client.POOL_SIZE + 5
+
+    http_client.ensure_pool_size(pool_size)
+
+    assert http_client.get_session() is session
+    assert http_client.get_cache() is cache
+    assert http_client.get_archive() is archive
+    for adapter in session.adapters.values():
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == pool_size
+    server, base_url = start_server({"/page": b"<html></html>"}, content_types={"/page": "text/html"})
+    try:
+        assert http_client.get(f"{base_url}/page").status_code == 200
+    finally:
+        server.shutdown()
+
+
+def test_pool_is_never_shrunk(shared_state):
+    http_client.ensure_pool_size(http_client.POOL_SIZE + 5)
+    http_client.ensure_pool_size(2)
+
+    session = http_client.get_session()
+    for adapter in session.adapters.values():
+        assert adapter.poolmanager.connection_pool_kw["maxsize"] == http_client.POOL_SIZE + 5
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from corpus_index import DUPLICATE, NOT_SAVED, SAVED, open_index, record_downloads, record_page, record_query
+from metadata_dedup import load_duplicates
+
+# A work found by Google Scholar twice and by CORE, in the order of preference of its PDF.
+RECORDS = [("google_scholar", 0, 0), ("google_scholar", 1, 3), ("core", 0, 5)]
+
+
+@pytest.fixture
+def duplicate_works_file(tmp_path):
+    """
+    Write a duplicate works file with one work whose first result is the primary one.
+    """
+    records = [{"source": source, "query_index": query_index, "result_index": result_index, "title": "A work",
+                "pdf_url": f"https://example.org/{source}/{query_index}/{result_index}.pdf"}
+               for source, query_index, result_index in RECORDS]
+    path = tmp_path / "duplicate_works.json"
+    path.write_text(json.dumps({"works": [{
+        "title": "A work", "dois": [],
+        "primary": {key: records[0][key] for key in ("source", "query_index", "result_index")},
+        "records": records,
+    }]}), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def index(tmp_path):
+    """
+    Open a corpus index in which the results of the work have been crawled but not scraped.
+    """
+    index = open_index(str(tmp_path / "corpus.db"))
+    for source, query_index, result_index in RECORDS:
+        record_query(index, source, query_index, {}, keep_results=True)
+        record_page(index, source, query_index, result_index, [{"title": "A work"}], {})
+    return index
+
+
+def reference(source, query_index, result_index):
+    """
+    Return the reference of a result, as the duplicates point to it.
+    """
+    return {"source": source, "query_index": query_index, "result_index": result_index}
+
+
+def set_status(index, tmp_path, source, query_index, result_index, status):
+    """
+    Record the download outcome of a result, with a file on disk if it was saved.
+    """
+    download = {"query_index": query_index, "result_index": result_index, "status": status}
+    if status == SAVED:
+        file_path = tmp_path / f"{source}_{query_index}_{result_index}.pdf"
+        file_path.write_bytes(b"%PDF-1.4")
+        download.update(file_path=str(file_path), file_hash="ab" * 32)
+    record_downloads(index, source, [download])
+
+
+def test_without_index_the_primary_result_is_used(duplicate_works_file):
+    assert load_duplicates("google_scholar", duplicate_works_file) == {(1, 3): reference("google_scholar", 0, 0)}
+    assert load_duplicates("core", duplicate_works_file) == {(0, 5): reference("google_scholar", 0, 0)}
+
+
+def test_primary_result_not_tried_yet_is_used(duplicate_works_file, index):
+    assert load_duplicates("core", duplicate_works_file, index) == {(0, 5): reference("google_scholar", 0, 0)}
+
+
+def test_failed_primary_result_falls_back_to_the_next_copy(duplicate_works_file, index, tmp_path):
+    set_status(index, tmp_path, "google_scholar", 0, 0, NOT_SAVED)
+    set_status(index, tmp_path, "google_scholar", 1, 3, DUPLICATE)
+
+    assert load_duplicates("google_scholar", duplicate_works_file, index) == {
+        (0, 0): reference("google_scholar", 1, 3)}
+    assert load_duplicates("core", duplicate_works_file, index) == {(0, 5): reference("google_scholar", 1, 3)}
+
+
+def test_saved_copy_is_kept_as_the_source_of_the_work(duplicate_works_file, index, tmp_path):
+    # After the fallback was saved, the failed primary result is marked as its duplicate.
+    set_status(index, tmp_path, "google_scholar", 0, 0, DUPLICATE)
+    set_status(index, tmp_path, "google_scholar", 1, 3, SAVED)
+
+    assert load_duplicates("google_scholar", duplicate_works_file, index) == {
+        (0, 0): reference("google_scholar", 1, 3)}
+
+
+def test_saved_file_that_is_missing_is_not_relied_on(duplicate_works_file, index, tmp_path):
+    set_status(index, tmp_path, "google_scholar", 0, 0, NOT_SAVED)
+    set_status(index, tmp_path, "google_scholar", 1, 3, SAVED)
+    (tmp_path / "google_scholar_1_3.pdf").unlink()
+    set_status(index, tmp_path, "core", 0, 5, SAVED)
+
+    assert load_duplicates("google_scholar", duplicate_works_file, index) == {
+        (0, 0): reference("core", 0, 5), (1, 3): reference("core", 0, 5)}
+
+
+def test_no_result_is_left_out_once_every_copy_failed(duplicate_works_file, index, tmp_path):
+    for source, query_index, result_index in RECORDS:
+        set_status(index, tmp_path, source, query_index, result_index, NOT_SAVED)
+
+    assert load_duplicates("google_scholar", duplicate_works_file, index) == {}
+    assert load_duplicates("core", duplicate_works_file, index) == {}
+
+
+def test_every_copy_is_tried_once_over_repeated_runs(duplicate_works_file, index, tmp_path):
+    # Each run scrapes every source in turn: its results that are left out are recorded as duplicates and the
+    # download of every other result fails.
+    tried = []
+    for _ in range(len(RECORDS)):
+        for source in ("google_scholar", "core"):
+            duplicates = load_duplicates(source, duplicate_works_file, index)
+            for record in RECORDS:
+                if record[0] != source:
+                    continue
+                if record[1:] in duplicates:
+                    set_status(index, tmp_path, *record, DUPLICATE)
+                else:
+                    tried.append(record)
+                    set_status(index, tmp_path, *record, NOT_SAVED)
+        if len(tried) == len(RECORDS):
+            break
+
+    assert tried == RECORDS
+    assert load_duplicates("google_scholar", duplicate_works_file, index) == {}
+    assert load_duplicates("core", duplicate_works_file, index) == {}
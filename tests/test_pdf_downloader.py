@@ -0,0 +1,118 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+import pdf_downloader
+from local_server import start_server, synthetic_pdf
+from pdf_downloader import (RETRY_MAX_DELAY_IN_S, backoff_delay, download_pdfs, load_dead_letters,
+                            save_dead_letters)
+
+MAX_FILE_SIZE = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    """
+    Retry failed downloads after a few milliseconds instead of seconds.
+    """
+    monkeypatch.setattr(pdf_downloader, "RETRY_BASE_DELAY_IN_S", 0.01)
+
+
+@pytest.fixture
+def server():
+    """
+    Serve two PDFs. The first request for /flaky.pdf fails with 500 and /broken.pdf always does.
+    """
+    server, base_url = start_server({"/ok.pdf": synthetic_pdf(2048, seed=1), "/flaky.pdf": synthetic_pdf(2048, seed=2),
+                                     "/broken.pdf": synthetic_pdf(2048, seed=3)},
+                                    failures={"/flaky.pdf": 1, "/broken.pdf": 100})
+    server.base_url = base_url
+    yield server
+    server.shutdown()
+
+
+def download(jobs, dead_letter_file, attempts=3, max_concurrency=1):
+    """
+    Download the jobs quietly and return the hash of each saved file.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return download_pdfs(jobs, {}, 5, MAX_FILE_SIZE, attempts=attempts, max_concurrency=max_concurrency,
+                             max_per_host=max_concurrency, dead_letter_file=str(dead_letter_file))
+
+
+def requests_for(server, count):
+    """
+    Return the status codes of the first count requests the server received.
+    """
+    return [status for _, status in server.request_log[:count]]
+
+
+def test_permanent_failure_becomes_dead_letter_after_one_attempt(server, tmp_path):
+    dead_letter_file = tmp_path / "dead_letters.json"
+    job = {"url": f"{server.base_url}/missing.pdf", "filepath": str(tmp_path / "missing.pdf"),
+           "query_index": 0, "result_index": 4}
+    assert download([job], dead_letter_file) == [None]
+
+    assert requests_for(server, 10) == [404]
+    assert load_dead_letters(str(dead_letter_file)) == [{
+        "url": job["url"], "filepath": job["filepath"], "query_index": 0, "result_index": 4,
+        "error": "status code 404", "retryable": False, "attempts": 1}]
+
+
+def test_temporary_failure_is_retried_and_saved(server, tmp_path):
+    dead_letter_file = tmp_path / "dead_letters.json"
+    filepath = tmp_path / "flaky.pdf"
+    file_hashes = download([{"url": f"{server.base_url}/flaky.pdf", "filepath": str(filepath)}], dead_letter_file)
+
+    assert file_hashes[0] is not None
+    assert filepath.read_bytes() == synthetic_pdf(2048, seed=2)
+    assert requests_for(server, 10) == [500, 200]
+    assert load_dead_letters(str(dead_letter_file)) == []
+
+
+def test_backoff_delay_honours_retry_after():
+    for retry in range(1, 12):
+        for _ in range(50):
+            assert backoff_delay(retry, retry_after=2.5) >= 2.5
+            assert 0 <= backoff_delay(retry) <= RETRY_MAX_DELAY_IN_S
+    assert backoff_delay(1, retry_after=120) == 120
+
+
+def test_dead_letters_are_ordered_by_job(server, tmp_path):
+    dead_letter_file = tmp_path / "dead_letters.json"
+    # The retried download finishes last, after the downloads that fail at once.
+    jobs = [{"url": f"{server.base_url}/broken.pdf", "filepath": str(tmp_path / "broken.pdf")},
+            {"url": f"{server.base_url}/missing_1.pdf", "filepath": str(tmp_path / "missing_1.pdf")},
+            {"url": f"{server.base_url}/ok.pdf", "filepath": str(tmp_path / "ok.pdf")},
+            {"url": f"{server.base_url}/missing_2.pdf", "filepath": str(tmp_path / "missing_2.pdf")}]
+    download(jobs, dead_letter_file, max_concurrency=4)
+
+    dead_letters = load_dead_letters(str(dead_letter_file))
+    assert [dead_letter["filepath"] for dead_letter in dead_letters] == [jobs[0]["filepath"], jobs[1]["filepath"],
+                                                                       jobs[3]["filepath"]]
+    assert dead_letters[0]["retryable"] and dead_letters[0]["attempts"] == 3
+
+
+def test_dead_letters_of_earlier_runs_are_kept_until_their_download_succeeds(server, tmp_path):
+    dead_letter_file = tmp_path / "dead_letters.json"
+    untried = {"url": f"{server.base_url}/untried.pdf", "filepath": str(tmp_path / "untried.pdf"),
+               "error": "timeout", "retryable": True, "attempts": 3}
+    recovered = {"url": f"{server.base_url}/ok.pdf", "filepath": str(tmp_path / "ok.pdf"),
+                 "error": "status code 503", "retryable": True, "attempts": 3}
+    save_dead_letters(str(dead_letter_file), [untried, recovered])
+
+    download([{"url": f"{server.base_url}/ok.pdf", "filepath": str(tmp_path / "ok.pdf")},
+              {"url": f"{server.base_url}/missing.pdf", "filepath": str(tmp_path / "missing.pdf")}],
+             dead_letter_file)
+
+    dead_letters = load_dead_letters(str(dead_letter_file))
+    assert [dead_letter["filepath"] for dead_letter in dead_letters] == [untried["filepath"],
+                                                                       str(tmp_path / "missing.pdf")]
+    with open(dead_letter_file, "r", encoding="utf-8") as json_file:
+        assert json.load(json_file)["total_dead_letters"] == 2
+
+    # A clean run keeps the dead letters it did not try again.
+    download([{"url": f"{server.base_url}/ok.pdf", "filepath": str(tmp_path / "ok_copy.pdf")}], dead_letter_file)
+    assert len(load_dead_letters(str(dead_letter_file))) == 2
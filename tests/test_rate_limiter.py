@@ -0,0 +1,121 @@
+import contextlib
+import io
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from local_server import start_server
+from rate_limiter import (BACKOFF_RATE, RECOVERED_RATE, _buckets, _buckets_lock, configure_host, parse_retry_after,
+                          record_success, record_throttled, throttled_get, wait_for_slot)
+
+
+def bucket(url):
+    """
+    Return a copy of the bucket of the host of a URL.
+    """
+    with _buckets_lock:
+        return dict(_buckets[url.split("/")[2]])
+
+
+@pytest.fixture
+def throttling_server():
+    """
+    Serve a page that may be fetched twice per second, with a Retry-After of half a second once exceeded.
+    """
+    server, base_url = start_server({"/page": b"<html></html>"}, max_rate=2, retry_after=0.5,
+                                    content_types={"/page": "text/html"})
+    yield server, f"{base_url}/page"
+    server.shutdown()
+
+
+def test_no_request_before_retry_after(throttling_server):
+    server, url = throttling_server
+    with contextlib.redirect_stdout(io.StringIO()):
+        responses = [throttled_get(url) for _ in range(6)]
+
+    assert all(response.status_code == 200 for response in responses)
+    statuses = [status for _, status in server.request_log]
+    assert 429 in statuses
+    for (request_time, status), (next_time, _) in zip(server.request_log, server.request_log[1:]):
+        if status == 429:
+            assert next_time - request_time >= 0.5
+
+
+def test_wait_for_slot_blocks_until_retry_after():
+    url = "http://blocked.test/page"
+    record_throttled(url, retry_after=0.3)
+    start = time.monotonic()
+    wait_for_slot(url)
+    assert time.monotonic() - start >= 0.3
+    assert bucket(url)["blocked_until"] <= time.monotonic()
+
+
+def test_rate_is_halved_once_per_throttling_episode():
+    url = "http://inflight.test/page"
+    configure_host(url, 20, 20)
+
+    # Responses of requests that were in flight together arrive at nearly the same time.
+    for _ in range(4):
+        record_throttled(url)
+    assert bucket(url)["rate"] == 10
+
+    # A throttled response after the lowered rate's interval starts a new episode.
+    time.sleep(1 / 10)
+    record_throttled(url)
+    assert bucket(url)["rate"] == 5
+
+
+def test_throttled_requests_in_flight_lower_the_rate_once(throttling_server):
+    server, url = throttling_server
+    configure_host(url, 8, 8)
+    with contextlib.redirect_stdout(io.StringIO()):
+        throttled_get(url, retries=0)
+        throttled_get(url, retries=0)
+    start = time.monotonic()
+    while time.monotonic() - start < 0.1:
+        # Throttled responses of requests sent before the rate was lowered.
+        record_throttled(url)
+    assert bucket(url)["rate"] == 4
+
+
+def test_success_recovers_to_max_rate():
+    url = "http://recovering.test/page"
+    configure_host(url, 2, 4)
+    record_throttled(url)
+    assert bucket(url)["rate"] == 1
+    for _ in range(100):
+        record_success(url)
+    assert bucket(url)["rate"] == 4
+
+
+def test_unconfigured_host_becomes_unlimited_again():
+    url = "http://unconfigured.test/page"
+    record_throttled(url)
+    assert bucket(url)["rate"] == BACKOFF_RATE
+
+    successes = 0
+    while bucket(url)["rate"] is not None:
+        assert bucket(url)["rate"] < RECOVERED_RATE
+        record_success(url)
+        successes += 1
+    assert successes > 1
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after("0.5") == 0.5
+    assert parse_retry_after("-3") == 0.0
+
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 28 <= parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_parse_retry_after_invalid():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+import result_stream
+from result_stream import append_records, nested_to_records, records_to_nested
+
+
+def nested_data(queries_count, results_count):
+    """
+    Build results in the nested layout, with non-ASCII titles.
+    """
+    queries_data = []
+    for query_index in range(queries_count):
+        results = [{"title": f"Résumé {query_index}.{i} – “quoted”", "page": i // 10, "doc_link": None}
+                   for i in range(results_count * (query_index % 2))]
+        queries_data.append({
+            "query_metadata": {"params": {"q": f"query {query_index}"}, "max_items": 100},
+            "query_link_statistics": {"total_results_query": len(results), "total_pdf_links_query": 0},
+            "query_results": results,
+        })
+    return {"total_queries": queries_count, "total_results": sum(len(q["query_results"]) for q in queries_data),
+            "total_pdf_links": 0, "queries_data": queries_data}
+
+
+@pytest.mark.parametrize("indent, ensure_ascii", [(2, False), (4, True)])
+def test_round_trip_matches_json_dump(tmp_path, indent, ensure_ascii):
+    data = nested_data(5, 12)
+    with open(tmp_path / "results.json", "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, indent=indent, ensure_ascii=ensure_ascii)
+    nested_to_records(str(tmp_path / "results.json"), str(tmp_path / "results.ndjson"))
+
+    records_to_nested(str(tmp_path / "results.ndjson"), str(tmp_path / "converted.json"), indent, ensure_ascii)
+    assert (tmp_path / "converted.json").read_text(encoding="utf-8") == \
+        json.dumps(data, indent=indent, ensure_ascii=ensure_ascii)
+
+
+def test_interleaved_queries_keep_their_results_together(tmp_path, monkeypatch):
+    # Copy a few bytes at a time, so that characters are split between chunks.
+    monkeypatch.setattr(result_stream, "COPY_CHUNK_SIZE", 5)
+    data = nested_data(4, 6)
+
+    # Crawling queries in parallel interleaves their records.
+    records = [{"type": "query", "query_index": query_index, "query_metadata": query["query_metadata"]}
+               for query_index, query in enumerate(data["queries_data"])]
+    for i in range(6):
+        for query_index, query in enumerate(data["queries_data"]):
+            if i < len(query["query_results"]):
+                records.append({"type": "result", "query_index": query_index, "result": query["query_results"][i]})
+    records += [{"type": "query_end", "query_index": query_index, "query_metadata": query["query_metadata"],
+                 "query_link_statistics": query["query_link_statistics"]}
+                for query_index, query in reversed(list(enumerate(data["queries_data"])))]
+    records.append({"type": "end"})
+    with open(tmp_path / "results.ndjson", "w", encoding="utf-8") as stream:
+        append_records(stream, records, sync=False)
+
+    records_to_nested(str(tmp_path / "results.ndjson"), str(tmp_path / "converted.json"))
+    assert (tmp_path / "converted.json").read_text(encoding="utf-8") == json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def test_empty_stream(tmp_path):
+    (tmp_path / "results.ndjson").write_text('{"type": "end"}\n', encoding="utf-8")
+    records_to_nested(str(tmp_path / "results.ndjson"), str(tmp_path / "converted.json"))
+    assert json.loads((tmp_path / "converted.json").read_text(encoding="utf-8")) == {
+        "total_queries": 0, "total_results": 0, "total_pdf_links": 0, "queries_data": []}
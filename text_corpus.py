@@ -0,0 +1,319 @@
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+# Memory limits of the workers need the resource module, which only exists on Unix.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from corpus_index import find_results, get_index
+from duplicate_checker import calculate_hash, collect_pdf_files, hash_files_cached
+from hash_cache import open_cache
+from metrics import enable, increment, start_metrics_server, timer, write_metrics
+from pdf_text import extract_text, extractor_name
+
+# Time a worker may spend on one PDF before it is stopped and replaced.
+EXTRACTION_TIMEOUT_IN_S = 60
+
+# Address space a worker may use, in MB. A PDF that needs more fails with a MemoryError instead of swapping.
+MAX_MEMORY_IN_MB = 1024
+
+# Compression level of the cached texts and the corpus. Higher levels take several times as long for a few
+# percent less space.
+COMPRESSION_LEVEL = 6
+
+# Outcome of the extraction of a file.
+EXTRACTED = "extracted"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+
+
+def cache_path(cache_directory, file_hash):
+    """
+    Return the path of the cached text of the PDF with the given SHA-256 hash, in the layout of the PDF store.
+    """
+    return os.path.join(cache_directory, file_hash[:2], f"{file_hash}.json.gz")
+
+
+def load_cached_text(cache_directory, file_hash):
+    """
+    Return the cached extraction of a PDF, or None if it was not extracted yet.
+    """
+    path = cache_path(cache_directory, file_hash)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as cache_file:
+        return json.load(cache_file)
+
+
+def store_cached_text(cache_directory, file_hash, extraction):
+    """
+    Write the extraction of a PDF to the cache. The file is written under a temporary name and then renamed, so
+    that a worker stopped while writing leaves no partial entry.
+    """
+    path = cache_path(cache_directory, file_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(temp_path, "wt", compresslevel=COMPRESSION_LEVEL, encoding="utf-8") as cache_file:
+        json.dump(extraction, cache_file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def extract_to_cache(filepath, file_hash, cache_directory):
+    """
+    Extract the text of a PDF and store it in the cache. Returns the extraction without its text.
+    """
+    start = time.perf_counter()
+    extraction = {"extractor": extractor_name(), "outcome": EXTRACTED, "error": None, "word_count": 0, "text": ""}
+    try:
+        text = extract_text(filepath, raise_errors=True)
+        extraction.update(word_count=len(text.split()), text=text)
+    except MemoryError:
+        extraction.update(outcome=FAILED, error="memory limit exceeded")
+    except Exception as e:
+        extraction.update(outcome=FAILED, error=str(e) or type(e).__name__)
+    extraction["seconds"] = round(time.perf_counter() - start, 3)
+    store_cached_text(cache_directory, file_hash, extraction)
+    del extraction["text"]
+    return extraction
+
+
+def _worker(connection, max_memory):
+    """
+    Extract the PDFs sent through the connection until None is sent, within the given address space in MB.
+    """
+    if resource is not None and max_memory:
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+        limit = max_memory * 1024 * 1024
+        if hard_limit != resource.RLIM_INFINITY:
+            limit = min(limit, hard_limit)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard_limit))
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        connection.send(extract_to_cache(*task))
+
+
+def _start_worker(context, max_memory):
+    """
+    Start a worker process and return it with the parent's end of its connection.
+    """
+    connection, worker_connection = context.Pipe()
+    process = context.Process(target=_worker, args=(worker_connection, max_memory), daemon=True)
+    process.start()
+    # Closing the worker's end here lets the parent notice when the worker dies.
+    worker_connection.close()
+    return {"process": process, "connection": connection, "task": None, "deadline": None}
+
+
+def _stop_worker(worker):
+    """
+    Kill a worker process and close its connection.
+    """
+    worker["process"].kill()
+    worker["process"].join()
+    worker["connection"].close()
+
+
+def extract_files(tasks, jobs=1, timeout=EXTRACTION_TIMEOUT_IN_S, max_memory=MAX_MEMORY_IN_MB):
+    """
+    Extract the text of PDFs into the cache in a pool of worker processes. Each task is a tuple of the file
+    path, its SHA-256 hash and the cache directory. Yields the hash and the extraction without its text of each
+    file as it finishes.
+    A worker that takes longer than the timeout on a file, or that dies, is replaced by a new one, and the file
+    is recorded as failed, so that a single PDF cannot hold up the others.
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return
+    context = multiprocessing.get_context()
+    workers = [_start_worker(context, max_memory) for _ in range(min(jobs, len(tasks)))]
+    next_task = 0
+
+    try:
+        while True:
+            # Hand out the next files to the idle workers.
+            for worker in workers:
+                if worker["task"] is None and next_task < len(tasks):
+                    worker["task"] = tasks[next_task]
+                    worker["deadline"] = time.monotonic() + timeout
+                    worker["connection"].send(worker["task"])
+                    next_task += 1
+            busy = [worker for worker in workers if worker["task"] is not None]
+            if not busy:
+                break
+
+            wait([worker["connection"] for worker in busy],
+                 timeout=max(0.0, min(worker["deadline"] for worker in busy) - time.monotonic()))
+
+            for position, worker in enumerate(workers):
+                if worker["task"] is None:
+                    continue
+                _, file_hash, cache_directory = worker["task"]
+                if worker["connection"].poll():
+                    try:
+                        extraction = worker["connection"].recv()
+                    except EOFError:
+                        worker["process"].join()
+                        extraction = {"outcome": FAILED,
+                                      "error": f"worker exited with code {worker['process'].exitcode}"}
+                elif time.monotonic() >= worker["deadline"]:
+                    extraction = {"outcome": TIMED_OUT, "error": f"no text after {timeout} s"}
+                else:
+                    continue
+
+                worker["task"] = None
+                if "extractor" not in extraction:
+                    # The worker is stuck or dead, so its file is cached as failed here and the worker replaced.
+                    extraction.update(extractor=extractor_name(), word_count=0, seconds=None)
+                    store_cached_text(cache_directory, file_hash, {**extraction, "text": ""})
+                    _stop_worker(worker)
+                    workers[position] = _start_worker(context, max_memory)
+                increment("text_extractions_total", outcome=extraction["outcome"])
+                yield file_hash, extraction
+    finally:
+        for worker in workers:
+            if worker["task"] is None and worker["process"].is_alive():
+                worker["connection"].send(None)
+                worker["process"].join(timeout=1)
+            if worker["process"].is_alive():
+                _stop_worker(worker)
+
+
+def find_linked_results(index, file_hash):
+    """
+    Return the query results whose PDF has the given hash, as recorded in the corpus index.
+    """
+    if index is None:
+        return []
+    return [{"source": result["source"], "query_index": result["query_index"],
+             "result_index": result["result_index"], "title": result["title"]}
+            for result in find_results(index, file_hash=file_hash)]
+
+
+def hash_pdf_files(directory, jobs=1, cache=None):
+    """
+    Hash every PDF below the directory and group the files by their SHA-256 hash, in the order they are found.
+    """
+    filepaths = []
+    stats = []
+    for _, pdf_files in collect_pdf_files(directory):
+        for _, filepath, stat in pdf_files:
+            filepaths.append(filepath)
+            stats.append(stat)
+    file_hashes = hash_files_cached(cache, "full_hash", calculate_hash, filepaths, stats,
+                                    [(filepath,) for filepath in filepaths], jobs, "Hashing")
+
+    files_by_hash = {}
+    for filepath, file_hash in zip(filepaths, file_hashes):
+        files_by_hash.setdefault(file_hash, []).append(filepath)
+    return files_by_hash
+
+
+def extract_missing(files_by_hash, cache_directory, jobs=1, timeout=EXTRACTION_TIMEOUT_IN_S,
+                    max_memory=MAX_MEMORY_IN_MB, retry_failed=False):
+    """
+    Extract the text of the files whose hash is not in the cache yet, or whose extraction failed or timed out
+    if retry_failed is set. Returns the number of files extracted.
+    """
+    tasks = []
+    for file_hash, hash_filepaths in files_by_hash.items():
+        if not os.path.exists(cache_path(cache_directory, file_hash)) or \
+                (retry_failed and load_cached_text(cache_directory, file_hash)["outcome"] != EXTRACTED):
+            tasks.append((hash_filepaths[0], file_hash, cache_directory))
+    increment("text_cache_hits_total", len(files_by_hash) - len(tasks))
+
+    with timer("text_extraction_seconds"):
+        for count, (file_hash, extraction) in enumerate(extract_files(tasks, jobs, timeout, max_memory), 1):
+            if extraction["outcome"] != EXTRACTED:
+                print(f"\nCould not extract the text of {files_by_hash[file_hash][0]}: {extraction['error']}")
+            if count % 10 == 0 or count == len(tasks):
+                print(f"\rText extraction: {count}/{len(tasks)} files", end="", flush=True)
+    if tasks:
+        print()
+    return len(tasks)
+
+
+def build_corpus(directory, output_file, cache_directory, jobs=1, timeout=EXTRACTION_TIMEOUT_IN_S,
+                 max_memory=MAX_MEMORY_IN_MB, cache=None, index=None, retry_failed=False):
+    """
+    Extract the text of every PDF below the directory and write it to a gzip-compressed JSON Lines file with
+    one record per distinct file content. Each record lists the files with that content and the query results
+    that link to it in the corpus index.
+    Texts are cached by SHA-256 hash, so that only new files are extracted. Files that failed or timed out are
+    cached as well and only extracted again with retry_failed.
+    Returns the number of files of each outcome.
+    """
+    files_by_hash = hash_pdf_files(directory, jobs, cache)
+    extracted_count = extract_missing(files_by_hash, cache_directory, jobs, timeout, max_memory, retry_failed)
+
+    # Write the corpus under a temporary name, so that an interrupted run keeps the previous corpus.
+    counts = {"files": sum(len(hash_filepaths) for hash_filepaths in files_by_hash.values()),
+              "texts": len(files_by_hash), "new": extracted_count, EXTRACTED: 0, FAILED: 0, TIMED_OUT: 0}
+    temp_file = f"{output_file}.tmp"
+    with timer("json_write_seconds", file=output_file):
+        with gzip.open(temp_file, "wt", compresslevel=COMPRESSION_LEVEL, encoding="utf-8") as corpus_file:
+            for file_hash, hash_filepaths in files_by_hash.items():
+                extraction = load_cached_text(cache_directory, file_hash)
+                counts[extraction["outcome"]] += 1
+                record = {
+                    "file_hash": file_hash,
+                    "files": [os.path.relpath(filepath, start=directory) for filepath in hash_filepaths],
+                    "results": find_linked_results(index, file_hash),
+                    "extractor": extraction["extractor"],
+                    "outcome": extraction["outcome"],
+                    "error": extraction["error"],
+                    "word_count": extraction["word_count"],
+                    "text": extraction["text"],
+                }
+                corpus_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(temp_file, output_file)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the text of the downloaded PDFs into a compressed "
+                                                 "corpus linked to the query results.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="number of PDFs extracted in parallel")
+    parser.add_argument("--timeout", type=float, default=EXTRACTION_TIMEOUT_IN_S,
+                        help="seconds a worker may spend on one PDF")
+    parser.add_argument("--max-memory", type=int, default=MAX_MEMORY_IN_MB,
+                        help="address space a worker may use in MB (Unix only, 0 for no limit)")
+    parser.add_argument("--output", default="text_corpus.jsonl.gz", help="path of the corpus file")
+    parser.add_argument("--text-cache", default="text_cache", help="directory of the cached texts")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="extract the files that failed or timed out in earlier runs again")
+    parser.add_argument("--cache", default="pdf_hashes.db", help="path of the hash cache")
+    parser.add_argument("--no-cache", action="store_true", help="hash every file without using the hash cache")
+    parser.add_argument("--no-index", action="store_true", help="do not link the texts to the corpus index")
+    parser.add_argument("--metrics", metavar="FILE", help="record timing and throughput metrics and write them to FILE")
+    parser.add_argument("--metrics-port", type=int,
+                        help="record metrics and serve them in the Prometheus text format on this port")
+    args = parser.parse_args()
+
+    # Record metrics if requested.
+    if args.metrics:
+        enable()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    # Directory containing the PDFs.
+    pdf_directory = "pdfs"
+
+    corpus_counts = build_corpus(pdf_directory, args.output, args.text_cache, args.jobs, args.timeout,
+                                 args.max_memory, None if args.no_cache else open_cache(args.cache),
+                                 None if args.no_index else get_index(), args.retry_failed)
+    print(f"{corpus_counts['texts']} texts of {corpus_counts['files']} files written to {args.output} "
+          f"({corpus_counts['new']} extracted in this run, {corpus_counts[FAILED]} failed, "
+          f"{corpus_counts[TIMED_OUT]} timed out).")
+
+    # Save the metrics.
+    if args.metrics:
+        write_metrics(args.metrics)